@@ -0,0 +1,112 @@
+"""
+Memory taken by cached programs: the array-backed Exercise of program_classes
+against the previous layout, a list of ExerciseSet objects with a __dict__ each.
+
+Run from the repository root:
+    python benchmarks/program_memory.py --programs 2000 --days 4 --exercises 6 --sets 4
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from program_classes import Program, DayProgram, Exercise
+from program_cache import estimate_program_size
+
+
+class LegacyExerciseSet:
+    def __init__(self, weight, rest, reps):
+        self.weight = weight
+        self.rest = rest
+        self.reps = reps
+
+class LegacyExercise:
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+        self.comment = None
+        self.extra_info = None
+        self.updated = None
+        self.sets = []
+
+class LegacyDayProgram:
+    def __init__(self, id, day_number, day_name):
+        self.id = id
+        self.day_number = day_number
+        self.day_name = day_name
+        self.exercises = []
+
+class LegacyProgram:
+    def __init__(self, id, program_name):
+        self.id = id
+        self.program_name = program_name
+        self.days = []
+
+
+def build_legacy(program_id, days, exercises, sets):
+    program = LegacyProgram(program_id, f"Program {program_id}")
+    for d in range(days):
+        day = LegacyDayProgram(d, d + 1, f"Day {d + 1}")
+        for e in range(exercises):
+            exercise = LegacyExercise(e, f"Exercise {e}")
+            for s in range(sets):
+                exercise.sets.append(LegacyExerciseSet(20.0 + 2.5 * s, 90, 10 - s))
+            day.exercises.append(exercise)
+        program.days.append(day)
+    return program
+
+def build_compact(program_id, days, exercises, sets):
+    program = Program()
+    program.set_id(program_id)
+    program.set_program_name(f"Program {program_id}")
+    new_days = []
+    for d in range(days):
+        day = DayProgram()
+        day.set_id(d)
+        day.set_day_number(d + 1)
+        day.set_day_name(f"Day {d + 1}")
+        for e in range(exercises):
+            exercise = Exercise()
+            exercise.set_id(e)
+            exercise.set_name(f"Exercise {e}")
+            for s in range(sets):
+                exercise.append_set(weight=20.0 + 2.5 * s, rest=90, reps=10 - s, set_id=s + 1)
+            day.add_exercise(exercise)
+        new_days.append(day)
+    program.set_days(new_days)
+    return program
+
+def measure(build, args):
+    gc.collect()
+    tracemalloc.start()
+    programs = [build(i, args.days, args.exercises, args.sets) for i in range(args.programs)]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return programs, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory of the cached programs, compact vs legacy layout")
+    parser.add_argument("--programs", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=4)
+    parser.add_argument("--exercises", type=int, default=6)
+    parser.add_argument("--sets", type=int, default=4)
+    args = parser.parse_args()
+
+    _, legacy_bytes = measure(build_legacy, args)
+    compact_programs, compact_bytes = measure(build_compact, args)
+
+    sets = args.programs * args.days * args.exercises * args.sets
+    print(f"{args.programs} programs, {sets} sets")
+    print(f"{'layout':<10} {'total MB':>10} {'per program':>12} {'per set':>8}")
+    for name, total in (("legacy", legacy_bytes), ("compact", compact_bytes)):
+        print(f"{name:<10} {total / 2**20:>10.2f} {total / args.programs:>12.0f} {total / sets:>8.1f}")
+    print(f"compact/legacy: {compact_bytes / legacy_bytes:.2f}")
+    print(f"estimate_program_size of one compact program: {estimate_program_size(compact_programs[0])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Routing micro-benchmark: the compiled Router against the previous dispatch,
+a handler looked up by state followed by text.split()[0] and a dict get.
+
+Run from the repository root:
+    python benchmarks/routing.py --number 200000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from state_machine import StateMachine, State, SubStateUpdateSet
+from telegram_bot.router import Router
+from telegram_bot.state_handlers.state_graph import StateGraph
+from telegram_bot.state_handlers.dead_state import DeadStateHandler
+from telegram_bot.state_handlers.login_state import LoginStateHandler
+from telegram_bot.state_handlers.authenticated_state import AuthenticatedStateHandler
+from telegram_bot.state_handlers.type_program_state import TypeProgramStateHandler
+from telegram_bot.state_handlers.type_day_state import TypeDayStateHandler
+from telegram_bot.state_handlers.ready_state import ReadyStateHandler
+from telegram_bot.state_handlers.started_state import StartedStateHandler
+from telegram_bot.state_handlers.end_state import EndStateHandler
+
+
+def build_handlers():
+    bot = SimpleNamespace(state_graph=StateGraph())
+    return {
+        State.DEAD: DeadStateHandler(bot),
+        State.LOGIN: LoginStateHandler(bot),
+        State.AUTHENTICATED: AuthenticatedStateHandler(bot),
+        State.TYPE_PROGRAM: TypeProgramStateHandler(bot),
+        State.TYPE_DAY: TypeDayStateHandler(bot),
+        State.READY: ReadyStateHandler(bot),
+        State.STARTED: StartedStateHandler(bot),
+        State.END: EndStateHandler(bot)
+    }
+
+def legacy_resolve(handlers, state_machine, text):
+    # What the handlers did before the routing table
+    handler = handlers.get(state_machine.get_state())
+    if state_machine.get_substate_update_set() != SubStateUpdateSet.NONE:
+        return handler.update_set
+    return handler.callbacks.get(text.split()[0], handler.default_handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Routing micro-benchmark")
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args()
+
+    handlers = build_handlers()
+    router = Router(handlers)
+    state_machine = StateMachine()
+    state_machine.state = State.STARTED
+
+    cases = {
+        "command": "/next_set",
+        "command with arguments": "/next_set " + "x " * 50,
+        "unknown text": "hello there, how are you",
+    }
+    print(f"{'case':<24} {'legacy ns':>10} {'router ns':>10}")
+    for name, text in cases.items():
+        legacy = timeit.timeit(lambda: legacy_resolve(handlers, state_machine, text), number=args.number)
+        compiled = timeit.timeit(lambda: router.resolve(state_machine, text), number=args.number)
+        print(f"{name:<24} {legacy / args.number * 1e9:>10.0f} {compiled / args.number * 1e9:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
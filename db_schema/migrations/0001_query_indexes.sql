@@ -0,0 +1,25 @@
+-- Secondary indexes for the queries run by the bot.
+
+-- Latest workout of a user (program loader, workout history).
+CREATE INDEX IF NOT EXISTS workout_user_time_idx
+    ON workout (user_id, workout_time DESC);
+
+-- Sets of a workout in execution order (program loader, set updates).
+CREATE INDEX IF NOT EXISTS workout_set_workout_sequence_idx
+    ON workout_set (workout_id, sequence_number);
+
+-- Workouts containing a given exercise (finding the latest workout of a program day).
+CREATE INDEX IF NOT EXISTS workout_set_exercise_workout_idx
+    ON workout_set (exercise_id, workout_id);
+
+-- Programs of a user.
+CREATE INDEX IF NOT EXISTS program_owner_idx
+    ON program (owner_id);
+
+-- Days of a program in order.
+CREATE INDEX IF NOT EXISTS program_day_program_number_idx
+    ON program_day (program_id, day_number);
+
+-- Exercises planned for a program day.
+CREATE INDEX IF NOT EXISTS program_day_exercise_day_idx
+    ON program_day_exercise (program_day_id, exercise_id);
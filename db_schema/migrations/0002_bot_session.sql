@@ -0,0 +1,6 @@
+-- Snapshots of the bot conversations, used when sessions are persisted in Postgres.
+CREATE TABLE IF NOT EXISTS bot_session (
+    chat_id BIGINT PRIMARY KEY,
+    data BYTEA NOT NULL,  -- binary snapshot written by Session.snapshot()
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,35 @@
+-- Aggregates of workout_set per user, exercise and day or week, read by the stats instead of the raw sets.
+-- The bot keeps them up to date when sets are logged or edited; `python src/main.py --rebuild-rollups`
+-- recomputes them from workout_set.
+CREATE TABLE IF NOT EXISTS exercise_rollup (
+    user_id INTEGER NOT NULL,
+    exercise_id INTEGER NOT NULL,
+    period VARCHAR(4) NOT NULL CHECK (period IN ('day', 'week')),
+    period_start DATE NOT NULL,  -- the day, or the Monday of the week
+    total_volume BIGINT NOT NULL,  -- sum of weight * reps
+    max_weight INTEGER NOT NULL,
+    max_e1rm REAL NOT NULL,  -- best estimated 1RM (Epley)
+    set_count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, exercise_id, period, period_start),
+    FOREIGN KEY (user_id) REFERENCES gym_user(id)
+        ON DELETE CASCADE ON UPDATE CASCADE,
+    FOREIGN KEY (exercise_id) REFERENCES exercise(id)
+        ON DELETE NO ACTION ON UPDATE NO ACTION
+);
+
+-- Stats of a user over time.
+CREATE INDEX IF NOT EXISTS exercise_rollup_user_period_idx
+    ON exercise_rollup (user_id, period, period_start);
+
+-- Existing history.
+INSERT INTO exercise_rollup (user_id, exercise_id, period, period_start,
+                             total_volume, max_weight, max_e1rm, set_count)
+SELECT w.user_id, ws.exercise_id, p.period, date_trunc(p.period, w.workout_time)::DATE,
+    SUM(ws.weight * ws.reps), MAX(ws.weight),
+    MAX(CASE WHEN ws.reps > 1 THEN ws.weight * (1 + ws.reps / 30.0) ELSE ws.weight END),
+    COUNT(*)
+FROM workout w
+JOIN workout_set ws ON ws.workout_id = w.id
+CROSS JOIN (VALUES ('day'), ('week')) AS p(period)
+GROUP BY 1, 2, 3, 4
+ON CONFLICT DO NOTHING;
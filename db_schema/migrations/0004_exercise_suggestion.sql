@@ -0,0 +1,19 @@
+-- Next session targets of every user and exercise, written by the suggestion batch job
+-- (`python src/main.py --compute-suggestions`) and read as they are by /suggestions.
+CREATE TABLE IF NOT EXISTS exercise_suggestion (
+    user_id INTEGER NOT NULL,
+    exercise_id INTEGER NOT NULL,
+    workout_id INTEGER NOT NULL,  -- the workout the suggestion is based on
+    weight REAL NOT NULL,
+    reps INTEGER NOT NULL,
+    rest INTEGER NOT NULL,
+    reason VARCHAR(16) NOT NULL,  -- 'weight', 'reps' or 'deload'
+    computed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, exercise_id),
+    FOREIGN KEY (user_id) REFERENCES gym_user(id)
+        ON DELETE CASCADE ON UPDATE CASCADE,
+    FOREIGN KEY (exercise_id) REFERENCES exercise(id)
+        ON DELETE CASCADE ON UPDATE CASCADE,
+    FOREIGN KEY (workout_id) REFERENCES workout(id)
+        ON DELETE CASCADE ON UPDATE CASCADE
+);
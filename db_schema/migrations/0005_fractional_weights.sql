@@ -0,0 +1,8 @@
+-- Weights with decimals (plates of 1.25 kg, "w+2.5" updates, suggestions in 2.5 kg steps)
+-- were rounded to whole numbers by the INTEGER columns.
+ALTER TABLE workout_set ALTER COLUMN weight TYPE NUMERIC(6,2);
+
+-- The rollups aggregate those weights.
+ALTER TABLE exercise_rollup
+    ALTER COLUMN total_volume TYPE NUMERIC(14,2),
+    ALTER COLUMN max_weight TYPE NUMERIC(6,2);
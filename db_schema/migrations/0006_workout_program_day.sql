@@ -0,0 +1,10 @@
+-- The program day a workout was started from. The program loader used the latest workout
+-- containing any exercise of a day as its template, so a workout of another day sharing
+-- an exercise replaced it. Workouts logged before this migration keep a NULL day.
+ALTER TABLE workout
+    ADD COLUMN program_day_id INTEGER REFERENCES program_day(id)
+        ON DELETE SET NULL ON UPDATE CASCADE;
+
+-- Workouts of a program day, latest first (program loader).
+CREATE INDEX IF NOT EXISTS workout_program_day_time_idx
+    ON workout (program_day_id, workout_time DESC);
@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# Part of the cache keys: to be bumped whenever the drawing changes
+CHART_VERSION = 1
+
+
+def chart_key(kind: str, series: dict) -> str:
+    """
+    Returns the cache key of a chart: a hash of everything it is drawn from
+    """
+    payload = json.dumps([CHART_VERSION, kind, series], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _render_chart(kind: str, series: dict) -> bytes:
+    # Runs in a worker process: matplotlib is only ever imported there
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    if kind != "progress":
+        raise ValueError(f"Unknown chart: {kind}")
+
+    weeks = series["weeks"]
+    figure, (volume_axes, progression_axes) = plt.subplots(2, 1, figsize=(8, 6), sharex=True)
+    volume_axes.bar(range(len(weeks)), series["tonnage"], color="tab:blue")
+    volume_axes.set_ylabel("Volume (kg)")
+    for name, values in series["progression"].items():
+        # Weeks without the exercise are None, drawn as gaps
+        progression_axes.plot(range(len(weeks)), [float("nan") if v is None else v for v in values],
+                              marker="o", label=name)
+    progression_axes.set_ylabel("Est. 1RM (kg)")
+    progression_axes.set_xticks(range(len(weeks)))
+    progression_axes.set_xticklabels(weeks, rotation=45, ha="right")
+    if series["progression"]:
+        progression_axes.legend(fontsize="small")
+    figure.tight_layout()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png", dpi=100)
+    plt.close(figure)
+    return buffer.getvalue()
+
+
+class Chart:
+    """
+    A rendered chart: the PNG, or the file_id of a copy already uploaded to Telegram
+    """
+    __slots__ = ("key", "data", "file_id")
+
+    def __init__(self, key: str, data: bytes|None = None, file_id: str|None = None):
+        self.key = key
+        self.data = data
+        self.file_id = file_id
+
+    def get_photo(self):
+        return self.file_id if self.file_id is not None else self.data
+
+
+class ChartRenderer:
+    """
+    Draws the charts of the stats with matplotlib on a dedicated process pool,
+    so the event loop never waits for a figure.
+
+    PNGs are stored in cache_dir under the hash of their input series: a chart
+    drawn from the same data is read back from disk, or not even read when the
+    file_id Telegram gave to its upload is still known. The pool is started by the
+    first chart actually drawn.
+    """
+    def __init__(self, cache_dir: str, workers: int = 1, max_files: int = 2048, max_file_ids: int = 4096):
+        self.cache_dir = cache_dir
+        self.workers = int(workers)
+        self.max_files = int(max_files)
+        self.max_file_ids = int(max_file_ids)
+
+        if self.workers < 1:
+            raise ValueError("At least one chart worker is needed")
+
+        # matplotlib is optional: without it /stats is only text
+        self.available = importlib.util.find_spec("matplotlib") is not None
+        self.executor = None
+        if self.available:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.file_ids = OrderedDict()  # key : Telegram file_id, least recently used first
+        self.rendering = {}            # key : future of a render in progress
+
+        self.file_id_hits = 0
+        self.disk_hits = 0
+        self.renders = 0
+        self.failures = 0
+
+    async def get_chart(self, kind: str, series: dict) -> Chart|None:
+        """
+        Returns the chart drawn from series, or None if it can't be drawn
+        """
+        if not self.available:
+            return None
+
+        key = chart_key(kind, series)
+        file_id = self.file_ids.get(key)
+        if file_id is not None:
+            self.file_ids.move_to_end(key)
+            self.file_id_hits += 1
+            return Chart(key, file_id=file_id)
+
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, self.__read, key)
+        if data is not None:
+            self.disk_hits += 1
+            return Chart(key, data=data)
+
+        # The same chart asked by several chats at once is drawn once
+        future = self.rendering.get(key)
+        if future is None:
+            future = self.rendering[key] = asyncio.ensure_future(self.__render(key, kind, series))
+            future.add_done_callback(lambda _: self.rendering.pop(key, None))
+        data = await asyncio.shield(future)
+        return Chart(key, data=data) if data is not None else None
+
+    def remember_file_id(self, chart: Chart, file_id: str) -> None:
+        """
+        Records the file_id of an uploaded chart, sent instead of the PNG from now on
+        """
+        self.file_ids[chart.key] = file_id
+        self.file_ids.move_to_end(chart.key)
+        while len(self.file_ids) > self.max_file_ids:
+            self.file_ids.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        return {
+            "available": self.available,
+            "file_id_hits": self.file_id_hits,
+            "disk_hits": self.disk_hits,
+            "renders": self.renders,
+            "failures": self.failures,
+            "file_ids": len(self.file_ids)
+        }
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def __render(self, key: str, kind: str, series: dict) -> bytes|None:
+        loop = asyncio.get_running_loop()
+        try:
+            data = await loop.run_in_executor(self.__executor(), _render_chart, kind, series)
+        except Exception as e:
+            self.failures += 1
+            print(f"Error while drawing the {kind} chart: {e}")
+            return None
+        self.renders += 1
+        await loop.run_in_executor(None, self.__write, key, data)
+        return data
+
+    def __executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # Spawned workers don't inherit the connection pool threads of the parent
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def __read(self, key: str) -> bytes|None:
+        try:
+            with open(self.__path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def __write(self, key: str, data: bytes) -> None:
+        try:
+            # Written aside and renamed, so a reader never sees half a file
+            temporary_path = self.__path(key) + ".tmp"
+            with open(temporary_path, "wb") as f:
+                f.write(data)
+            os.replace(temporary_path, self.__path(key))
+            self.__prune()
+        except OSError as e:
+            print(f"Error while caching a chart: {e}")
+
+    def __prune(self) -> None:
+        entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".png")]
+        if len(entries) <= self.max_files:
+            return
+        # The oldest charts go first
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_files]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,101 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from psycopg2 import pool
+
+
+class PoolTimeoutError(Exception):
+    """
+    Raised when no connection gets free within the acquire timeout
+    """
+
+
+class AsyncConnectionPool:
+    """
+    Bounded pool of psycopg2 connections usable from asyncio code.
+    Every operation gets its own connection and cursor, and the blocking
+    driver calls run on a dedicated thread pool instead of the event loop.
+    """
+    def __init__(self, min_size: int, max_size: int, acquire_timeout: float, **connect_kwargs):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size (min={min_size}, max={max_size})")
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+
+        self.pool = pool.ThreadedConnectionPool(min_size, max_size, **connect_kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=max_size, thread_name_prefix="db")
+        self.slots = asyncio.Semaphore(max_size)
+
+    async def run(self, operation, *args):
+        """
+        Runs operation(cursor, *args) in a transaction on a pooled connection.
+        The transaction is committed if the operation returns and rolled back if it raises.
+        """
+        try:
+            await asyncio.wait_for(self.slots.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeoutError(f"No database connection available after {self.acquire_timeout}s")
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, self.__run_in_transaction, operation, args)
+        # The slot is given back only when the connection really is, even if the caller is cancelled
+        future.add_done_callback(lambda _: self.slots.release())
+        return await asyncio.shield(future)
+
+    async def fetchone(self, query, params=None):
+        return await self.run(_fetchone, query, params)
+
+    async def fetchall(self, query, params=None):
+        return await self.run(_fetchall, query, params)
+
+    async def execute(self, query, params=None) -> int:
+        """
+        Executes a statement and commits it. Returns the number of affected rows.
+        """
+        return await self.run(_execute, query, params)
+
+    def __run_in_transaction(self, operation, args):
+        conn = self.pool.getconn()
+        broken = False
+        try:
+            with conn.cursor() as cursor:
+                result = operation(cursor, *args)
+            conn.commit()
+            return result
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn, close=broken or conn.closed != 0)
+
+    def getconn(self):
+        """
+        Borrows a connection synchronously, for use before the event loop starts
+        """
+        return self.pool.getconn()
+
+    def putconn(self, conn):
+        self.pool.putconn(conn)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.pool.closeall()
+
+
+def _fetchone(cursor, query, params):
+    cursor.execute(query, params)
+    return cursor.fetchone()
+
+def _fetchall(cursor, query, params):
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+def _execute(cursor, query, params):
+    cursor.execute(query, params)
+    return cursor.rowcount
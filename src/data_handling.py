@@ -1,11 +1,126 @@
-import pandas as pd
-import numpy as np
+import datetime
+
+# pandas and numpy take most of the import time of the bot and are only needed
+# for the stats: they are imported by load_analytics(), on the first use
+pd = None
+np = None
+
+def load_analytics():
+    """
+    Imports the analytics dependencies, once
+    """
+    global pd, np
+    if pd is None:
+        import pandas
+        import numpy
+        pd, np = pandas, numpy
+
+
+class UserStats:
+    """
+    Training statistics of a user, aggregated from the weekly rollups
+    """
+    __slots__ = ("exercises", "weeks", "progression", "training_days", "exercise_names")
+
+    def __init__(self):
+        self.exercises = None      # DataFrame by exercise_id: volume, sets, best_e1rm, best_weight
+        self.weeks = None          # DataFrame by week (epoch of its Monday): tonnage, sets, days
+        self.progression = None    # DataFrame week x exercise_id: best estimated 1RM, NaN if not trained
+        self.training_days = 0
+        self.exercise_names = {}
+
 
 class DataHandler:
     """
     Class for taking datas queried from DB and show stats,
     plots and other things.
+
+    The stats are computed from the exercise_rollup table, kept up to date by the
+    database when sets are logged or edited: one row per exercise and week, so a
+    /stats costs O(weeks) whatever the number of sets. Per exercise volume, best
+    estimated 1RM (Epley) and heaviest weight; per week tonnage and training days.
     """
-    # TODO: Implement data handling class
-    def __init__(self) -> None:
-        pass
+    def __init__(self, database) -> None:
+        load_analytics()
+        self.database = database
+
+        self.refreshes = 0
+
+    async def get_user_stats(self, user_id: int) -> UserStats|None:
+        rollups = await self.database.get_rollup_stats(user_id=user_id)
+        if rollups is None:
+            return None
+        self.refreshes += 1
+        return self.__aggregate(rollups)
+
+    def format_stats(self, stats: UserStats, weeks: int = 8) -> str:
+        if stats.exercises is None:
+            return "No workouts logged yet."
+
+        lines = [f"Training days: {stats.training_days}", "", "Per exercise:"]
+        exercises = stats.exercises.sort_values("volume", ascending=False)
+        for exercise_id, row in exercises.iterrows():
+            name = stats.exercise_names.get(exercise_id, f"#{exercise_id}")
+            lines.append(f"  {name}: {row.volume:,.0f} kg in {int(row.sets)} sets, "
+                         f"est. 1RM {row.best_e1rm:.1f} kg (heaviest {row.best_weight:g} kg)")
+
+        lines += ["", f"Last {weeks} weeks:"]
+        for week, row in stats.weeks.sort_index().tail(weeks).iterrows():
+            monday = datetime.datetime.fromtimestamp(int(week), tz=datetime.timezone.utc).date()
+            lines.append(f"  {monday}: {row.tonnage:,.0f} kg, {int(row.days)} training day(s)")
+        return "\n".join(lines)
+
+    def get_chart_series(self, stats: UserStats, weeks: int = 8, exercises: int = 3) -> dict|None:
+        """
+        Returns the input of the progress chart, plain lists to be hashed and sent to a worker:
+        the tonnage of the last weeks and the estimated 1RM of the exercises with the most volume
+        """
+        if stats.exercises is None:
+            return None
+
+        last_weeks = stats.weeks.sort_index().tail(weeks)
+        top = stats.exercises.sort_values("volume", ascending=False).head(exercises).index
+        progression = stats.progression.reindex(index=last_weeks.index, columns=top)
+        return {
+            "weeks": [str(datetime.datetime.fromtimestamp(int(week), tz=datetime.timezone.utc).date())
+                      for week in last_weeks.index],
+            "tonnage": [round(float(value), 1) for value in last_weeks["tonnage"]],
+            "progression": {
+                stats.exercise_names.get(exercise_id, f"#{exercise_id}"):
+                    [None if np.isnan(value) else round(float(value), 1) for value in progression[exercise_id]]
+                for exercise_id in top
+            }
+        }
+
+    def get_stats(self) -> dict:
+        return {
+            "refreshes": self.refreshes
+        }
+
+    def __aggregate(self, rollups: dict) -> UserStats:
+        stats = UserStats()
+        stats.exercise_names = rollups["exercise_names"]
+        if len(rollups["week"]) == 0:
+            return stats
+
+        batch = pd.DataFrame({
+            "exercise_id": np.asarray(rollups["exercise_id"], dtype=np.int64),
+            "week": np.asarray(rollups["week"], dtype=np.int64),
+            "volume": np.asarray(rollups["total_volume"], dtype=np.float64),
+            "max_weight": np.asarray(rollups["max_weight"], dtype=np.float64),
+            "max_e1rm": np.asarray(rollups["max_e1rm"], dtype=np.float64),
+            "sets": np.asarray(rollups["set_count"], dtype=np.int64)
+        })
+
+        stats.exercises = batch.groupby("exercise_id").agg(
+            volume=("volume", "sum"), sets=("sets", "sum"),
+            best_e1rm=("max_e1rm", "max"), best_weight=("max_weight", "max"))
+        stats.weeks = batch.groupby("week").agg(tonnage=("volume", "sum"), sets=("sets", "sum"))
+        stats.progression = batch.pivot(index="week", columns="exercise_id", values="max_e1rm")
+
+        # Training days are counted in the week of their Monday (days since the epoch, a Thursday)
+        days = np.asarray(rollups["training_days"], dtype=np.int64)
+        stats.training_days = len(days)
+        mondays = days - ((days // 86400 + 3) % 7) * 86400
+        stats.weeks["days"] = pd.Series(mondays).value_counts().reindex(stats.weeks.index, fill_value=0)
+        return stats
@@ -1,18 +1,183 @@
-import psycopg2
-import pandas as pd
-import bcrypt
+from psycopg2 import DatabaseError
+from psycopg2.extras import execute_values
 
 from typing import List, Tuple
 
-from program_classes import ExerciseSet, Exercise, DayProgram, Program
-
-from pandas.errors import DatabaseError
+from program_classes import Exercise, DayProgram, Program, MAX_SHORT
+from connection_pool import AsyncConnectionPool
+from password_hasher import PasswordHasher
+from program_cache import ProgramCache
+from migrations import MigrationRunner
+
+# One row per set of every exercise planned for a day of the program. The n-th set of an
+# exercise is the n-th one performed in the latest workout of the day reaching it, so sets
+# skipped by a partial workout keep their previous values. Workouts logged without a day
+# count for every day planning the exercise.
+# Days and exercises never trained still produce a row, with NULL exercise and set columns.
+SELECTED_PROGRAM_QUERY = """
+    WITH days AS (
+        SELECT pd.id, pd.day_number, pd.name
+        FROM program p
+        JOIN program_day pd ON pd.program_id = p.id
+        WHERE p.id = %(program_id)s AND p.owner_id = %(user_id)s
+    ),
+    planned AS (
+        SELECT DISTINCT ON (pde.program_day_id, pde.exercise_id)
+            pde.id, pde.program_day_id, pde.exercise_id
+        FROM days d
+        JOIN program_day_exercise pde ON pde.program_day_id = d.id
+        ORDER BY pde.program_day_id, pde.exercise_id, pde.id
+    ),
+    performed AS (
+        SELECT pl.program_day_id, ws.exercise_id, ws.id, ws.weight, ws.reps, ws.rest,
+            w.id AS workout_id, w.workout_time,
+            ROW_NUMBER() OVER (PARTITION BY pl.program_day_id, w.id, ws.exercise_id
+                               ORDER BY ws.sequence_number) AS set_number
+        FROM planned pl
+        JOIN workout_set ws ON ws.exercise_id = pl.exercise_id
+        JOIN workout w ON w.id = ws.workout_id
+        WHERE w.user_id = %(user_id)s
+            AND (w.program_day_id = pl.program_day_id OR w.program_day_id IS NULL)
+    ),
+    latest_sets AS (
+        SELECT DISTINCT ON (program_day_id, exercise_id, set_number) *
+        FROM performed
+        ORDER BY program_day_id, exercise_id, set_number, workout_time DESC, workout_id DESC
+    )
+    SELECT p.name, d.id, d.day_number, d.name,
+        e.id, e.name, e.comment, e.extra_info,
+        ls.weight, ls.reps, ls.rest, ls.set_number, ls.id
+    FROM program p
+    LEFT JOIN days d ON TRUE
+    LEFT JOIN planned pl ON pl.program_day_id = d.id
+    LEFT JOIN latest_sets ls ON ls.program_day_id = d.id AND ls.exercise_id = pl.exercise_id
+    LEFT JOIN exercise e ON e.id = ls.exercise_id
+    WHERE p.id = %(program_id)s AND p.owner_id = %(user_id)s
+    ORDER BY d.day_number, d.id, pl.id, ls.set_number;
+"""
+
+# Aggregates per user, exercise and day/week (see 0003_exercise_rollups.sql) of the
+# sets matching {condition}, a condition on w (workout) and ws (workout_set)
+ROLLUP_AGGREGATE = """
+    INSERT INTO exercise_rollup AS r (user_id, exercise_id, period, period_start,
+                                      total_volume, max_weight, max_e1rm, set_count)
+    SELECT w.user_id, ws.exercise_id, p.period, date_trunc(p.period, w.workout_time)::DATE,
+        SUM(ws.weight * ws.reps), MAX(ws.weight),
+        MAX(CASE WHEN ws.reps > 1 THEN ws.weight * (1 + ws.reps / 30.0) ELSE ws.weight END),
+        COUNT(*)
+    FROM workout w
+    JOIN workout_set ws ON ws.workout_id = w.id
+    CROSS JOIN (VALUES ('day'), ('week')) AS p(period)
+    WHERE {condition}
+    GROUP BY 1, 2, 3, 4
+"""
+
+# New sets are added to the rollups of their periods
+ROLLUP_ADD_SETS = ROLLUP_AGGREGATE.format(condition="ws.id = ANY(%(set_ids)s)") + """
+    ON CONFLICT (user_id, exercise_id, period, period_start) DO UPDATE SET
+        total_volume = r.total_volume + EXCLUDED.total_volume,
+        max_weight = GREATEST(r.max_weight, EXCLUDED.max_weight),
+        max_e1rm = GREATEST(r.max_e1rm, EXCLUDED.max_e1rm),
+        set_count = r.set_count + EXCLUDED.set_count;
+"""
+
+# A maximum can't be taken back, so after an edit the weeks of the edited sets
+# are aggregated again (with their days), for the one exercise
+ROLLUP_REFRESH_WEEKS = ROLLUP_AGGREGATE.format(condition="""
+        w.user_id = %(user_id)s AND ws.exercise_id = %(exercise_id)s
+        AND date_trunc('week', w.workout_time) IN (
+            SELECT date_trunc('week', t) FROM unnest(%(workout_times)s::TIMESTAMP[]) AS t)""") + """
+    ON CONFLICT (user_id, exercise_id, period, period_start) DO UPDATE SET
+        total_volume = EXCLUDED.total_volume,
+        max_weight = EXCLUDED.max_weight,
+        max_e1rm = EXCLUDED.max_e1rm,
+        set_count = EXCLUDED.set_count;
+"""
+
+ROLLUP_REBUILD = "TRUNCATE exercise_rollup;" + ROLLUP_AGGREGATE.format(condition="TRUE") + ";"
+
+# Batch update of sets by primary key, from a VALUES list of (id, weight, reps, rest) where
+# NULL leaves a column unchanged. Only the sets of the user's workouts can match.
+# The VALUES placeholder is %%s: the user is bound first, then the rows by execute_values.
+UPDATE_SETS = """
+    UPDATE workout_set ws
+    SET weight = COALESCE(v.weight, ws.weight),
+        reps = COALESCE(v.reps, ws.reps),
+        rest = COALESCE(v.rest, ws.rest)
+    FROM (VALUES %%s) AS v(id, weight, reps, rest), workout w
+    WHERE ws.id = v.id AND w.id = ws.workout_id AND w.user_id = %(user_id)s
+    RETURNING ws.id, ws.weight, ws.reps, ws.rest, ws.exercise_id, w.workout_time;
+"""
+UPDATE_SETS_TEMPLATE = "(%s::INTEGER, %s::NUMERIC(6,2), %s::INTEGER, %s::INTEGER)"
+
+# Fields of workout_set that can be edited, in the order of the UPDATE_SETS values
+EDITABLE_FIELDS = ("weight", "reps", "rest")
+
+# Ids of the sets of a workout, by sequence number, locked until they are updated
+WORKOUT_SET_IDS_QUERY = """
+    SELECT sequence_number, id
+    FROM workout_set
+    WHERE workout_id = %(workout_id)s AND sequence_number = ANY(%(sequences)s)
+    FOR UPDATE;
+"""
+
+# The weekly rollups of a user, one array per column, the days they trained
+# and the names of their exercises. Weeks are the epoch of their Monday.
+ROLLUP_STATS_QUERY = """
+    WITH weeks AS (
+        SELECT exercise_id, EXTRACT(EPOCH FROM period_start)::BIGINT AS week,
+            total_volume, max_weight, max_e1rm, set_count
+        FROM exercise_rollup
+        WHERE user_id = %(user_id)s AND period = 'week'
+    )
+    SELECT
+        (SELECT array_agg(exercise_id ORDER BY week) FROM weeks),
+        (SELECT array_agg(week ORDER BY week) FROM weeks),
+        (SELECT array_agg(total_volume ORDER BY week) FROM weeks),
+        (SELECT array_agg(max_weight ORDER BY week) FROM weeks),
+        (SELECT array_agg(max_e1rm ORDER BY week) FROM weeks),
+        (SELECT array_agg(set_count ORDER BY week) FROM weeks),
+        (SELECT array_agg(DISTINCT EXTRACT(EPOCH FROM period_start)::BIGINT) FROM exercise_rollup
+         WHERE user_id = %(user_id)s AND period = 'day'),
+        (SELECT json_object_agg(e.id, e.name) FROM exercise e
+         WHERE e.id IN (SELECT exercise_id FROM weeks));
+"""
+
+# The sets of the latest workout of every user and exercise, one array per column, in
+# (user, exercise, sequence) order. Unless full, only those the stored suggestion is not based on.
+LATEST_SETS_QUERY = """
+    WITH latest AS (
+        SELECT DISTINCT ON (w.user_id, ws.exercise_id) w.user_id, ws.exercise_id, w.id AS workout_id
+        FROM workout w
+        JOIN workout_set ws ON ws.workout_id = w.id
+        WHERE %(user_id)s::INTEGER IS NULL OR w.user_id = %(user_id)s
+        ORDER BY w.user_id, ws.exercise_id, w.workout_time DESC, w.id DESC
+    ),
+    latest_sets AS (
+        SELECT l.user_id, l.exercise_id, l.workout_id, ws.weight, ws.reps, ws.rest, ws.sequence_number
+        FROM latest l
+        JOIN workout_set ws ON ws.workout_id = l.workout_id AND ws.exercise_id = l.exercise_id
+        LEFT JOIN exercise_suggestion s ON s.user_id = l.user_id AND s.exercise_id = l.exercise_id
+        WHERE %(full)s OR s.workout_id IS DISTINCT FROM l.workout_id
+    )
+    SELECT
+        array_agg(user_id ORDER BY user_id, exercise_id, sequence_number),
+        array_agg(exercise_id ORDER BY user_id, exercise_id, sequence_number),
+        array_agg(workout_id ORDER BY user_id, exercise_id, sequence_number),
+        array_agg(weight ORDER BY user_id, exercise_id, sequence_number),
+        array_agg(reps ORDER BY user_id, exercise_id, sequence_number),
+        array_agg(rest ORDER BY user_id, exercise_id, sequence_number)
+    FROM latest_sets;
+"""
 
 class Database:
     """
     Class for interacting with the database
     """
-    def __init__(self, db_host, db_password, db_user, db_name, db_port):
+    def __init__(self, db_host, db_password, db_user, db_name, db_port,
+                 pool_min_size=1, pool_max_size=10, acquire_timeout=10.0,
+                 hash_workers=2, hash_rounds=12,
+                 cache_max_entries=1024, cache_max_bytes=64 * 1024 * 1024, cache_ttl=3600.0):
         """
         Initialization of the database
         """
@@ -22,8 +187,13 @@ class Database:
         self.db_name = db_name
         self.db_port = db_port
 
-        self.conn = None
-        self.cursor = None
+        self.pool_min_size = int(pool_min_size)
+        self.pool_max_size = int(pool_max_size)
+        self.acquire_timeout = float(acquire_timeout)
+
+        self.pool = None
+        self.password_hasher = PasswordHasher(workers=hash_workers, rounds=hash_rounds)
+        self.program_cache = ProgramCache(max_entries=cache_max_entries, max_bytes=cache_max_bytes, ttl=cache_ttl)
 
         if self.db_host is None or self.db_password is None or self.db_user is None or self.db_name is None or self.db_port is None:
             raise ValueError("Error with the DB connection parameters")
@@ -32,9 +202,12 @@ class Database:
 
     def connect_to_db(self):
         """
-        Function to connect to the DB and make it ready to receive queries
+        Function to open the connection pool and make it ready to receive queries
         """
-        self.conn = psycopg2.connect(
+        self.pool = AsyncConnectionPool(
+            min_size=self.pool_min_size,
+            max_size=self.pool_max_size,
+            acquire_timeout=self.acquire_timeout,
             host=self.db_host,
             database=self.db_name,
             user=self.db_user,
@@ -42,34 +215,61 @@ class Database:
             port=self.db_port
         )
 
-        if self.conn is None:
-            raise DatabaseError("self.conn is None. Error with the DB")
-        
-        self.cursor = self.conn.cursor()
-        self.cursor.execute("SELECT version();")
-        db_version = self.cursor.fetchone()
-        print(f"Connected to database: {self.db_name} on {self.db_host} with version: {db_version[0]}")
-        self.conn.commit()
+        conn = self.pool.getconn()
+        if conn is None:
+            raise DatabaseError("Pool returned no connection. Error with the DB")
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT version();")
+                db_version = cursor.fetchone()
+            conn.commit()
+        finally:
+            self.pool.putconn(conn)
+        print(f"Connected to database: {self.db_name} on {self.db_host} with version: {db_version[0]} "
+              f"(pool {self.pool_min_size}-{self.pool_max_size})")
+
+    def close(self):
+        """
+        Closes every pooled connection and the hashing workers
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        self.password_hasher.close()
+
+    async def apply_migrations(self) -> list:
+        """
+        Applies the pending schema migrations in a single transaction.
+        Errors are not swallowed: the schema must be up to date before serving.
+        """
+        applied = await self.pool.run(MigrationRunner().apply)
+        if len(applied) == 0:
+            print("Database schema is up to date")
+        return applied
+
+    async def get_pending_migrations(self) -> list:
+        """
+        Returns the schema migrations not applied to the database yet
+        """
+        return await self.pool.run(MigrationRunner().pending)
 
-    def execute_query(self, query, params=None):
+    async def execute_query(self, query, params=None):
         try:
-            if params:
-                self.cursor.execute(query, params)
-            else:
-                self.cursor.execute(query)
-            return self.cursor.fetchall()
+            return await self.pool.fetchall(query, params)
         except Exception as e:
             print(f"Error executing query: {e}")
             return None
 
-    def check_user(self, username : str, password : str) -> int|None:
+    async def check_user(self, username : str, password : str) -> int|None:
         """
         Function to authorize a user and connect them to the right programs.
-        Returns True if authentication is successful, otherwise False.
+        Returns the user id if authentication is successful, None if it fails and -1 on errors.
+        Hashes made with an outdated cost factor are replaced after a successful login.
         """
         try:
-            self.cursor.execute("SELECT id, password FROM gym_user WHERE username = %s;", (username,))
-            result = self.cursor.fetchone() # Returns a tuple (id, password_hash)
+            result = await self.pool.fetchone("SELECT id, password FROM gym_user WHERE username = %s;", (username,))
+            # Returns a tuple (id, password_hash)
 
             if result is None:
                 return None
@@ -77,55 +277,58 @@ class Database:
             user_id = result[0]
             password_hash = result[1]
 
-            if bcrypt.checkpw(password=password.encode(), hashed_password=password_hash.encode()):
-                return user_id
+            if not await self.password_hasher.check(password=password, password_hash=password_hash):
+                return None
+
+            if self.password_hasher.needs_rehash(password_hash):
+                await self.pool.execute("UPDATE gym_user SET password = %s WHERE id = %s;",
+                                        (await self.password_hasher.hash(password), user_id))
 
-            return None
+            return user_id
         
         except Exception as e:
             print(f"Database error: {e}")
             return -1
     
-    def check_username(self, username: str) -> bool:
+    async def check_username(self, username: str) -> bool:
         try:
-            self.cursor.execute("SELECT id FROM gym_user WHERE username = %s", (username,))
-            result = self.cursor.fetchone()
+            result = await self.pool.fetchone("SELECT id FROM gym_user WHERE username = %s", (username,))
 
             return True if result is not None else False
         except Exception as e:
             print(f"Database error: {e}")
             return False
         
-    def register_user(self, username : str, password : str) -> bool:
+    async def register_user(self, username : str, password : str) -> bool:
         """
         Function to register a new user and register data on the DB
         """
         try:
-            # Check if user already exists
-            self.cursor.execute("SELECT id FROM gym_user WHERE username = %s", (username,))
-            existing_user = self.cursor.fetchone()
-
-            if existing_user is not None:
-                print("Username already existing on DB")
-                return False
-            
-            # Hash the password
-            hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-
-            # Insert into DB
-            self.cursor.execute("INSERT INTO gym_user (username, password_hash) VALUES (%s, %s)", (username, hashed_password.decode()))
-            self.conn.commit()
-
-            return True
+            # Hash the password before taking a connection
+            hashed_password = await self.password_hasher.hash(password)
 
+            return await self.pool.run(self.__register_user, username, hashed_password)
         except Exception as e:
             print(f"Database error: {e}")
             return False
+
+    def __register_user(self, cursor, username: str, hashed_password: str) -> bool:
+        # Check if user already exists
+        cursor.execute("SELECT id FROM gym_user WHERE username = %s", (username,))
+        existing_user = cursor.fetchone()
+
+        if existing_user is not None:
+            print("Username already existing on DB")
+            return False
+
+        # Insert into DB
+        cursor.execute("INSERT INTO gym_user (username, password) VALUES (%s, %s)", (username, hashed_password))
+        return True
     
-    def get_programs(self, user_id) -> str|None:
+    async def get_programs(self, user_id) -> str|None:
         try:
-            self.cursor.execute("SELECT id, name FROM program WHERE owner_id = %s", (user_id,))
-            return self.programs_to_string(self.cursor.fetchall())
+            programs = await self.pool.fetchall("SELECT id, name FROM program WHERE owner_id = %s", (user_id,))
+            return self.programs_to_string(programs)
         except Exception as e:
             print(f"Database error: {e}")
             return None
@@ -136,10 +339,9 @@ class Database:
             returned_string += f"{row[0]}) {row[1]}\n"
         return returned_string
 
-    def get_programs_details(self, user_id) -> str:
+    async def get_programs_details(self, user_id) -> str:
         try:
-            self.cursor.execute("SELECT id FROM program WHERE owner_id = %s", (user_id,))
-            program_ids = self.cursor.fetchone()
+            program_ids = await self.pool.fetchone("SELECT id FROM program WHERE owner_id = %s", (user_id,))
         except Exception as e:
             print(f"Database error: {e}")
             return None
@@ -148,14 +350,14 @@ class Database:
 
         try:
             for program_id in program_ids:
-                self.cursor.execute("""
+                program_details = await self.pool.fetchall("""
                                     SELECT pd.day_number, pd.name, e.name
                                     FROM program_day pd, exercise e, program_day_exercise pde, program p
                                     WHERE pd.program_id = p.id AND e.id = pde.exercise_id
                                         AND pde.program_day_id = %s
                                         AND p.owner_id = %s
                                     ORDER BY pd.day_number""", (program_id, user_id))
-                returned_string += self.program_details_to_string(self.cursor.fetchall())
+                returned_string += self.program_details_to_string(program_details)
                 return returned_string
         except Exception as e:
             print(f"Database error: {e}")
@@ -171,141 +373,91 @@ class Database:
             returned_string += f"\t- {row[2]}\n"
         return returned_string[:-1]
     
-    def check_program(self, user_id, program_id):
+    async def check_program(self, user_id, program_id):
         try:
-            self.cursor.execute("""
+            rows = await self.pool.fetchall("""
                                 SELECT id
                                 FROM program
                                 WHERE owner_id = %s AND id = %s
                                 """, (user_id, int(program_id)))
-            return self.cursor.fetchall() is not None
+            return rows is not None
         except Exception as e:
             print(f"Database error: {e}")
             return None
     
-    def get_selected_program(self, user_id: int, program_id: int) -> Program|None:
+    async def get_selected_program(self, user_id: int, program_id: int) -> Program|None:
         """
-        1. Get all program_day_ids
-        2. For each program_day_id get the last workout_id
-        3. For the workout_id get all the sets performed
+        Loads a whole program in a single round trip.
+        Every exercise planned for a day comes with its sets as last performed in the
+        workouts of that day, one row per set (see SELECTED_PROGRAM_QUERY).
+        Programs are served from the program cache when possible.
         """
-        new_program = Program()
-
-        new_program_days = []
+        program = self.program_cache.get(user_id, program_id)
+        if program is not None:
+            return program
 
+        version = self.program_cache.begin_load(user_id, program_id)
         try:
-            # Get program name
-            self.cursor.execute("""
-                                SELECT p.name, p.id
-                                FROM program p
-                                WHERE p.id = %s AND p.owner_id = %s
-                                """, (program_id, user_id))
-            result = self.cursor.fetchone()
-        except Exception as e:
-            print(f"Database error while getting program name: {e}")
-            return None
+            try:
+                rows = await self.pool.fetchall(SELECTED_PROGRAM_QUERY, {"user_id": user_id, "program_id": program_id})
+            except Exception as e:
+                print(f"Database error while loading program: {e}")
+                return None
 
-        # Set program name and id
-        new_program.set_id(id=program_id)
-        new_program.set_program_name(program_name=result[0])
+            program = self.__parse_program(program_id=program_id, rows=rows)
+            if program is not None:
+                self.program_cache.put(user_id, program_id, program, version=version)
+            return program
+        finally:
+            self.program_cache.end_load(user_id, program_id)
 
-        try:
-            # Get program day ids
-            self.cursor.execute("""
-                                SELECT program_day.id
-                                FROM program_day, program
-                                WHERE program_id = %s
-                                AND program.id = program_day.program_id
-                                ORDER BY program_day.day_number;
-                                """, (program_id,))
-            result = self.cursor.fetchall()
-        except Exception as e:
-            print(f"Database error while getting program day ids: {e}")
+    def __parse_program(self, program_id: int, rows: List[Tuple]) -> Program|None:
+        """
+        Builds the program from the rows of SELECTED_PROGRAM_QUERY in one pass.
+        Rows are ordered by day, planned exercise and set, so a new day or exercise starts
+        whenever the respective id changes.
+        """
+        if not rows:
             return None
 
-        program_day_ids = result
-
-        try:
-            for program_day_id in program_day_ids:
-                # Get last workout id
-                self.cursor.execute("""
-                                    SELECT w.id
-                                    FROM workout w, workout_set ws, program_day_exercise pde
-                                    WHERE w.id = ws.workout_id AND ws.exercise_id = pde.exercise_id
-                                        AND user_id = %s AND program_day_id = %s
-                                    ORDER BY workout_time DESC
-                                    LIMIT 1;
-                                    """, (user_id, program_day_id[0]))
-                workout_id = self.cursor.fetchone()
-
-                self.cursor.fetchall()
-
-                # Get all info about exercises in last workout
-                self.cursor.execute("""
-                                    SELECT e.id, e.name, e.comment, e.extra_info,
-                                        ws.weight, ws.reps, ws.rest, ws.sequence_number
-                                    FROM exercise e, workout_set ws
-                                    WHERE e.id = ws.exercise_id
-                                        AND ws.workout_id = %s
-                                    ORDER BY ws.sequence_number ASC;
-                                    """, (workout_id[0],))
-                
-                # Parse results and collect formatted exercises
-                exercises = self.__parse_exercises(exercises=self.cursor.fetchall())
-                
-                # Get Program Day details and fill the program
-                self.cursor.execute("""
-                                    SELECT pd.day_number, pd.name
-                                    FROM program_day pd
-                                    WHERE pd.program_id = %s AND pd.id = %s
-                                    ORDER BY day_number ASC;
-                                    """, (program_id, program_day_id[0]))
-                
-                result = self.cursor.fetchone()
-
-                new_program_days.append(DayProgram())
-                new_program_days[-1].set_id(id=program_day_id[0])
-                new_program_days[-1].set_day_number(day_number=result[0])
-                new_program_days[-1].set_day_name(day_name=result[1])
-                new_program_days[-1].set_exercises(new_exercises=exercises)
-            
-            new_program.set_days(new_days=new_program_days)
-            return new_program
-        except Exception as e:
-            print(f"Database error: {e}")
-            return None
+        new_program = Program()
+        new_program.set_id(id=program_id)
+        new_program.set_program_name(program_name=rows[0][0])
 
-    def __parse_exercises(self, exercises: List[Tuple]) -> List[Exercise]:
-        """
-        Takes the result of exercises query execution and fills an exercise structure.
-        It expects (id, name, comment, extra_info, weight, reps, rest, sequence_number)
-        """
-        prev_id = -1
-        exercises_list = []
-
-        for row in exercises:
-            if prev_id == row[0]:
-                # TODO: Sets are always empty
-                exercises_list[-1].add_set(
-                    ExerciseSet().fill_set(
-                        weight=float(row[4]),
-                        rest=row[6],
-                        reps=row[5]
-                    )
-                )
-            else:
-                exercises_list.append(
-                    self.__fill_exercise(row=row, exercise=Exercise()))
-                new_set = ExerciseSet()
-                new_set.fill_set(
-                    weight=float(row[4]),
-                    rest=row[6],
-                    reps=row[5]
-                )
-                exercises_list[-1].add_set(new_set)
-            prev_id = row[0]
-
-        return exercises_list
+        new_program_days = []
+        day = None
+        exercise = None
+
+        for row in rows:
+            if row[1] is None:
+                # Program without days
+                continue
+
+            if day is None or day.id != row[1]:
+                day = DayProgram()
+                day.set_id(id=row[1])
+                day.set_day_number(day_number=row[2])
+                day.set_day_name(day_name=row[3])
+                new_program_days.append(day)
+                exercise = None
+
+            if row[4] is None:
+                # Day or exercise never trained
+                continue
+
+            if exercise is None or exercise.id != row[4]:
+                exercise = self.__fill_exercise(row=row[4:8], exercise=Exercise())
+                day.add_exercise(exercise)
+
+            exercise.append_set(
+                weight=float(row[8]),
+                rest=_clamp_short(row[10]),
+                reps=_clamp_short(row[9]),
+                set_id=row[12]
+            )
+
+        new_program.set_days(new_days=new_program_days)
+        return new_program
 
     def __fill_exercise(self, row, exercise):
         exercise.set_id(row[0])
@@ -314,47 +466,284 @@ class Database:
         exercise.set_extra_info(row[3])
         return exercise
     
-    def update_set(self,
+    async def update_set(self,
                    user_id: int,
                    program_id: int,
                    day_id: int,
-                   exercise_id: int,
+                   exercise_num: int,
                    set_number: int,
                    what_to_update: str,
-                   new_value: int) -> bool:
+                   new_value: int,
+                   program: Program) -> bool:
         """
-        Function to update a set in the database
+        Function to update a set in the database.
+        The set is the one shown by program, the caller's in-memory copy, and its
+        workout_set row is updated by id. The values written are read back and
+        applied to program, so it doesn't need to be reloaded.
         """
+        exercise_set = program.days[day_id].exercises[exercise_num - 1].get_set(set_number)
+        if exercise_set.set_id is None:
+            print("The set to update was not loaded from the database")
+            return False
+        try:
+            rows = await self.update_sets(user_id=user_id, edits=[(exercise_set.set_id, what_to_update, new_value)])
+        except ValueError as e:
+            print(e)
+            return False
+        if not rows:
+            return False
+
+        _, weight, reps, rest = rows[0]
+        exercise_set.fill_set(weight=float(weight), rest=rest, reps=reps)
+        if self.program_cache.peek(user_id, program_id) is not program:
+            # Only the patched copy can stay cached
+            self.program_cache.invalidate(user_id, program_id)
+        return True
+
+    async def update_sets(self, user_id: int, edits: List[Tuple]) -> List[Tuple]|None:
+        """
+        Applies a batch of (set_id, field, value) edits with one statement and one commit,
+        all of them or none. field is "weight", "reps" or "rest"; edits of the same set are
+        merged, the last one winning for a field. The rollups of the touched weeks are
+        recomputed in the same transaction.
+        Returns the new rows (set_id, weight, reps, rest), None on error.
+        Raises ValueError on an unknown field.
+        """
+        updates = _merge_edits(edits)
+        if len(updates) == 0:
+            return []
+
+        rows = [(set_id, *values) for set_id, values in updates.items()]
+        try:
+            updated = await self.pool.run(_update_sets, user_id, rows)
+        except Exception as e:
+            print(f"Database error while updating {len(rows)} set(s): {e}")
+            return None
+        return [row[:4] for row in updated]
+
+    async def update_workout_sets(self, user_id: int, workout_id: int, edits: List[Tuple]) -> bool:
+        """
+        Applies a batch of (sequence_number, field, value) edits to the sets of a workout,
+        all of them or none, as update_sets does for (set_id, field, value) edits.
+        Raises ValueError on an unknown field.
+        """
+        updates = _merge_edits(edits)
+        if len(updates) == 0:
+            return True
         try:
-            if what_to_update == "weight":
-                set_clause = "SET weight = %s"
-                params = [new_value]
-            elif what_to_update == "reps":
-                set_clause = "SET reps = %s"
-                params = [new_value]
-            elif what_to_update == "rest":
-                set_clause = "SET rest = %s"
-                params = [new_value]
-            else:
-                print(f"Invalid what_to_update value: {what_to_update}")
+            await self.pool.run(_update_workout_sets, user_id, workout_id, updates)
+        except Exception as e:
+            print(f"Database error while updating {len(updates)} set(s) of workout {workout_id}: {e}")
+            return False
+        return True
+
+    async def update_exercise_sets(self, user_id: int, program: Program, day_id: int, exercise_num: int,
+                                   changes: dict) -> bool:
+        """
+        Writes the new values of several sets of an exercise with one update_sets batch,
+        all of them or none. changes is {set number: {"weight"/"reps"/"rest": value}},
+        as computed by an ExpressionPlan. The values read back are applied to program,
+        the caller's in-memory copy.
+        """
+        exercise = program.days[day_id].exercises[exercise_num - 1]
+        sets = {}  # set_id : view of the set
+        edits = []
+        for set_number, values in changes.items():
+            exercise_set = exercise.get_set(set_number)
+            if exercise_set.set_id is None:
+                print(f"Set {set_number} of {exercise.name} was not loaded from the database")
                 return False
-            
-            params.extend([user_id, day_id+1, exercise_id, set_number])
-            
-            self.cursor.execute(f"""
-                                UPDATE workout_set ws
-                                {set_clause}
-                                FROM workout w,
-                                    program_day_exercise pde
-                                WHERE ws.workout_id = w.id
-                                    AND w.user_id = %s
-                                    AND pde.program_day_id = %s
-                                    AND pde.exercise_id = %s
-                                    AND ws.exercise_id = pde.exercise_id
-                                    AND ws.sequence_number = %s;
-                                """, params)
-            self.conn.commit()
+            sets[exercise_set.set_id] = exercise_set
+            edits.extend((exercise_set.set_id, field, value) for field, value in values.items())
+
+        rows = await self.update_sets(user_id=user_id, edits=edits)
+        if rows is None:
+            return False
+
+        for set_id, weight, reps, rest in rows:
+            sets[set_id].fill_set(weight=float(weight), rest=rest, reps=reps)
+        if self.program_cache.peek(user_id, program.id) is not program:
+            self.program_cache.invalidate(user_id, program.id)
+        return True
+
+    async def start_workout(self, user_id: int, program_day_id: int|None) -> int|None:
+        """
+        Creates a new workout of the program day for the user and returns its id
+        """
+        try:
+            row = await self.pool.fetchone("""
+                                INSERT INTO workout (user_id, program_day_id, workout_time, duration)
+                                VALUES (%s, %s, CURRENT_TIMESTAMP, 0)
+                                RETURNING id;
+                                """, (user_id, program_day_id))
+            return row[0]
+        except Exception as e:
+            print(f"Database error while starting workout: {e}")
+            return None
+
+    async def insert_workout_sets(self, sets: List[Tuple]) -> bool:
+        """
+        Writes a batch of performed sets in one statement and adds them to the rollups.
+        Each set is (workout_id, exercise_id, sequence_number, weight, reps, rest).
+        """
+        try:
+            await self.pool.run(_insert_workout_sets, sets)
+            return True
+        except Exception as e:
+            print(f"Database error while logging {len(sets)} set(s): {e}")
+            return False
+
+    async def finish_workout(self, user_id: int, workout_id: int, duration: int, program_id: int|None = None) -> bool:
+        """
+        Stores the duration of a finished workout.
+        The sets logged make it the latest workout of its days, so the cached program is dropped.
+        """
+        try:
+            await self.pool.execute("UPDATE workout SET duration = %s WHERE id = %s;", (duration, workout_id))
+        except Exception as e:
+            print(f"Database error while finishing workout: {e}")
+            return False
+
+        if program_id is not None:
+            self.program_cache.invalidate(user_id, program_id)
+        return True
+
+
+    async def get_rollup_stats(self, user_id: int) -> dict|None:
+        """
+        Returns the weekly rollups of the user as columns: exercise_id, week, total_volume,
+        max_weight, max_e1rm, set_count (lists, in week order), the training days (epochs)
+        and exercise_names {exercise_id: name}. Columns are empty if nothing was logged.
+        """
+        try:
+            row = await self.pool.fetchone(ROLLUP_STATS_QUERY, {"user_id": user_id})
+        except Exception as e:
+            print(f"Database error while reading the stats: {e}")
+            return None
+
+        columns = ("exercise_id", "week", "total_volume", "max_weight", "max_e1rm", "set_count", "training_days")
+        rollups = {name: values or [] for name, values in zip(columns, row)}
+        rollups["exercise_names"] = {int(key): name for key, name in (row[7] or {}).items()}
+        return rollups
+
+    async def rebuild_rollups(self) -> int:
+        """
+        Recomputes all the rollups from workout_set and returns the number of rows written.
+        Errors are not swallowed, it is only run from the command line.
+        """
+        return await self.pool.execute(ROLLUP_REBUILD)
+
+    async def get_latest_sets(self, user_id: int|None = None, full: bool = False) -> dict|None:
+        """
+        Returns the sets of the latest workout of every exercise of the user (of all users if
+        user_id is None) as columns: user_id, exercise_id, workout_id, weight, reps, rest.
+        Exercises whose suggestion is already based on that workout are skipped, unless full.
+        """
+        try:
+            row = await self.pool.fetchone(LATEST_SETS_QUERY, {"user_id": user_id, "full": full})
+        except Exception as e:
+            print(f"Database error while reading the latest sets: {e}")
+            return None
+
+        columns = ("user_id", "exercise_id", "workout_id", "weight", "reps", "rest")
+        return {name: values or [] for name, values in zip(columns, row)}
+
+    async def store_suggestions(self, suggestions: List[Tuple]) -> bool:
+        """
+        Writes the suggestions in one statement, replacing the previous ones.
+        Each suggestion is (user_id, exercise_id, workout_id, weight, reps, rest, reason).
+        """
+        if len(suggestions) == 0:
+            return True
+        try:
+            await self.pool.run(_store_suggestions, suggestions)
             return True
         except Exception as e:
-            print(f"Database error while updating set: {e}")
-            return False
\ No newline at end of file
+            print(f"Database error while storing {len(suggestions)} suggestion(s): {e}")
+            return False
+
+    async def get_suggestions(self, user_id: int) -> List[Tuple]|None:
+        """
+        Returns the suggestions of the user: (exercise name, weight, reps, rest, reason, computed_at)
+        """
+        try:
+            return await self.pool.fetchall("""
+                                SELECT e.name, s.weight, s.reps, s.rest, s.reason, s.computed_at
+                                FROM exercise_suggestion s
+                                JOIN exercise e ON e.id = s.exercise_id
+                                WHERE s.user_id = %s
+                                ORDER BY e.name;
+                                """, (user_id,))
+        except Exception as e:
+            print(f"Database error while reading the suggestions: {e}")
+            return None
+
+
+def _clamp_short(value: int|None) -> int|None:
+    # Rows written before the sets were stored as uint16 may not fit: the program still loads
+    if value is None or 0 <= value <= MAX_SHORT:
+        return value
+    print(f"Set value out of range, clamped: {value}")
+    return min(max(value, 0), MAX_SHORT)
+
+def _insert_workout_sets(cursor, sets: List[Tuple]) -> None:
+    rows = execute_values(cursor, """
+                   INSERT INTO workout_set (workout_id, exercise_id, sequence_number, weight, reps, rest)
+                   VALUES %s
+                   RETURNING id;
+                   """, sets, page_size=len(sets), fetch=True)
+    # Same transaction: the rollups never miss or count twice a set
+    set_ids = [row[0] for row in rows]
+    cursor.execute(ROLLUP_ADD_SETS, {"set_ids": set_ids})
+
+
+def _store_suggestions(cursor, suggestions: List[Tuple]) -> None:
+    execute_values(cursor, """
+                   INSERT INTO exercise_suggestion (user_id, exercise_id, workout_id, weight, reps, rest, reason)
+                   VALUES %s
+                   ON CONFLICT (user_id, exercise_id) DO UPDATE SET
+                       workout_id = EXCLUDED.workout_id,
+                       weight = EXCLUDED.weight,
+                       reps = EXCLUDED.reps,
+                       rest = EXCLUDED.rest,
+                       reason = EXCLUDED.reason,
+                       computed_at = CURRENT_TIMESTAMP;
+                   """, suggestions, page_size=1000)
+
+def _merge_edits(edits: List[Tuple]) -> dict:
+    updates = {}  # key : [weight, reps, rest]
+    for key, field, value in edits:
+        if field not in EDITABLE_FIELDS:
+            raise ValueError(f"Invalid field to update: {field}")
+        updates.setdefault(key, [None, None, None])[EDITABLE_FIELDS.index(field)] = value
+    return updates
+
+def _update_workout_sets(cursor, user_id: int, workout_id: int, updates: dict) -> List[Tuple]:
+    cursor.execute(WORKOUT_SET_IDS_QUERY, {"workout_id": workout_id, "sequences": list(updates)})
+    set_ids = dict(cursor.fetchall())
+    if len(set_ids) != len(updates):
+        raise ValueError(f"only {len(set_ids)} of {len(updates)} set(s) were found in workout {workout_id}")
+    return _update_sets(cursor, user_id, [(set_ids[sequence], *values) for sequence, values in updates.items()])
+
+def _update_sets(cursor, user_id: int, rows: List[Tuple]) -> List[Tuple]:
+    query = cursor.mogrify(UPDATE_SETS, {"user_id": user_id})
+    updated = execute_values(cursor, query, rows, template=UPDATE_SETS_TEMPLATE,
+                             page_size=len(rows), fetch=True)
+    if len(updated) != len(rows):
+        # All or nothing: raising rolls the transaction back
+        raise ValueError(f"only {len(updated)} of {len(rows)} set(s) matched the update")
+
+    workout_times = {}  # exercise_id : workout times of its updated sets
+    for row in updated:
+        workout_times.setdefault(row[4], []).append(row[5])
+    for exercise_id, times in workout_times.items():
+        _refresh_rollups(cursor, user_id, exercise_id, times)
+    return updated
+
+def _refresh_rollups(cursor, user_id: int, exercise_id: int, workout_times: List) -> None:
+    if len(workout_times) > 0:
+        cursor.execute(ROLLUP_REFRESH_WEEKS, {
+            "user_id": user_id,
+            "exercise_id": exercise_id,
+            "workout_times": workout_times
+        })
@@ -1,21 +1,173 @@
-from telegram_bot.telegram_bot_class import TelegramBot
-
+import argparse
+import asyncio
 import os
 from dotenv import load_dotenv
 
+from startup_profiler import StartupProfiler
+
+
+def database_settings() -> dict:
+    return {
+        "db_host": os.getenv("DB_HOST"),
+        "db_name": os.getenv("DB_NAME"),
+        "db_user": os.getenv("DB_USER"),
+        "db_password": os.getenv("DB_PASSWORD"),
+        "db_port": os.getenv("DB_PORT")
+    }
+
+
+def suggestion_settings() -> dict:
+    return {
+        "rep_min": int(os.getenv("SUGGESTION_REP_MIN", 8)),
+        "rep_max": int(os.getenv("SUGGESTION_REP_MAX", 12)),
+        "weight_step": float(os.getenv("SUGGESTION_WEIGHT_STEP", 2.5))
+    }
+
+
+def migrate():
+    """
+    Applies the pending schema migrations and exits
+    """
+    from database import Database
+
+    database = Database(**database_settings())
+    try:
+        applied = asyncio.run(database.apply_migrations())
+        print(f"Applied {len(applied)} migration(s)")
+    finally:
+        database.close()
+
+
+def rebuild_rollups():
+    """
+    Recomputes the exercise rollups from the logged sets and exits
+    """
+    from database import Database
+
+    database = Database(**database_settings())
+    try:
+        rows = asyncio.run(database.rebuild_rollups())
+        print(f"Rebuilt {rows} rollup row(s)")
+    finally:
+        database.close()
+
+
+def compute_suggestions(full: bool):
+    """
+    Updates the next session suggestions of all the users and exits.
+    Meant to be run nightly, or after importing workouts.
+    """
+    from database import Database
+    from suggestion_engine import SuggestionEngine
+
+    database = Database(**database_settings())
+    try:
+        engine = SuggestionEngine(database, **suggestion_settings())
+        written = asyncio.run(engine.run(full=full))
+        if written is None:
+            raise SystemExit("Error while computing the suggestions")
+        print(f"Wrote {written} suggestion(s)")
+    finally:
+        database.close()
+
 
 def main():
+    parser = argparse.ArgumentParser(description="gymBot telegram bot")
+    parser.add_argument("--migrate", action="store_true",
+                        help="apply the pending database migrations and exit")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="recompute the per exercise day/week rollups from the logged sets and exit")
+    parser.add_argument("--compute-suggestions", action="store_true",
+                        help="update the next session suggestions of all the users and exit")
+    parser.add_argument("--full", action="store_true",
+                        help="with --compute-suggestions, recompute every exercise, not only the ones trained since")
+    parser.add_argument("--webhook", action="store_true",
+                        help="receive updates through a webhook instead of polling (same as BOT_MODE=webhook)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report the import and initialization time of every module and exit")
+    args = parser.parse_args()
+
     load_dotenv()
-    tele_bot = TelegramBot(
-        bot_token=os.getenv("BOT_TOKEN"),
-        db_host=os.getenv("DB_HOST"),
-        db_name=os.getenv("DB_NAME"),
-        db_user=os.getenv("DB_USER"),
-        db_password=os.getenv("DB_PASSWORD"),
-        db_port=os.getenv("DB_PORT")
-    )
-
-    tele_bot.run()
+
+    if args.migrate:
+        migrate()
+        return
+    if args.rebuild_rollups:
+        rebuild_rollups()
+        return
+    if args.compute_suggestions:
+        compute_suggestions(full=args.full)
+        return
+
+    webhook = args.webhook or os.getenv("BOT_MODE", "polling") == "webhook"
+    if webhook and not args.profile_startup and not os.getenv("WEBHOOK_URL"):
+        # Checked before connecting to anything: Telegram needs the public URL to push to
+        parser.error("webhook mode needs WEBHOOK_URL, the public https URL of the webhook")
+
+    # The bot modules are imported here, after the profiler is in place
+    profiler = StartupProfiler()
+    if args.profile_startup:
+        profiler.install()
+
+    with profiler.step("import telegram_bot_class"):
+        from telegram_bot.telegram_bot_class import TelegramBot
+
+    with profiler.step("TelegramBot()"):
+        tele_bot = TelegramBot(
+            bot_token=os.getenv("BOT_TOKEN"),
+            **database_settings(),
+            db_pool_min_size=os.getenv("DB_POOL_MIN_SIZE", 1),
+            db_pool_max_size=os.getenv("DB_POOL_MAX_SIZE", 10),
+            db_acquire_timeout=os.getenv("DB_ACQUIRE_TIMEOUT", 10.0),
+            auto_migrate=os.getenv("DB_AUTO_MIGRATE", "false").lower() in ("1", "true", "yes"),
+            hash_workers=os.getenv("BCRYPT_WORKERS", 2),
+            hash_rounds=os.getenv("BCRYPT_ROUNDS", 12),
+            program_cache_max_entries=os.getenv("PROGRAM_CACHE_MAX_ENTRIES", 1024),
+            program_cache_max_bytes=os.getenv("PROGRAM_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+            program_cache_ttl=os.getenv("PROGRAM_CACHE_TTL", 3600.0),
+            session_idle_ttl=os.getenv("SESSION_IDLE_TTL", 3600.0),
+            max_sessions=os.getenv("MAX_SESSIONS", 10000),
+            max_session_bytes=os.getenv("MAX_SESSION_BYTES", 256 * 1024 * 1024),
+            session_persistence=os.getenv("SESSION_PERSISTENCE", "sqlite"),
+            session_sqlite_path=os.getenv("SESSION_SQLITE_PATH", "sessions.sqlite3"),
+            session_flush_interval=os.getenv("SESSION_FLUSH_INTERVAL", 2.0),
+            workout_flush_interval=os.getenv("WORKOUT_FLUSH_INTERVAL", 30.0),
+            bot_api_url=os.getenv("BOT_API_URL"),
+            concurrent_updates=os.getenv("CONCURRENT_UPDATES", 32),
+            chat_queue_depth=os.getenv("CHAT_QUEUE_DEPTH", 20),
+            dispatch_drain_timeout=os.getenv("DISPATCH_DRAIN_TIMEOUT", 30.0),
+            outbound_global_rate=os.getenv("OUTBOUND_GLOBAL_RATE", 30.0),
+            outbound_chat_rate=os.getenv("OUTBOUND_CHAT_RATE", 1.0),
+            outbound_chat_burst=os.getenv("OUTBOUND_CHAT_BURST", 3),
+            chart_cache_dir=os.getenv("CHART_CACHE_DIR", "chart_cache"),
+            chart_workers=os.getenv("CHART_WORKERS", 1),
+            suggestion_rep_min=os.getenv("SUGGESTION_REP_MIN", 8),
+            suggestion_rep_max=os.getenv("SUGGESTION_REP_MAX", 12),
+            suggestion_weight_step=os.getenv("SUGGESTION_WEIGHT_STEP", 2.5)
+        )
+
+    if args.profile_startup:
+        profiler.uninstall()
+        print(profiler.report())
+        tele_bot.close()
+        return
+
+    if webhook:
+        # aiohttp is only needed in webhook mode
+        from telegram_bot.webhook_server import WebhookServer
+
+        server = WebhookServer(
+            bot=tele_bot,
+            listen=os.getenv("WEBHOOK_LISTEN", "0.0.0.0"),
+            port=os.getenv("WEBHOOK_PORT", 8443),
+            url_path=os.getenv("WEBHOOK_PATH", "webhook"),
+            secret_token=os.getenv("WEBHOOK_SECRET_TOKEN"),
+            max_connections=os.getenv("WEBHOOK_MAX_CONNECTIONS", 40),
+            drain_timeout=os.getenv("WEBHOOK_DRAIN_TIMEOUT", 30.0)
+        )
+        tele_bot.run_webhook(webhook_url=os.getenv("WEBHOOK_URL"), server=server)
+    else:
+        tele_bot.run()
 
 
 if __name__ == "__main__":
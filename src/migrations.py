@@ -0,0 +1,98 @@
+import os
+import re
+
+from typing import List
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "db_schema", "migrations")
+
+# Migration files are named <version>_<description>.sql, e.g. 0001_query_indexes.sql
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+# Arbitrary key, so that bot instances starting together apply migrations one at a time
+MIGRATION_LOCK_KEY = 0x67796D62
+
+
+class Migration:
+    """
+    Class for a single versioned SQL file
+    """
+    def __init__(self, version: int, name: str, path: str):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    def read_sql(self) -> str:
+        with open(self.path, encoding="utf-8") as f:
+            return f.read()
+
+    def to_string(self) -> str:
+        return f"{self.version:04d}_{self.name}"
+
+
+class MigrationRunner:
+    """
+    Applies the SQL files of db_schema/migrations that were not applied yet,
+    in version order, and records them in the schema_migrations table.
+    """
+    def __init__(self, migrations_dir: str = MIGRATIONS_DIR):
+        self.migrations_dir = migrations_dir
+
+    def discover(self) -> List[Migration]:
+        """
+        Returns all the migrations found on disk, sorted by version
+        """
+        migrations = []
+        for file_name in os.listdir(self.migrations_dir):
+            match = MIGRATION_FILE.match(file_name)
+            if match is None:
+                continue
+            migrations.append(Migration(
+                version=int(match.group(1)),
+                name=match.group(2),
+                path=os.path.join(self.migrations_dir, file_name)
+            ))
+
+        migrations.sort(key=lambda migration: migration.version)
+        for previous, current in zip(migrations, migrations[1:]):
+            if previous.version == current.version:
+                raise ValueError(f"Duplicate migration version: {previous.to_string()} and {current.to_string()}")
+        return migrations
+
+    def applied_versions(self, cursor) -> set:
+        cursor.execute("""
+                       CREATE TABLE IF NOT EXISTS schema_migrations (
+                           version INTEGER PRIMARY KEY,
+                           name VARCHAR(255) NOT NULL,
+                           applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                       );
+                       """)
+        cursor.execute("SELECT version FROM schema_migrations;")
+        return {row[0] for row in cursor.fetchall()}
+
+    def pending(self, cursor) -> List[Migration]:
+        """
+        Returns the migrations not applied yet, without changing the database
+        """
+        cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL;")
+        applied = set()
+        if cursor.fetchone()[0]:
+            cursor.execute("SELECT version FROM schema_migrations;")
+            applied = {row[0] for row in cursor.fetchall()}
+        return [migration for migration in self.discover() if migration.version not in applied]
+
+    def apply(self, cursor) -> List[Migration]:
+        """
+        Applies the pending migrations using the given cursor.
+        Runs inside the caller's transaction, so either every pending migration is applied or none.
+        Returns the migrations that were applied.
+        """
+        cursor.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_KEY,))
+        applied = self.applied_versions(cursor)
+
+        pending = [migration for migration in self.discover() if migration.version not in applied]
+        for migration in pending:
+            print(f"Applying migration {migration.to_string()}")
+            cursor.execute(migration.read_sql())
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+                           (migration.version, migration.name))
+        return pending
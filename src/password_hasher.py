@@ -0,0 +1,69 @@
+import asyncio
+import multiprocessing
+import bcrypt
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+def _checkpw(password: bytes, hashed_password: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Class hashing and verifying passwords with bcrypt on a dedicated process pool,
+    so the CPU time of the key derivation never blocks the event loop.
+    The pool is started by the first hash or check: the batch commands never need it.
+    """
+    def __init__(self, workers: int = 2, rounds: int = 12):
+        self.workers = int(workers)
+        self.rounds = int(rounds)
+
+        if self.workers < 1:
+            raise ValueError("At least one hashing worker is needed")
+        if self.rounds < 4 or self.rounds > 31:
+            raise ValueError("bcrypt cost factor must be between 4 and 31")
+
+        self.executor = None
+
+    async def hash(self, password: str) -> str:
+        """
+        Returns the bcrypt hash of the password, using the configured cost factor
+        """
+        loop = asyncio.get_running_loop()
+        hashed_password = await loop.run_in_executor(self.__executor(), _hashpw, password.encode(), self.rounds)
+        return hashed_password.decode()
+
+    async def check(self, password: str, password_hash: str) -> bool:
+        """
+        Returns True if the password matches the hash
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor(), _checkpw, password.encode(), password_hash.encode())
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """
+        Returns True if the hash was made with a lower cost factor than the configured one.
+        bcrypt hashes look like $2b$<cost>$<salt and hash>.
+        """
+        try:
+            return int(password_hash.split("$")[2]) < self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def __executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # Spawned workers don't inherit the connection pool threads of the parent
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
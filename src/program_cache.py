@@ -0,0 +1,168 @@
+import sys
+import time
+
+from array import array
+from collections import OrderedDict
+
+from program_classes import Program
+
+
+def estimate_program_size(program: Program) -> int:
+    """
+    Rough number of bytes held by a program and all its days, exercises and sets
+    """
+    size = _sizeof(program) + sys.getsizeof(program.days)
+    for day in program.days:
+        size += _sizeof(day) + sys.getsizeof(day.exercises)
+        for exercise in day.exercises:
+            # The sets live in the arrays of the exercise
+            size += _sizeof(exercise)
+    return size
+
+def _sizeof(obj) -> int:
+    """
+    Size of the object with its strings and arrays. The model classes use __slots__.
+    """
+    size = sys.getsizeof(obj)
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            value = getattr(obj, name, None)
+            if isinstance(value, (str, array)):
+                size += sys.getsizeof(value)
+    return size
+
+
+class ProgramCache:
+    """
+    LRU cache of the loaded programs, keyed by (user_id, program_id).
+    Entries are bounded in number, in estimated memory and in age.
+
+    A key being loaded has a version, bumped on invalidation: a program loaded while
+    a write was happening is not stored, since it might already be stale. Versions are
+    only kept between begin_load() and end_load(), so they don't outlive the loads.
+    """
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl: float = 3600.0):
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl)
+
+        self.entries = OrderedDict()  # (user_id, program_id) : (program, size, expires_at)
+        self.loads = {}               # (user_id, program_id) : [loads in progress, version]
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def version(self, user_id: int, program_id: int) -> int:
+        """
+        Returns the current version of the entry
+        """
+        load = self.loads.get((user_id, program_id))
+        return load[1] if load is not None else 0
+
+    def begin_load(self, user_id: int, program_id: int) -> int:
+        """
+        Returns the version to pass to put(). To be called before loading the program,
+        and followed by end_load() once it is stored or given up.
+        """
+        key = (user_id, program_id)
+        load = self.loads.get(key)
+        if load is None:
+            load = self.loads[key] = [0, 0]
+        load[0] += 1
+        return load[1]
+
+    def end_load(self, user_id: int, program_id: int) -> None:
+        key = (user_id, program_id)
+        load = self.loads[key]
+        load[0] -= 1
+        if load[0] == 0:
+            # No load left to compare with the version
+            del self.loads[key]
+
+    def get(self, user_id: int, program_id: int) -> Program|None:
+        """
+        Returns the cached program or None
+        """
+        key = (user_id, program_id)
+        entry = self.entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry[2] < time.monotonic():
+            self.__remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def peek(self, user_id: int, program_id: int) -> Program|None:
+        """
+        Returns the cached program without touching recency or counters
+        """
+        entry = self.entries.get((user_id, program_id))
+        return entry[0] if entry is not None else None
+
+    def put(self, user_id: int, program_id: int, program: Program, version: int|None = None) -> bool:
+        """
+        Stores a program, evicting the least recently used ones if over the limits.
+        If version is given and the entry was invalidated since, the program is not stored.
+        """
+        key = (user_id, program_id)
+        if version is not None and version != self.version(user_id, program_id):
+            return False
+
+        size = estimate_program_size(program)
+        if size > self.max_bytes:
+            return False
+
+        if key in self.entries:
+            self.__remove(key)
+
+        self.entries[key] = (program, size, time.monotonic() + self.ttl)
+        self.total_bytes += size
+
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self.__remove(next(iter(self.entries)))
+            self.evictions += 1
+        return True
+
+    def invalidate(self, user_id: int, program_id: int) -> None:
+        """
+        Drops the entry of a program after it was modified in the database
+        """
+        key = (user_id, program_id)
+        load = self.loads.get(key)
+        if load is not None:
+            load[1] += 1
+        if key in self.entries:
+            self.__remove(key)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "loading": len(self.loads),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
+
+    def __remove(self, key) -> None:
+        _, size, _ = self.entries.pop(key)
+        self.total_bytes -= size
@@ -1,12 +1,52 @@
-import pandas as pd
+import math
 
+from array import array
 from typing import List
 
-class ExerciseSet:
+class Renderable:
     """
-    Class for each set of an exercise
+    Base class for the model objects caching their text.
+    A change marks the object dirty together with its parents, whose text includes it.
     """
+    __slots__ = ("parent", "rendered")
+
+    def __init__(self):
+        self.parent = None
+        self.rendered = None
+
+    def invalidate(self):
+        # A rendered parent implies rendered children, so an already dirty object
+        # has dirty parents too and the walk can stop there
+        node = self
+        while node is not None and node.rendered is not None:
+            node.rendered = None
+            node = node.parent
+
+    def adopt(self, child: "Renderable"):
+        child.parent = self
+        self.invalidate()
+
+    def to_string(self) -> str:
+        if self.rendered is None:
+            self.rendered = self.render()
+        return self.rendered
+
+    def render(self) -> str:
+        raise NotImplementedError
+
+
+def _render_set(weight, rest, reps) -> str:
+    return f"{'Reps:':<6} {reps:<3} | {'Weight:':<7} {weight:<5}kg | {'Rest:':<5} {rest:<3}s"
+
+
+class ExerciseSet(Renderable):
+    """
+    Class for a set on its own, before being added to an exercise
+    """
+    __slots__ = ("weight", "rest", "reps")
+
     def __init__(self):
+        super().__init__()
         self.weight = None
         self.rest = None
         self.reps = None
@@ -15,34 +55,132 @@ class ExerciseSet:
         self.weight = weight
         self.rest = rest
         self.reps = reps
+        self.invalidate()
 
     def update_weight(self, new_weight: float):
         self.weight = new_weight
+        self.invalidate()
 
     def update_rest(self, new_rest: int):
         self.rest = new_rest
+        self.invalidate()
     
     def update_reps(self, new_reps: int):
         self.reps = new_reps
+        self.invalidate()
+
+    def render(self):
+        return _render_set(self.weight, self.rest, self.reps)
+
+
+class ExerciseSetView:
+    """
+    Set of an exercise, read and written in place in the arrays of the exercise.
+    Views are created on access and hold nothing else.
+    """
+    __slots__ = ("exercise", "index")
+
+    def __init__(self, exercise: "Exercise", index: int):
+        self.exercise = exercise
+        self.index = index
+
+    @property
+    def weight(self) -> float|None:
+        return _from_weight(self.exercise.weights[self.index])
+
+    @property
+    def reps(self) -> int|None:
+        return _from_short(self.exercise.reps[self.index])
+
+    @property
+    def rest(self) -> int|None:
+        return _from_short(self.exercise.rests[self.index])
+
+    @property
+    def set_id(self) -> int|None:
+        """
+        Id of the workout_set row the set was loaded from, None if it wasn't
+        """
+        return self.exercise.set_ids[self.index] or None
+
+    def fill_set(self, weight: float, rest: int, reps: int):
+        # All the values are checked before any is written
+        weight, rest, reps = _to_weight(weight), _to_short(rest), _to_short(reps)
+        self.exercise.weights[self.index] = weight
+        self.exercise.rests[self.index] = rest
+        self.exercise.reps[self.index] = reps
+        self.exercise.invalidate()
+
+    def update_weight(self, new_weight: float):
+        self.exercise.weights[self.index] = _to_weight(new_weight)
+        self.exercise.invalidate()
+
+    def update_rest(self, new_rest: int):
+        self.exercise.rests[self.index] = _to_short(new_rest)
+        self.exercise.invalidate()
+    
+    def update_reps(self, new_reps: int):
+        self.exercise.reps[self.index] = _to_short(new_reps)
+        self.exercise.invalidate()
 
     def to_string(self):
-        return f"{'Reps:':<6} {self.reps:<3} | {'Weight:':<7} {self.weight:<5}kg | {'Rest:':<5} {self.rest:<3}s"
+        return _render_set(self.weight, self.rest, self.reps)
+
+
+# Sets are stored as float32 weights, uint16 reps and rests, and int32 workout_set ids (0 if none).
+# Missing values are NaN and MISSING_SHORT; weights are rounded back to WEIGHT_DIGITS
+# decimals when read, to hide the float32 representation (62.3 is stored as 62.29999...).
+# Weights have the range and decimals of workout_set.weight, NUMERIC(6,2).
+MISSING_SHORT = 0xFFFF
+MAX_SHORT = MISSING_SHORT - 1
+WEIGHT_DIGITS = 2
+MAX_WEIGHT = 9999.99
+
+def _to_weight(value: float|None) -> float:
+    if value is None:
+        return math.nan
+    if value < 0 or value > MAX_WEIGHT:
+        raise ValueError(f"Weight out of range: {value}")
+    return value
+
+def _from_weight(value: float) -> float|None:
+    return None if math.isnan(value) else round(value, WEIGHT_DIGITS)
 
+def _to_short(value: int|None) -> int:
+    if value is None:
+        return MISSING_SHORT
+    if value < 0 or value > MAX_SHORT:
+        raise ValueError(f"Value out of range: {value}")
+    return value
 
-class Exercise:
+def _from_short(value: int) -> int|None:
+    return None if value == MISSING_SHORT else value
+
+
+class Exercise(Renderable):
     """
-    Class for each single exercise
+    Class for each single exercise.
+    Weight, reps and rest of its sets are kept in three compact arrays,
+    get_set() returns a view on one of them. set_ids keeps the workout_set row of each
+    set, so that updates address it directly.
     """
+    __slots__ = ("id", "name", "comment", "extra_info", "updated", "weights", "reps", "rests", "set_ids")
+
     def __init__(self):
+        super().__init__()
         self.id = None
         self.name = None
         self.comment = None
         self.extra_info = None
         self.updated = None
-        self.sets = []
+        self.weights = array("f")
+        self.reps = array("H")
+        self.rests = array("H")
+        self.set_ids = array("i")
 
     def set_name(self, name: str):
         self.name = name
+        self.invalidate()
     
     def set_id(self, id: int):
         self.id = id
@@ -54,33 +192,59 @@ class Exercise:
         self.extra_info = extra_info
     
     def set_exercise_sets(self, new_sets: List[ExerciseSet]):
-        self.sets = new_sets
+        self.weights = array("f", [_to_weight(s.weight) for s in new_sets])
+        self.reps = array("H", [_to_short(s.reps) for s in new_sets])
+        self.rests = array("H", [_to_short(s.rest) for s in new_sets])
+        self.set_ids = array("i", [0] * len(new_sets))
+        self.invalidate()
 
     def add_set(self, new_set: ExerciseSet):
-        self.sets.append(new_set)
+        """
+        Appends the values of new_set, which stays independent from the exercise
+        """
+        self.append_set(weight=new_set.weight, rest=new_set.rest, reps=new_set.reps)
+
+    def append_set(self, weight: float|None, rest: int|None, reps: int|None, set_id: int|None = None):
+        # All the values are checked before any array grows
+        weight, reps, rest = _to_weight(weight), _to_short(reps), _to_short(rest)
+        self.weights.append(weight)
+        self.reps.append(reps)
+        self.rests.append(rest)
+        self.set_ids.append(set_id or 0)
+        self.invalidate()
     
-    def get_set(self, set_num: int) -> ExerciseSet:
-        if set_num < 1 or set_num > len(self.sets):
+    def get_set(self, set_num: int) -> ExerciseSetView:
+        if set_num < 1 or set_num > len(self.weights):
             raise IndexError("Set number out of range.")
-        return self.sets[set_num - 1]
+        return ExerciseSetView(self, set_num - 1)
 
-    def to_string(self):
-        string_exercise = f"\n{self.name}:\n"
-        for i, s in enumerate(self.sets):
-            string_exercise += f"  Set {i+1}: {s.to_string()}\n"
-        return string_exercise
+    @property
+    def sets(self) -> List[ExerciseSetView]:
+        return [ExerciseSetView(self, i) for i in range(len(self.weights))]
+
+    def render(self):
+        parts = [f"\n{self.name}:\n"]
+        for i in range(len(self.weights)):
+            weight = _from_weight(self.weights[i])
+            rest = _from_short(self.rests[i])
+            reps = _from_short(self.reps[i])
+            parts.append(f"  Set {i+1}: {_render_set(weight, rest, reps)}\n")
+        return "".join(parts)
 
     def get_last_set(self):
-        return self.sets[-1]
+        return self.get_set(len(self.weights))
     
     def get_num_sets(self) -> int:
-        return len(self.sets)
+        return len(self.weights)
 
-class DayProgram:
+class DayProgram(Renderable):
     """
     Class for each day of a program
     """
+    __slots__ = ("id", "day_number", "day_name", "exercises")
+
     def __init__(self):
+        super().__init__()
         self.id = None
         self.day_number = None
         self.day_name = None
@@ -91,31 +255,40 @@ class DayProgram:
 
     def set_day_number(self, day_number: int):
         self.day_number = day_number
+        self.invalidate()
 
     def set_day_name(self, day_name: str):
         self.day_name = day_name
+        self.invalidate()
 
     def add_exercise(self, new_exercise: Exercise):
         self.exercises.append(new_exercise)
+        self.adopt(new_exercise)
 
     def set_exercises(self, new_exercises: List[Exercise]):
         self.exercises = new_exercises
+        for new_exercise in new_exercises:
+            new_exercise.parent = self
+        self.invalidate()
 
     def get_last_exercise(self):
         return self.exercises[-1]
 
-    def to_string(self) -> str:
-        return_string = f"\n=== Day {self.day_number}: {self.day_name} ===\n"
+    def render(self) -> str:
+        parts = [f"\n=== Day {self.day_number}: {self.day_name} ===\n"]
         for exercise in self.exercises:
-            return_string += exercise.to_string()
-        return return_string
+            parts.append(exercise.to_string())
+        return "".join(parts)
 
 
-class Program:
+class Program(Renderable):
     """
     Class for each program
     """
+    __slots__ = ("id", "program_name", "days")
+
     def __init__(self):
+        super().__init__()
         self.id = None
         self.program_name = None
         self.days = []
@@ -125,23 +298,30 @@ class Program:
     
     def set_program_name(self, program_name: str):
         self.program_name = program_name
+        self.invalidate()
 
     def set_days(self, new_days: List[DayProgram]):
         self.days = new_days
+        for new_day in new_days:
+            new_day.parent = self
+        self.invalidate()
     
     def add_day(self, new_day: DayProgram):
         self.days.append(new_day)
+        self.adopt(new_day)
     
-    def to_string(self) -> str:
-        return_string = f"🏋️ Program: {self.program_name} 🏋️\n"
+    def render(self) -> str:
+        parts = [f"🏋️ Program: {self.program_name} 🏋️\n"]
         for day in self.days:
-            return_string += day.to_string()
-        return return_string 
+            parts.append(day.to_string())
+        return "".join(parts)
 
 class ExerciseUpdate:
     """
     Class for storing updates to exercises
     """
+    __slots__ = ("chat_id", "exercise_num", "set_num", "what_to_update", "value_to_update", "exercise_expression")
+
     def __init__(self):
         self.chat_id = None
         self.exercise_num = None
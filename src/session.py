@@ -0,0 +1,322 @@
+import struct
+import sys
+import time
+
+from collections import OrderedDict
+
+from state_machine import StateMachine, State, SubStateLogin, SubStateUpdateSet, SubStateUpdateExercise
+from program_classes import ExerciseUpdate
+from program_cache import estimate_program_size
+
+
+class Session:
+    """
+    Class holding everything the bot knows about a single chat
+    """
+    __slots__ = (
+        "chat_id",
+        "state_machine",
+        "registered",         # True after /start
+        "username",
+        "first_name",
+        "user_id",            # id of the user in DB, once authenticated
+        "login_username",     # username typed during login, until the password is checked
+        "login_retries",      # wrong passwords typed so far
+        "updating",           # ExerciseUpdate being filled by the update dialogue
+        "selected_program",
+        "selected_day_id",
+        "resting",
+        "exercise_num_set",   # tuple (exercise_num, set_num)
+        "workout_id",         # id in DB of the workout being logged
+        "workout_start",      # wall clock time the workout started at
+        "next_sequence",      # sequence number of the next performed set
+        "pending_sets",       # performed sets not written to DB yet
+        "logged_sets",        # (exercise_num, set_num) : sequence number of the sets performed
+        "view_message_id",    # message showing the workout, edited in place
+        "view_text",          # text and keyboard last shown in that message
+        "view_keyboard",
+        "last_seen",
+        "size",
+        "sized_program"
+    )
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.state_machine = StateMachine()
+        self.registered = False
+        self.username = None
+        self.first_name = None
+        self.user_id = None
+        self.login_username = None
+        self.login_retries = 0
+        self.updating = None
+        self.selected_program = None
+        self.selected_day_id = None
+        self.resting = False
+        self.exercise_num_set = (0, 0)
+        self.workout_id = None
+        self.workout_start = None
+        self.next_sequence = 1
+        self.pending_sets = []
+        self.logged_sets = {}
+        self.view_message_id = None
+        self.view_text = None
+        self.view_keyboard = None
+        self.last_seen = time.monotonic()
+        self.size = 0
+        self.sized_program = None
+
+    def get_program_id(self) -> int|None:
+        return self.selected_program.id if self.selected_program is not None else None
+
+    def estimate_size(self) -> int:
+        """
+        Rough number of bytes held by the session, the selected program included.
+        The program is measured again only when it changes.
+        """
+        if self.sized_program is not self.selected_program or self.size == 0:
+            self.sized_program = self.selected_program
+            self.size = sys.getsizeof(self) + sys.getsizeof(self.state_machine)
+            if self.selected_program is not None:
+                self.size += estimate_program_size(self.selected_program)
+        return self.size
+
+    def snapshot(self) -> bytes:
+        """
+        Returns the state of the session in a compact binary form.
+        The program is referenced by id only and must be loaded again on restore.
+        """
+        state_machine = self.state_machine
+        updating = self.updating if self.updating is not None else ExerciseUpdate()
+        flags = (SNAPSHOT_REGISTERED if self.registered else 0) | (SNAPSHOT_RESTING if self.resting else 0)
+        header = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_VERSION,
+            state_machine.get_state().value,
+            state_machine.get_substate_login().value,
+            state_machine.get_substate_update_set().value,
+            state_machine.get_substate_update_exercise().value,
+            flags,
+            min(self.login_retries, 0xFF),
+            _pack_int(self.user_id),
+            _pack_int(self.get_program_id()),
+            _pack_int(self.selected_day_id),
+            self.exercise_num_set[0],
+            self.exercise_num_set[1],
+            _pack_int(updating.exercise_num),
+            _pack_int(updating.set_num),
+            _pack_int(updating.what_to_update),
+            # A weight with decimals doesn't fit: it is typed again after a restart
+            _pack_int(updating.value_to_update if isinstance(updating.value_to_update, int) else None),
+            _pack_int(self.workout_id),
+            self.workout_start if self.workout_start is not None else -1.0,
+            self.next_sequence
+        )
+        logged_sets = b"".join(LOGGED_SET.pack(exercise_num, set_num, sequence)
+                               for (exercise_num, set_num), sequence in self.logged_sets.items())
+        return (header + _pack_str(self.username) + _pack_str(self.first_name) + _pack_str(self.login_username)
+                + LOGGED_SETS_COUNT.pack(len(self.logged_sets)) + logged_sets)
+
+    @classmethod
+    def restore(cls, chat_id: int, data: bytes) -> tuple:
+        """
+        Builds a session back from snapshot(). Returns it with the id of the program to load,
+        or (None, None) if the snapshot was written by an incompatible version.
+        """
+        if len(data) < SNAPSHOT_HEADER.size or data[0] != SNAPSHOT_VERSION:
+            return None, None
+
+        (_, state, substate_login, substate_update_set, substate_update_exercise, flags, login_retries,
+         user_id, program_id, day_id, exercise_num, set_num,
+         update_exercise_num, update_set_num, what_to_update, value_to_update,
+         workout_id, workout_start, next_sequence) = SNAPSHOT_HEADER.unpack_from(data)
+        username, offset = _unpack_str(data, SNAPSHOT_HEADER.size)
+        first_name, offset = _unpack_str(data, offset)
+        login_username, offset = _unpack_str(data, offset)
+        (logged_sets_count,) = LOGGED_SETS_COUNT.unpack_from(data, offset)
+        offset += LOGGED_SETS_COUNT.size
+
+        session = cls(chat_id)
+        session.state_machine.state = State(state)
+        session.state_machine.substate_login = SubStateLogin(substate_login)
+        session.state_machine.substate_update_set = SubStateUpdateSet(substate_update_set)
+        session.state_machine.substate_update_exercise = SubStateUpdateExercise(substate_update_exercise)
+        session.registered = bool(flags & SNAPSHOT_REGISTERED)
+        session.resting = bool(flags & SNAPSHOT_RESTING)
+        session.username = username
+        session.first_name = first_name
+        session.user_id = _unpack_int(user_id)
+        session.login_username = login_username
+        session.login_retries = login_retries
+        session.selected_day_id = _unpack_int(day_id)
+        session.exercise_num_set = (exercise_num, set_num)
+        session.workout_id = _unpack_int(workout_id)
+        session.workout_start = workout_start if workout_start >= 0 else None
+        session.next_sequence = next_sequence
+        for exercise_num_set in LOGGED_SET.iter_unpack(data[offset:offset + logged_sets_count * LOGGED_SET.size]):
+            session.logged_sets[exercise_num_set[:2]] = exercise_num_set[2]
+
+        if session.state_machine.get_substate_update_set() != SubStateUpdateSet.NONE:
+            session.updating = ExerciseUpdate().set_values(
+                chat_id=chat_id,
+                exercise_num=_unpack_int(update_exercise_num),
+                set_num=_unpack_int(update_set_num),
+                what_to_update=_unpack_int(what_to_update),
+                value_to_update=_unpack_int(value_to_update)
+            )
+        return session, _unpack_int(program_id)
+
+
+# Snapshot layout: version, state, 3 substates, flags, login_retries, user_id, program_id,
+# day_id, exercise_num, set_num, 4 fields of the pending update, workout_id, workout_start,
+# next_sequence; then username, first_name, login_username and the logged sets, as a count
+# followed by (exercise_num, set_num, sequence) entries.
+# Missing integers are stored as -1, missing strings with length NONE_LENGTH.
+SNAPSHOT_VERSION = 4
+SNAPSHOT_HEADER = struct.Struct("<7Bqqi6iqdi")
+LOGGED_SETS_COUNT = struct.Struct("<I")
+LOGGED_SET = struct.Struct("<HHi")
+SNAPSHOT_REGISTERED = 1
+SNAPSHOT_RESTING = 2
+NONE_LENGTH = 0xFFFF
+STRING_LENGTH = struct.Struct("<H")
+
+def _pack_int(value: int|None) -> int:
+    return -1 if value is None else value
+
+def _unpack_int(value: int) -> int|None:
+    return None if value == -1 else value
+
+def _pack_str(value: str|None) -> bytes:
+    if value is None:
+        return STRING_LENGTH.pack(NONE_LENGTH)
+    encoded = value.encode()[:NONE_LENGTH - 1]
+    return STRING_LENGTH.pack(len(encoded)) + encoded
+
+def _unpack_str(data: bytes, offset: int) -> tuple:
+    (length,) = STRING_LENGTH.unpack_from(data, offset)
+    offset += STRING_LENGTH.size
+    if length == NONE_LENGTH:
+        return None, offset
+    return data[offset:offset + length].decode(errors="replace"), offset + length
+
+
+class SessionStore:
+    """
+    Class keeping the sessions of the active chats in LRU order.
+
+    Sessions idle for longer than idle_ttl, or beyond the max_sessions/max_bytes
+    limits, are evicted lazily when the store is accessed. An evicted session is
+    kept as a compact snapshot, without its program, and handed back through
+    take_dormant() when its chat writes again. Up to max_dormant snapshots are kept.
+    Pinned sessions, those of the updates being handled, are never evicted.
+    """
+    def __init__(self,
+                 idle_ttl: float = 3600.0,
+                 max_sessions: int = 10000,
+                 max_bytes: int = 256 * 1024 * 1024,
+                 max_dormant: int = 100000):
+        self.idle_ttl = float(idle_ttl)
+        self.max_sessions = int(max_sessions)
+        self.max_bytes = int(max_bytes)
+        self.max_dormant = int(max_dormant)
+
+        self.sessions = OrderedDict()  # chat_id : Session, least recently used first
+        self.dormant = OrderedDict()   # chat_id : snapshot bytes of an evicted session
+        self.pinned = {}               # chat_id : number of updates of the chat being handled
+        self.total_bytes = 0
+
+        self.evictions = 0
+        self.rehydrations = 0
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def get(self, chat_id: int) -> Session|None:
+        """
+        Returns the live session of the chat and marks it as recently used
+        """
+        session = self.sessions.get(chat_id)
+        if session is not None:
+            session.last_seen = time.monotonic()
+            self.sessions.move_to_end(chat_id)
+        self.evict()
+        return session
+
+    def add(self, session: Session) -> None:
+        if session.chat_id in self.sessions:
+            self.total_bytes -= self.sessions.pop(session.chat_id).size
+        session.last_seen = time.monotonic()
+        self.sessions[session.chat_id] = session
+        self.total_bytes += session.estimate_size()
+        self.evict()
+
+    def touch(self, session: Session) -> None:
+        """
+        Accounts again for the memory of a session after it changed
+        """
+        if self.sessions.get(session.chat_id) is not session:
+            return
+        previous_size = session.size
+        self.total_bytes += session.estimate_size() - previous_size
+        self.evict()
+
+    def pin(self, session: Session) -> None:
+        """
+        Keeps the session in memory until unpin(): a handler awaiting the database
+        must not lose the session it is changing
+        """
+        self.pinned[session.chat_id] = self.pinned.get(session.chat_id, 0) + 1
+
+    def unpin(self, session: Session) -> None:
+        count = self.pinned.get(session.chat_id, 0) - 1
+        if count > 0:
+            self.pinned[session.chat_id] = count
+        else:
+            self.pinned.pop(session.chat_id, None)
+
+    def take_dormant(self, chat_id: int) -> bytes|None:
+        """
+        Removes and returns the snapshot of an evicted session, if any
+        """
+        snapshot = self.dormant.pop(chat_id, None)
+        if snapshot is not None:
+            self.rehydrations += 1
+        return snapshot
+
+    def evict(self) -> None:
+        """
+        Evicts the expired sessions, then the least recently used ones while over the limits
+        """
+        deadline = time.monotonic() - self.idle_ttl
+        count, total_bytes = len(self.sessions), self.total_bytes
+        victims = []
+        for chat_id, session in self.sessions.items():
+            over_limits = count > self.max_sessions or total_bytes > self.max_bytes
+            if session.last_seen >= deadline and not over_limits:
+                break
+            if chat_id in self.pinned:
+                continue
+            victims.append(chat_id)
+            count -= 1
+            total_bytes -= session.size
+        for chat_id in victims:
+            self.__evict(chat_id)
+
+    def get_stats(self) -> dict:
+        return {
+            "sessions": len(self.sessions),
+            "dormant": len(self.dormant),
+            "bytes": self.total_bytes,
+            "pinned": len(self.pinned),
+            "evictions": self.evictions,
+            "rehydrations": self.rehydrations
+        }
+
+    def __evict(self, chat_id: int) -> None:
+        session = self.sessions.pop(chat_id)
+        self.total_bytes -= session.size
+        self.evictions += 1
+
+        self.dormant[chat_id] = session.snapshot()
+        while len(self.dormant) > self.max_dormant:
+            self.dormant.popitem(last=False)
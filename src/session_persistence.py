@@ -0,0 +1,186 @@
+import asyncio
+import sqlite3
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from psycopg2.extras import execute_values
+
+from session import Session
+
+
+class SessionPersistence:
+    """
+    Base class for the durable storage of session snapshots
+    """
+    async def load(self, chat_id: int) -> bytes|None:
+        raise NotImplementedError
+
+    async def save_many(self, snapshots: List[Tuple[int, bytes]]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteSessionPersistence(SessionPersistence):
+    """
+    Stores the snapshots in a local SQLite file.
+    The connection lives on a single dedicated thread.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sessions")
+        self.conn = self.executor.submit(self.__connect).result()
+
+    def __connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("""
+                     CREATE TABLE IF NOT EXISTS bot_session (
+                         chat_id INTEGER PRIMARY KEY,
+                         data BLOB NOT NULL,
+                         updated_at REAL NOT NULL
+                     );
+                     """)
+        conn.commit()
+        return conn
+
+    async def load(self, chat_id: int) -> bytes|None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.__load, chat_id)
+
+    async def save_many(self, snapshots: List[Tuple[int, bytes]]) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.__save_many, snapshots)
+
+    def __load(self, chat_id: int) -> bytes|None:
+        row = self.conn.execute("SELECT data FROM bot_session WHERE chat_id = ?;", (chat_id,)).fetchone()
+        return bytes(row[0]) if row is not None else None
+
+    def __save_many(self, snapshots: List[Tuple[int, bytes]]) -> None:
+        now = time.time()
+        self.conn.executemany("""
+                              INSERT INTO bot_session (chat_id, data, updated_at) VALUES (?, ?, ?)
+                              ON CONFLICT (chat_id) DO UPDATE
+                              SET data = excluded.data, updated_at = excluded.updated_at;
+                              """, [(chat_id, data, now) for chat_id, data in snapshots])
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.executor.submit(self.conn.close).result()
+        self.executor.shutdown(wait=True)
+
+
+class PostgresSessionPersistence(SessionPersistence):
+    """
+    Stores the snapshots in the bot_session table of the application database
+    """
+    def __init__(self, database):
+        self.database = database
+
+    async def load(self, chat_id: int) -> bytes|None:
+        row = await self.database.pool.fetchone("SELECT data FROM bot_session WHERE chat_id = %s;", (chat_id,))
+        return bytes(row[0]) if row is not None else None
+
+    async def save_many(self, snapshots: List[Tuple[int, bytes]]) -> None:
+        await self.database.pool.run(_upsert_snapshots, snapshots)
+
+
+def _upsert_snapshots(cursor, snapshots: List[Tuple[int, bytes]]) -> None:
+    execute_values(cursor, """
+                   INSERT INTO bot_session (chat_id, data) VALUES %s
+                   ON CONFLICT (chat_id) DO UPDATE
+                   SET data = EXCLUDED.data, updated_at = CURRENT_TIMESTAMP;
+                   """, snapshots)
+
+
+class SessionWriter:
+    """
+    Write-behind buffer between the sessions and their persistence.
+    Changed sessions are only marked; their snapshots are taken and written in
+    one batch every flush_interval seconds, or earlier once batch_size are pending.
+    """
+    def __init__(self, persistence: SessionPersistence, flush_interval: float = 2.0, batch_size: int = 500):
+        self.persistence = persistence
+        self.flush_interval = float(flush_interval)
+        self.batch_size = int(batch_size)
+
+        self.pending = {}  # chat_id : Session, latest state wins
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+        self.flushes = 0
+        self.written = 0
+        self.errors = 0
+
+    def mark_dirty(self, session: Session) -> None:
+        self.pending[session.chat_id] = session
+        if len(self.pending) >= self.batch_size:
+            self.wakeup.set()
+
+    async def load(self, chat_id: int) -> bytes|None:
+        """
+        Returns the persisted snapshot of a chat, or the pending one if not written yet
+        """
+        session = self.pending.get(chat_id)
+        if session is not None:
+            return session.snapshot()
+        try:
+            return await self.persistence.load(chat_id)
+        except Exception as e:
+            print(f"Error loading session {chat_id}: {e}")
+            return None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.__run())
+
+    async def stop(self) -> None:
+        """
+        Stops the background task and writes what is still pending
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+        self.persistence.close()
+
+    async def flush(self) -> None:
+        if len(self.pending) == 0:
+            return
+
+        pending, self.pending = self.pending, {}
+        snapshots = [(chat_id, session.snapshot()) for chat_id, session in pending.items()]
+        try:
+            await self.persistence.save_many(snapshots)
+            self.flushes += 1
+            self.written += len(snapshots)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error writing {len(snapshots)} session(s): {e}")
+            # Keep them for the next flush, unless they changed again meanwhile
+            for chat_id, session in pending.items():
+                self.pending.setdefault(chat_id, session)
+
+    def get_stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "written": self.written,
+            "errors": self.errors
+        }
+
+    async def __run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
@@ -0,0 +1,138 @@
+import re
+
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from program_classes import Exercise, MAX_SHORT, MAX_WEIGHT, WEIGHT_DIGITS
+
+SYNTAX_HELP = (
+    "An expression is <field><op><value> [sets], e.g. \"w+2.5 s1-4\", \"reps=8 all\" or \"rest*0.9 s2,3\".\n"
+    "Fields: w/weight, r/reps, rest. Operators: + - * =. Sets: all (default), s2, s1-3, s1,3-4.\n"
+    "Several updates can be separated by \";\"."
+)
+
+FIELDS = {
+    "w": "weight",
+    "weight": "weight",
+    "r": "reps",
+    "reps": "reps",
+    "rest": "rest"
+}
+
+CLAUSE = re.compile(r"^(?P<field>[a-z]+)\s*(?P<op>[-+*=])\s*(?P<value>\d+(?:\.\d+)?|\.\d+)"
+                    r"(?:\s+(?P<sets>all|s[\d\s,-]+))?$")
+SET_RANGE = re.compile(r"^(\d+)(?:-(\d+))?$")
+# Set numbers above this are refused before expanding ranges such as s1-1000000000
+MAX_SET_NUMBER = 1000
+
+
+class Assignment:
+    """
+    One clause of an expression: field op value, on some sets (all if sets is None)
+    """
+    __slots__ = ("field", "op", "value", "sets")
+
+    def __init__(self, field: str, op: str, value: float, sets: Tuple[int, ...]|None):
+        self.field = field
+        self.op = op
+        self.value = value
+        self.sets = sets
+
+    def apply(self, current: float|int|None, set_number: int) -> float|int:
+        if self.op == "=":
+            result = self.value
+        elif current is None:
+            raise ValueError(f"Set {set_number} has no {self.field} to change")
+        elif self.op == "+":
+            result = current + self.value
+        elif self.op == "-":
+            result = current - self.value
+        else:
+            result = current * self.value
+
+        if result < 0:
+            raise ValueError(f"Set {set_number}: {self.field} can't be negative")
+        if self.field == "weight":
+            # Rounded to the decimals workout_set.weight keeps, so the database doesn't round it again
+            result = round(result, WEIGHT_DIGITS)
+            if result > MAX_WEIGHT:
+                raise ValueError(f"Set {set_number}: weight too large")
+            return result
+        result = int(round(result))
+        if result > MAX_SHORT:
+            raise ValueError(f"Set {set_number}: {self.field} too large")
+        return result
+
+
+class ExpressionPlan:
+    """
+    Compiled form of an expression updating the sets of an exercise.
+    Assignments are applied in order, so "w+5; w*0.9" works on the value left by the first one.
+    """
+    __slots__ = ("expression", "assignments")
+
+    def __init__(self, expression: str, assignments: List[Assignment]):
+        self.expression = expression
+        self.assignments = assignments
+
+    def evaluate(self, exercise: Exercise) -> Dict[int, Dict[str, float|int]]:
+        """
+        Returns the new values of the sets changed by the plan, {set number: {field: value}},
+        without modifying the exercise. Raises ValueError if the plan doesn't fit the exercise.
+        """
+        num_sets = exercise.get_num_sets()
+        changes = {}
+        for assignment in self.assignments:
+            set_numbers = range(1, num_sets + 1) if assignment.sets is None else assignment.sets
+            for set_number in set_numbers:
+                if set_number > num_sets:
+                    raise ValueError(f"{exercise.name} has only {num_sets} set(s)")
+                values = changes.setdefault(set_number, {})
+                current = values.get(assignment.field)
+                if current is None:
+                    current = getattr(exercise.get_set(set_number), assignment.field)
+                values[assignment.field] = assignment.apply(current, set_number)
+        return changes
+
+    def to_string(self) -> str:
+        return self.expression
+
+
+@lru_cache(maxsize=256)
+def compile_expression(expression: str) -> ExpressionPlan:
+    """
+    Parses an expression such as "w+2.5 s1-4; reps=8 all" into a plan.
+    Raises ValueError on syntax errors. Plans are cached by expression.
+    """
+    assignments = []
+    for clause in expression.lower().split(";"):
+        clause = clause.strip()
+        if not clause:
+            continue
+        match = CLAUSE.match(clause)
+        if match is None or match.group("field") not in FIELDS:
+            raise ValueError(f"Invalid update: {clause!r}")
+        assignments.append(Assignment(
+            field=FIELDS[match.group("field")],
+            op=match.group("op"),
+            value=float(match.group("value")),
+            sets=_parse_sets(match.group("sets"))
+        ))
+    if len(assignments) == 0:
+        raise ValueError("Empty expression")
+    return ExpressionPlan(expression, assignments)
+
+def _parse_sets(sets: str|None) -> Tuple[int, ...]|None:
+    if sets is None or sets == "all":
+        return None
+    numbers = set()
+    for part in sets[1:].replace(" ", "").split(","):
+        match = SET_RANGE.match(part)
+        if match is None:
+            raise ValueError(f"Invalid sets: {sets!r}")
+        first = int(match.group(1))
+        last = int(match.group(2) or first)
+        if first < 1 or last < first or last > MAX_SET_NUMBER:
+            raise ValueError(f"Invalid sets: {sets!r}")
+        numbers.update(range(first, last + 1))
+    return tuple(sorted(numbers))
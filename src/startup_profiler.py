@@ -0,0 +1,95 @@
+import importlib.abc
+import sys
+import time
+
+from contextlib import contextmanager
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """
+    Wraps the loader of a module to time its execution
+    """
+    def __init__(self, loader, profiler):
+        self.loader = loader
+        self.profiler = profiler
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.profiler.enter()
+        started = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.profiler.leave(module.__name__, time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+
+class StartupProfiler(importlib.abc.MetaPathFinder):
+    """
+    Measures the cold start of the bot: the time spent importing every module,
+    on its own and with the modules it imports, and the time of the initialization steps.
+    Only modules imported after install() are seen.
+    """
+    def __init__(self):
+        self.imports = {}   # module name : (cumulative seconds, self seconds)
+        self.children = []  # time spent in nested imports, one entry per import in progress
+        self.steps = []     # (step name, seconds)
+        self.started = time.perf_counter()
+
+    def install(self) -> None:
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        # Ask the finders after this one, then time the loader they found
+        for finder in sys.meta_path[sys.meta_path.index(self) + 1:]:
+            find_spec = getattr(finder, "find_spec", None)
+            if find_spec is None:
+                continue
+            spec = find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(spec.loader, self)
+            return spec
+        return None
+
+    def enter(self) -> None:
+        self.children.append(0.0)
+
+    def leave(self, name: str, elapsed: float) -> None:
+        nested = self.children.pop()
+        self.imports[name] = (elapsed, elapsed - nested)
+        if len(self.children) > 0:
+            self.children[-1] += elapsed
+
+    @contextmanager
+    def step(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - started))
+
+    def report(self, top: int = 25) -> str:
+        total = time.perf_counter() - self.started
+        lines = [f"Startup: {total * 1000:.1f} ms", "", "Steps:"]
+        for name, elapsed in self.steps:
+            lines.append(f"  {elapsed * 1000:>9.1f} ms  {name}")
+
+        lines += ["", f"Imports ({len(self.imports)} modules, slowest {top} by cumulative time):",
+                  f"  {'cumulative':>12} {'self':>10}  module"]
+        ranked = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)
+        for name, (cumulative, own) in ranked[:top]:
+            lines.append(f"  {cumulative * 1000:>9.1f} ms {own * 1000:>7.1f} ms  {name}")
+
+        heavy = [name for name in ("pandas", "numpy", "matplotlib") if name in sys.modules]
+        lines += ["", "Analytics modules loaded: " + (", ".join(heavy) if heavy else "none")]
+        return "\n".join(lines)
@@ -27,6 +27,8 @@ class SubStateUpdateExercise(Enum):
     TYPE_EXPRESSION = 1   # User types the expression for updating the exercise
 
 class StateMachine:
+    __slots__ = ("state", "substate_update_set", "substate_update_exercise", "substate_login")
+
     def __init__(self):
         self.state = State.DEAD
         self.substate_update_set = SubStateUpdateSet.NONE
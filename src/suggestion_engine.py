@@ -0,0 +1,122 @@
+import data_handling
+
+from typing import List, Tuple
+
+from program_classes import MAX_WEIGHT, WEIGHT_DIGITS
+
+REASONS = {
+    "weight": "all sets reached {rep_max} reps, add weight",
+    "reps": "stay in {rep_min}-{rep_max} reps, add a rep",
+    "deload": "below {rep_min} reps, lighten the load"
+}
+
+
+class SuggestionEngine:
+    """
+    Computes the next session targets of every exercise with double progression:
+    the reps of the working sets (those at the top weight of the latest workout)
+    go up to rep_max at the same weight, then the weight goes up by weight_step
+    and the reps start again from rep_min. Below rep_min the weight goes down.
+    When the reps drop by fatigue_reps or more from the first working set to the
+    last one, the rest is lengthened by rest_step seconds.
+
+    All the users are computed together, vectorized over one frame of their latest
+    sets, and the results are stored in exercise_suggestion for /suggestions.
+    """
+    def __init__(self, database, rep_min: int = 8, rep_max: int = 12, weight_step: float = 2.5,
+                 fatigue_reps: int = 3, rest_step: int = 30):
+        if rep_min < 1 or rep_max < rep_min:
+            raise ValueError(f"Invalid rep range: {rep_min}-{rep_max}")
+        if weight_step <= 0:
+            raise ValueError("The weight step must be positive")
+
+        self.database = database
+        self.rep_min = int(rep_min)
+        self.rep_max = int(rep_max)
+        self.weight_step = float(weight_step)
+        self.fatigue_reps = int(fatigue_reps)
+        self.rest_step = int(rest_step)
+
+    async def run(self, user_id: int|None = None, full: bool = False) -> int|None:
+        """
+        Updates the suggestions of the exercises trained since they were computed
+        (all of them if full), for one user or for everyone.
+        Returns the number of suggestions written, None on error.
+        """
+        latest_sets = await self.database.get_latest_sets(user_id=user_id, full=full)
+        if latest_sets is None:
+            return None
+        suggestions = self.compute(latest_sets)
+        if not await self.database.store_suggestions(suggestions):
+            return None
+        return len(suggestions)
+
+    def compute(self, latest_sets: dict) -> List[Tuple]:
+        """
+        Returns (user_id, exercise_id, workout_id, weight, reps, rest, reason)
+        for every exercise in the columns of latest_sets
+        """
+        if len(latest_sets["user_id"]) == 0:
+            return []
+        data_handling.load_analytics()
+        pd, np = data_handling.pd, data_handling.np
+
+        sets = pd.DataFrame({
+            "user_id": np.asarray(latest_sets["user_id"], dtype=np.int64),
+            "exercise_id": np.asarray(latest_sets["exercise_id"], dtype=np.int64),
+            "workout_id": np.asarray(latest_sets["workout_id"], dtype=np.int64),
+            "weight": np.asarray(latest_sets["weight"], dtype=np.float64),
+            "reps": np.asarray(latest_sets["reps"], dtype=np.int64),
+            "rest": np.asarray(latest_sets["rest"], dtype=np.int64)
+        })
+        keys = ["user_id", "exercise_id"]
+
+        # Warm-up sets are lighter than the top weight
+        working = sets[sets["weight"] == sets.groupby(keys)["weight"].transform("max")]
+        last = working.groupby(keys).agg(
+            workout_id=("workout_id", "first"),
+            weight=("weight", "first"),
+            min_reps=("reps", "min"),
+            first_reps=("reps", "first"),
+            last_reps=("reps", "last"),
+            rest=("rest", "median")
+        )
+
+        progress = (last["min_reps"] >= self.rep_max).to_numpy()
+        deload = (last["min_reps"] < self.rep_min).to_numpy()
+        weight = last["weight"].to_numpy()
+
+        new_weight = np.where(progress, weight + self.weight_step,
+                              np.where(deload, np.maximum(weight - self.weight_step, 0.0), weight))
+        new_reps = np.where(progress | deload, self.rep_min,
+                            np.minimum(last["min_reps"].to_numpy() + 1, self.rep_max))
+        # Within the range and decimals of workout_set.weight, so a suggestion can be logged as is
+        new_weight = np.round(np.minimum(new_weight, MAX_WEIGHT), WEIGHT_DIGITS)
+        fatigued = (last["first_reps"] - last["last_reps"]).to_numpy() >= self.fatigue_reps
+        new_rest = np.rint(last["rest"].to_numpy()).astype(np.int64) + np.where(fatigued, self.rest_step, 0)
+        reason = np.select([progress, deload], ["weight", "deload"], default="reps")
+
+        return list(zip(
+            last.index.get_level_values("user_id").tolist(),
+            last.index.get_level_values("exercise_id").tolist(),
+            last["workout_id"].tolist(),
+            new_weight.tolist(),
+            new_reps.tolist(),
+            new_rest.tolist(),
+            reason.tolist()
+        ))
+
+    def format_suggestions(self, rows: List[Tuple]) -> str:
+        """
+        Returns the text of the suggestions read by Database.get_suggestions
+        """
+        if len(rows) == 0:
+            return "No suggestions yet: they are computed after your workouts are logged."
+
+        lines = ["Next session:"]
+        for name, weight, reps, rest, reason, _ in rows:
+            hint = REASONS.get(reason, "").format(rep_min=self.rep_min, rep_max=self.rep_max)
+            lines.append(f"  {name}: {weight:g} kg x {reps}, rest {rest}s ({hint})")
+        lines.append("")
+        lines.append(f"Computed on {max(row[5] for row in rows):%Y-%m-%d %H:%M}")
+        return "\n".join(lines)
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+from collections import deque
+
+
+class ChatDispatcher:
+    """
+    Runs the handling of the updates of different chats concurrently,
+    keeping the updates of a single chat in the order they arrived.
+
+    Each chat with queued updates has one worker task, which handles them one at a time.
+    At most max_concurrency updates are handled at once across all the chats; a worker
+    gives its slot back after every update, so a busy chat cannot starve the others.
+    A chat already holding max_queue_depth waiting updates gets the new ones rejected.
+    """
+    def __init__(self, max_concurrency: int = 32, max_queue_depth: int = 20):
+        self.max_concurrency = int(max_concurrency)
+        self.max_queue_depth = int(max_queue_depth)
+
+        self.slots = asyncio.Semaphore(self.max_concurrency)
+        self.queues = {}   # chat_id : deque of (handler, args) waiting, for the chats with a worker
+        self.workers = {}  # chat_id : worker task
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+        self.in_flight = 0
+        self.queued = 0
+        self.dispatched = 0
+        self.rejected = 0
+        self.errors = 0
+        self.max_queued = 0
+
+    def submit(self, chat_id: int, handler, *args) -> bool:
+        """
+        Queues handler(*args) after the updates of the chat already queued.
+        Returns False if the queue of the chat is full.
+        """
+        queue = self.queues.get(chat_id)
+        if queue is None:
+            queue = self.queues[chat_id] = deque()
+        elif len(queue) >= self.max_queue_depth:
+            self.rejected += 1
+            return False
+
+        queue.append((handler, args))
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        if chat_id not in self.workers:
+            self.idle.clear()
+            self.workers[chat_id] = asyncio.create_task(self.__work(chat_id, queue))
+        return True
+
+    def get_pending(self) -> int:
+        """
+        Returns the number of updates queued or being handled
+        """
+        return self.queued + self.in_flight
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """
+        Waits for the queued updates to be handled, then cancels what is left
+        """
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"Dispatcher stop timed out with {self.get_pending()} update(s) pending")
+            for task in list(self.workers.values()):
+                task.cancel()
+            await asyncio.gather(*self.workers.values(), return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "active_chats": len(self.workers),
+            "dispatched": self.dispatched,
+            "rejected": self.rejected,
+            "errors": self.errors
+        }
+
+    async def __work(self, chat_id: int, queue: deque) -> None:
+        try:
+            while len(queue) > 0:
+                async with self.slots:
+                    handler, args = queue.popleft()
+                    self.queued -= 1
+                    self.in_flight += 1
+                    started = time.monotonic()
+                    try:
+                        await handler(*args)
+                    except Exception as e:
+                        self.errors += 1
+                        print(f"Error handling update of chat {chat_id} "
+                              f"after {time.monotonic() - started:.3f}s: {e}")
+                    finally:
+                        self.in_flight -= 1
+                        self.dispatched += 1
+        finally:
+            # Updates left behind by a cancellation are dropped
+            self.queued -= len(queue)
+            del self.queues[chat_id]
+            del self.workers[chat_id]
+            if len(self.workers) == 0:
+                self.idle.set()
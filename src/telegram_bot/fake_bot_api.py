@@ -0,0 +1,109 @@
+import argparse
+import itertools
+import json
+import time
+
+import aiohttp
+from aiohttp import web
+
+
+class FakeBotApi:
+    """
+    Local stand-in for the Telegram Bot API, to run the bot end to end without Telegram.
+
+    The bot talks to it when started with BOT_API_URL=http://<host>:<port>/bot.
+    Methods called by the bot are answered with plausible results and recorded;
+    GET /fake/calls returns them. POST /fake/message {"chat_id": ..., "text": ...}
+    delivers a text message to the registered webhook, like Telegram would.
+    """
+    def __init__(self):
+        self.calls = []
+        self.webhook_url = None
+        self.secret_token = None
+        self.message_ids = itertools.count(1)
+        self.update_ids = itertools.count(1)
+
+        self.web_app = web.Application()
+        self.web_app.router.add_post("/bot{token}/{method}", self.handle_method)
+        self.web_app.router.add_get("/fake/calls", self.handle_calls)
+        self.web_app.router.add_post("/fake/message", self.handle_fake_message)
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = {key: _decode(value) for key, value in (await request.post()).items()}
+        self.calls.append({"method": method, "params": params})
+
+        if method == "getMe":
+            return _ok({"id": 1, "is_bot": True, "first_name": "gymBot", "username": "gym_bot"})
+        if method == "setWebhook":
+            self.webhook_url = params.get("url")
+            self.secret_token = params.get("secret_token")
+            return _ok(True)
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return _ok(True)
+        if method in ("sendMessage", "editMessageText", "sendPhoto"):
+            return _ok(self.__message(chat_id=params.get("chat_id"), text=params.get("text")))
+        return _ok(True)
+
+    async def handle_calls(self, request: web.Request) -> web.Response:
+        return web.json_response(self.calls)
+
+    async def handle_fake_message(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if self.webhook_url is None:
+            return web.Response(status=409, text="no webhook set")
+
+        chat_id = int(body["chat_id"])
+        update = {
+            "update_id": next(self.update_ids),
+            "message": {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "Test", "username": f"user{chat_id}"},
+                "text": body["text"]
+            }
+        }
+        headers = {}
+        if self.secret_token is not None:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.secret_token
+        async with aiohttp.ClientSession() as client:
+            async with client.post(self.webhook_url, json=update, headers=headers) as response:
+                return web.json_response({"update_id": update["update_id"], "webhook_status": response.status})
+
+    def __message(self, chat_id, text) -> dict:
+        return {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id) if chat_id is not None else 0, "type": "private"},
+            "text": text
+        }
+
+
+def _ok(result) -> web.Response:
+    return web.json_response({"ok": True, "result": result})
+
+def _decode(value):
+    # Objects like reply_markup are sent JSON encoded in form parameters
+    if isinstance(value, str) and value[:1] in ("{", "["):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API for local end to end runs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    web.run_app(FakeBotApi().web_app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import asyncio
+import contextvars
+import time
+
+from telegram import ReplyKeyboardMarkup
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+
+MAX_MESSAGE_LENGTH = 4096
+
+# Messages produced by the handler invocation running in the current task, not sent yet
+_outbox = contextvars.ContextVar("outbox", default=None)
+
+
+class TokenBucket:
+    """
+    Token bucket handing out reservations: take() returns how long to wait before using the token
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        self.__refill()
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def is_full(self) -> bool:
+        self.__refill()
+        return self.tokens >= self.capacity
+
+    def __refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class _ChatChannel:
+    __slots__ = ("bucket", "lock", "users")
+
+    def __init__(self, rate: float, capacity: float):
+        self.bucket = TokenBucket(rate, capacity)
+        self.lock = asyncio.Lock()  # FIFO, keeps the calls to a chat in order
+        self.users = 0
+
+
+class OutboundScheduler:
+    """
+    Class every call to the Bot API goes through.
+
+    Calls are paced by a global token bucket and one per chat, following the limits
+    of Telegram (about 30 messages per second overall, 1 per second in a chat).
+    A RetryAfter answer holds the calls of that chat for the time asked, up to
+    max_flood_wait seconds per call, network errors are retried with backoff; the
+    other errors reach the caller.
+
+    Between collect() and release() the texts sent are held in an outbox instead, and
+    consecutive ones to the same chat are merged into a single message.
+    """
+    def __init__(self,
+                 bot,
+                 global_rate: float = 30.0,
+                 global_burst: int = 30,
+                 chat_rate: float = 1.0,
+                 chat_burst: int = 3,
+                 max_retries: int = 3,
+                 max_flood_wait: float = 60.0,
+                 max_idle_chats: int = 1000):
+        self.bot = bot
+        self.chat_rate = float(chat_rate)
+        self.chat_burst = int(chat_burst)
+        self.max_retries = int(max_retries)
+        self.max_flood_wait = float(max_flood_wait)
+        self.max_idle_chats = int(max_idle_chats)
+
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chats = {}  # chat_id : _ChatChannel
+
+        self.calls = 0
+        self.merged = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.failed = 0
+        self.throttled_seconds = 0.0
+
+    def collect(self) -> contextvars.Token:
+        """
+        Starts holding the texts sent from the current task until release()
+        """
+        return _outbox.set([])
+
+    async def release(self, token: contextvars.Token) -> None:
+        """
+        Sends the texts held since collect(). Failures are reported, not raised.
+        """
+        outbox = _outbox.get()
+        _outbox.reset(token)
+        await self.__send_outbox(outbox)
+
+    async def send_message(self, chat_id: int, text: str, markup=None):
+        """
+        Sends a text, or adds it to the outbox when collecting.
+        Returns the message sent, None if held or failed.
+        """
+        outbox = _outbox.get()
+        if outbox is None:
+            try:
+                return await self.call(chat_id, self.bot.send_message, chat_id=chat_id, text=text, reply_markup=markup)
+            except Exception as e:
+                self.failed += 1
+                print(f"Error sending message to chat {chat_id}: {e}")
+                return None
+
+        if len(outbox) > 0 and _can_merge(outbox[-1], chat_id, text):
+            last = outbox[-1]
+            last[1] = last[1] + "\n\n" + text
+            if markup is not None:
+                last[2] = markup
+            self.merged += 1
+        else:
+            outbox.append([chat_id, text, markup])
+        return None
+
+    async def call(self, chat_id: int, method, /, **kwargs):
+        """
+        Calls a Bot API method about the given chat, e.g. call(chat_id, bot.edit_message_text, ...).
+        The texts held for the chat are sent first, to keep the order.
+        """
+        outbox = _outbox.get()
+        if outbox:
+            held = [entry for entry in outbox if entry[0] == chat_id]
+            if len(held) > 0:
+                outbox[:] = [entry for entry in outbox if entry[0] != chat_id]
+                await self.__send_outbox(held)
+
+        channel = self.__channel(chat_id)
+        channel.users += 1
+        try:
+            async with channel.lock:
+                return await self.__call_paced(channel, method, kwargs)
+        finally:
+            channel.users -= 1
+
+    def get_stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "merged": self.merged,
+            "retries": self.retries,
+            "flood_waits": self.flood_waits,
+            "failed": self.failed,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "chats": len(self.chats)
+        }
+
+    async def __call_paced(self, channel: _ChatChannel, method, kwargs: dict):
+        attempt = 0
+        flood_wait = 0.0
+        while True:
+            delay = max(channel.bucket.take(), self.global_bucket.take())
+            if delay > 0:
+                self.throttled_seconds += delay
+                await asyncio.sleep(delay)
+            try:
+                self.calls += 1
+                return await method(**kwargs)
+            except RetryAfter as e:
+                # Flood control: wait as long as asked, this does not count as a retry
+                flood_wait += _seconds(e.retry_after)
+                if flood_wait > self.max_flood_wait:
+                    raise
+                self.flood_waits += 1
+                await asyncio.sleep(_seconds(e.retry_after))
+            except BadRequest:
+                raise
+            except NetworkError:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+
+    async def __send_outbox(self, outbox: list) -> None:
+        for chat_id, text, markup in outbox:
+            try:
+                await self.call(chat_id, self.bot.send_message, chat_id=chat_id, text=text, reply_markup=markup)
+            except Exception as e:
+                self.failed += 1
+                print(f"Error sending message to chat {chat_id}: {e}")
+
+    def __channel(self, chat_id: int) -> _ChatChannel:
+        channel = self.chats.get(chat_id)
+        if channel is None:
+            if len(self.chats) >= self.max_idle_chats:
+                # Forget the chats that could send a full burst anyway
+                for idle_chat_id in [key for key, value in self.chats.items()
+                                     if value.users == 0 and value.bucket.is_full()]:
+                    del self.chats[idle_chat_id]
+            channel = self.chats[chat_id] = _ChatChannel(self.chat_rate, self.chat_burst)
+        return channel
+
+
+def _can_merge(entry: list, chat_id: int, text: str) -> bool:
+    # Inline keyboards belong to their message, reply keyboards to the chat
+    return (entry[0] == chat_id
+            and (entry[2] is None or isinstance(entry[2], ReplyKeyboardMarkup))
+            and len(entry[1]) + 2 + len(text) <= MAX_MESSAGE_LENGTH)
+
+def _seconds(retry_after) -> float:
+    # An int before python-telegram-bot 21, optionally a timedelta after
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
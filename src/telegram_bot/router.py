@@ -0,0 +1,119 @@
+import inspect
+
+from state_machine import State, StateMachine
+from telegram_bot.state_handlers.state_graph import STATE_CLASS_REGISTRY, STATE_SUCCESSIONS
+
+
+def first_token(text: str|None) -> str:
+    """
+    Returns the command of a message: its first word, without the @botname suffix.
+    Only the token is sliced out, the rest of the text is never split.
+    """
+    if not text:
+        return ""
+    if text[0].isspace():
+        text = text.lstrip()
+    end = len(text)
+    for separator in (" ", "\n", "\t"):
+        position = text.find(separator, 0, end)
+        if position != -1:
+            end = position
+    if text[0] == "/":
+        at = text.find("@", 1, end)
+        if at != -1:
+            end = at
+    return text[:end]
+
+
+class Router:
+    """
+    Compiled routing table (State, substate) -> (command -> coroutine, fallback coroutine).
+
+    It is built once from the routes declared by the state handlers and validated:
+    every state needs a handler, every state must be reachable in the StateGraph and
+    every substate a handler dispatches on needs a route. A message is then routed
+    with two dict lookups, whatever the state.
+    """
+    def __init__(self, handlers: dict):
+        self.table = {}        # (State, substate) : (commands, fallback)
+        self.substate_of = {}  # State : function returning the substate of a StateMachine
+
+        problems = self.__check_graph(handlers)
+        for state, handler in handlers.items():
+            self.substate_of[state] = handler.get_substate
+            problems += self.__compile(state, handler)
+        if len(problems) > 0:
+            raise ValueError("Invalid routing table:\n  " + "\n  ".join(problems))
+
+    def resolve(self, state_machine: StateMachine, text: str|None):
+        """
+        Returns the coroutine handling text in the current state of state_machine
+        """
+        state = state_machine.state
+        commands, fallback = self.table[(state, self.substate_of[state](state_machine))]
+        if not commands:
+            return fallback
+        return commands.get(first_token(text), fallback)
+
+    def get_stats(self) -> dict:
+        return {
+            "routes": len(self.table),
+            "commands": sum(len(commands) for commands, _ in self.table.values())
+        }
+
+    def __compile(self, state: State, handler) -> list:
+        problems = []
+        routes = handler.get_routes()
+
+        for substate in handler.substates:
+            if substate not in routes:
+                problems.append(f"{state.name}: no route for substate {substate}")
+        for substate, commands in routes.items():
+            if substate not in handler.substates:
+                problems.append(f"{state.name}: unreachable route for substate {substate}")
+                continue
+
+            fallback = commands.get(None)
+            compiled = {}
+            for command, callback in commands.items():
+                if not inspect.iscoroutinefunction(callback):
+                    problems.append(f"{state.name}/{substate}: {command} is not handled by a coroutine")
+                if command is None:
+                    continue
+                if command[:1] != "/" or first_token(command) != command:
+                    problems.append(f"{state.name}/{substate}: invalid command {command!r}")
+                compiled[command] = callback
+            if fallback is None:
+                problems.append(f"{state.name}/{substate}: no fallback for unknown commands")
+            self.table[(state, substate)] = (compiled, fallback)
+        return problems
+
+    def __check_graph(self, handlers: dict) -> list:
+        problems = []
+        for state in State:
+            if state not in handlers:
+                problems.append(f"{state.name}: no handler")
+
+        names = {}
+        for state, handler in handlers.items():
+            name = handler.to_string()
+            names[name] = state
+            class_path = STATE_CLASS_REGISTRY.get(name)
+            expected = f"{type(handler).__module__}.{type(handler).__name__}"
+            if class_path != expected:
+                problems.append(f"{state.name}: handler {expected} registered as {class_path}")
+
+        for name, next_name in STATE_SUCCESSIONS.items():
+            if next_name not in STATE_CLASS_REGISTRY:
+                problems.append(f"{name}: unknown next state {next_name}")
+
+        # Every state must be reachable from the initial one
+        reached = set()
+        name = "dead"
+        while name is not None and name not in reached:
+            reached.add(name)
+            name = STATE_SUCCESSIONS.get(name)
+        for name in STATE_CLASS_REGISTRY:
+            if name not in reached:
+                problems.append(f"{name}: unreachable state")
+        return problems
@@ -1,25 +1,39 @@
-from telegram import Update
-from telegram.ext import CallbackContext
-
 from telegram_bot.state_handlers.state_graph import StateGraph
+from telegram_bot.state_handlers.handler_context import HandlerContext
 
 class BaseStateHandler:
     def __init__(self, bot):
         self.bot = bot
         self.next_state = None
-        self.update = None
-        self.context = None
         self.callbacks = {}
 
     def to_string(self):
         return "base"
 
-    async def default_handler(self, message):
+    # Substates the handler dispatches on, None when it does not look at them
+    substates = (None,)
+
+    def get_substate(self, state_machine):
+        """
+        Returns the substate the message is routed on
+        """
+        return None
+
+    def get_routes(self) -> dict:
+        """
+        Returns {substate: {command: coroutine}}, compiled into the Router by the bot.
+        The None command takes the messages matching no other command.
+        Callbacks get everything about the update in ctx, never on self,
+        since a single handler instance serves all the chats.
+        """
+        return {None: {**self.callbacks, None: self.default_handler}}
+
+    async def default_handler(self, ctx: HandlerContext):
         """
         Default handler for all states
         """
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=ctx.chat_id,
             text="Invalid command. Please try again."
         )
 
@@ -1,5 +1,3 @@
-from telegram import Update
-from telegram.ext import CallbackContext
 from telegram_bot.state_handlers.base_handler import BaseStateHandler
 from state_machine import State, SubStateLogin
 
@@ -21,107 +19,97 @@ class DeadStateHandler(BaseStateHandler):
     def to_string(self):
         return "dead"
 
-    async def handle_message(self, update: Update, context: CallbackContext):
-        # Get message
-        self.update = update
-        self.context = context
-
-        command = update.message.text.split()[0]
-
-        await self.callbacks.get(command, super().default_handler)(message=update.message)
-
     # Callbacks
-    async def start(self, message):
+    async def start(self, ctx):
         """
         Handles /start command and shows a reply keyboard.
         """
-        self.bot.state_machine[message.chat.id].set_state(State.LOGIN)
-        self.bot.state_machine[message.chat.id].set_substate_login(SubStateLogin.NONE)
+        ctx.session.state_machine.set_state(State.LOGIN)
+        ctx.session.state_machine.set_substate_login(SubStateLogin.NONE)
 
         self.bot.add_user(
-            user_id=message.chat.id,
-            chat_id=message.chat.id,
-            username=message.from_user.username,
-            first_name=message.from_user.first_name
+            session=ctx.session,
+            username=ctx.update.effective_user.username,
+            first_name=ctx.update.effective_user.first_name
         )
 
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=ctx.chat_id,
             text="Welcome! Please enter your username to register."
         )
 
-    async def help(self, message):
+    async def help(self, ctx):
         """
         Handles /help command
         """
 
-        if not self.bot.is_user_registered(message.chat.id):
+        if not self.bot.is_user_registered(ctx.session):
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="You are not registered. Please use /start to register."
             )
             return
 
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=ctx.chat_id,
             text="TODO"
         )
     
-    async def authenticate(self, message):
+    async def authenticate(self, ctx):
         """
         Handles /auth command
         """
         
-        if not self.bot.is_user_registered(message.chat.id):
+        if not self.bot.is_user_registered(ctx.session):
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="You are not registered. Please use /start to register."
             )
             return
 
-        self.bot.state_machine[message.chat.id].set_state(State.LOGIN)
-        self.bot.state_machine[message.chat.id].set_substate_login(SubStateLogin.NONE)
+        ctx.session.state_machine.set_state(State.LOGIN)
+        ctx.session.state_machine.set_substate_login(SubStateLogin.NONE)
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=ctx.chat_id,
             text="Please enter your username"
         )
 
-    async def commands(self, message):
+    async def commands(self, ctx):
         """
         Handles /commands command
         """
 
-        if not self.bot.is_user_registered(message.chat.id):
+        if not self.bot.is_user_registered(ctx.session):
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="You are not registered. Please use /start to register."
             )
             return
         
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=ctx.chat_id,
             text="Here are the available commands:\n\n- /help\n- /auth\n- /commands\n- /settings",
             markup_keyboard=get_reply_markup(self.next_state)
         )
     
-    async def settings(self, message):
+    async def settings(self, ctx):
         """
         Handles /settings command
         """
 
-        if not self.bot.is_user_registered(message.chat.id):
+        if not self.bot.is_user_registered(ctx.session):
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="You are not registered. Please use /start to register."
             )
             return
         
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=ctx.chat_id,
             text="Here are the available settings:\n\n- /help\n- /auth\n- /commands\n- /settings"
         )
 
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=ctx.chat_id,
             text="Setting not implemented yet TODO ??"
         )
\ No newline at end of file
@@ -1,6 +1,3 @@
-from telegram import Update
-from telegram.ext import CallbackContext
-
 from telegram_bot.state_handlers.base_handler import BaseStateHandler
 
 from state_machine import State
@@ -20,43 +17,24 @@ class EndStateHandler(BaseStateHandler):
     def to_string(self):
         return "end"
     
-    async def handle_message(self, update: Update, context: CallbackContext):
-        
-        self.update = update
-        self.context = context
-
-        message = update.message
-
-        command = message.text.split()[0]
-
-        await self.callbacks.get(command, super().default_handler)(message=message)
-    
-    async def quit(self, message):
+    async def quit(self, ctx):
         """
         Handles the /quit command.
         """
-        self.bot.state_machine[message.chat.id].set_state(State.AUTHENTICATED)
+        ctx.session.state_machine.set_state(State.AUTHENTICATED)
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=ctx.chat_id,
             text="Exited workout"
         )
 
-    async def stats(self, message):
+    async def stats(self, ctx):
         """
         Handles the /stats command.
         """
-        # TODO
-        await self.bot.send_message(
-            chat_id=message.chat.id,
-            text="Not yet implemented - TODO"
-        )
+        await self.bot.send_stats(ctx)
 
-    async def suggestions(self, message):
+    async def suggestions(self, ctx):
         """
-        Handles the /suggestins command.
+        Handles the /suggestions command.
         """
-        # TODO
-        await self.bot.send_message(
-            chat_id=message.chat.id,
-            text="Not yet implemented - TODO"
-        )
\ No newline at end of file
+        await self.bot.send_suggestions(ctx)
\ No newline at end of file
@@ -0,0 +1,25 @@
+from telegram import Update
+from telegram.ext import CallbackContext
+
+from session import Session
+
+
+class HandlerContext:
+    """
+    Everything the state handlers need to process a single update.
+    A new one is built for every update, so handlers keep no per-request state.
+
+    The update is either a text message or the press of an inline button:
+    text holds the message text or the button data, so both route the same way.
+    """
+    __slots__ = ("update", "context", "message", "callback_query", "text", "chat_id", "session", "notice")
+
+    def __init__(self, update: Update, context: CallbackContext, session: Session):
+        self.update = update
+        self.context = context
+        self.callback_query = update.callback_query
+        self.message = update.effective_message
+        self.text = self.callback_query.data if self.callback_query is not None else self.message.text
+        self.chat_id = update.effective_chat.id
+        self.session = session
+        self.notice = None  # shown when answering the button press
@@ -1,6 +1,4 @@
 from telegram_bot.state_handlers.base_handler import BaseStateHandler
-from telegram import Update
-from telegram.ext import CallbackContext
 
 from state_machine import State, SubStateLogin
 
@@ -13,105 +11,113 @@ class LoginStateHandler(BaseStateHandler):
             SubStateLogin.NONE: self.get_username,
             SubStateLogin.USERNAME: self.get_password
         }
-                
-        self.id = None
-        self.username = None
-        self.password = None
+
 
         self.max_retries = 3
-        self.retries = 0
 
         self.next_state = super().get_next_state()
     
     def to_string(self):
         return "login"
 
-    async def handle_message(self, update: Update, context: CallbackContext):
-        
-        self.update = update
-        self.context = context
+    substates = tuple(SubStateLogin)
 
-        message = update.message
-        
-        await self.login_callbacks.get(self.bot.state_machine[message.chat.id].get_substate_login(), super().default_handler)(message=message)
+    def get_substate(self, state_machine):
+        return state_machine.substate_login
+
+    def get_routes(self) -> dict:
+        # Whatever is typed is the username or the password
+        routes = {substate: {None: self.default_handler} for substate in SubStateLogin}
+        for substate, callback in self.login_callbacks.items():
+            routes[substate] = {None: callback}
+        return routes
 
-    async def get_username(self, message):
+    async def get_username(self, ctx):
         """
         Handles the username input
         """
 
         # The message received is the username
-        self.username = message.text
+        ctx.session.login_username = ctx.text
 
-        if self.bot.check_username(self.username):
+        if await self.bot.check_username(ctx.session.login_username):
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Valid username. Please enter your password."
             )
-            self.bot.state_machine[message.chat.id].set_substate_login(SubStateLogin.USERNAME) # Username present
+            ctx.session.state_machine.set_substate_login(SubStateLogin.USERNAME) # Username present
             return
         else:
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Username not existing. Please enter a valid username."
             )
-            self.bot.state_machine[message.chat.id].set_substate_login(SubStateLogin.NONE)
-            self.username = None
+            ctx.session.state_machine.set_substate_login(SubStateLogin.NONE)
+            ctx.session.login_username = None
             return
     
-    async def get_password(self, message):
+    async def get_password(self, ctx):
         """
         Handles the password input
         """
 
-        self.password = message.text
+        password = ctx.text
 
-        self.id = self.bot.check_user(self.username, self.password)
-        if self.id is not None:
+        # Password verification runs on the hashing workers, other chats keep being served meanwhile
+        user_id = await self.bot.check_user(ctx.session.login_username, password)
+        if user_id == -1:
+            await self.bot.send_message(
+                chat_id=ctx.chat_id,
+                text="Error while checking the password. Please try again later."
+            )
+            return
+        if user_id is not None:
+            ctx.session.user_id = user_id # Maps chat_id to user_id (from DB)
+            ctx.session.login_username = None
+            ctx.session.login_retries = 0
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Valid password. You are now logged in."
             )
-            self.bot.state_machine[message.chat.id].set_substate_login(SubStateLogin.PASSWORD)
-            await self.authenticate(message=message)
+            ctx.session.state_machine.set_substate_login(SubStateLogin.PASSWORD)
+            await self.authenticate(ctx)
             return
         else:
-            self.retries += 1
-            if self.retries >= self.max_retries:
+            ctx.session.login_retries += 1
+            if ctx.session.login_retries >= self.max_retries:
                 await self.bot.send_message(
-                    chat_id=message.chat.id,
+                    chat_id=ctx.chat_id,
                     text="Too many attempts. Please try again later."
                 )
                 self.bot.remove_user(
-                    user_id=message.chat.id
+                    session=ctx.session
                 )
-                self.bot.state_machine[message.chat.id].set_substate_login(SubStateLogin.NONE)
+                ctx.session.state_machine.set_substate_login(SubStateLogin.NONE)
                 return
             else:
                 await self.bot.send_message(
-                    chat_id=message.chat.id,
-                    text="Invalid password. Please try again. ({} attempts left)".format(self.max_retries - self.retries)
+                    chat_id=ctx.chat_id,
+                    text="Invalid password. Please try again. ({} attempts left)".format(self.max_retries - ctx.session.login_retries)
                 )
-                self.bot.state_machine[message.chat.id].set_substate_login(SubStateLogin.USERNAME)
+                ctx.session.state_machine.set_substate_login(SubStateLogin.USERNAME)
                 return
         
-    async def authenticate(self, message):
+    async def authenticate(self, ctx):
         """
         Completes the authentication process.
         """
         
-        self.bot.state_machine[message.chat.id].set_state(State.AUTHENTICATED)
-        self.bot.state_machine[message.chat.id].set_substate_login(SubStateLogin.AUTHENTICATED)
-        self.bot.id_users[message.chat.id] = self.id # Maps chat_id to user_id (from DB)
+        ctx.session.state_machine.set_state(State.AUTHENTICATED)
+        ctx.session.state_machine.set_substate_login(SubStateLogin.AUTHENTICATED)
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=ctx.chat_id,
             text="You are now authenticated."
         )
         
         keyboard = [['/program', '/list'],['/stats', '/help']]
         markup = self.bot.create_reply_markup(keyboard=keyboard)
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=ctx.chat_id,
             text="Type a command",
             markup=markup
         )
\ No newline at end of file
@@ -1,10 +1,10 @@
+import math
+
 from telegram_bot.state_handlers.base_handler import BaseStateHandler
 
 from state_machine import State, SubStateUpdateExercise, SubStateUpdateSet
-from program_classes import ExerciseUpdate
-
-from telegram import Update
-from telegram.ext import CallbackContext
+from program_classes import ExerciseUpdate, MAX_SHORT, MAX_WEIGHT, WEIGHT_DIGITS
+from set_expression import SYNTAX_HELP
 
 class StartedStateHandler(BaseStateHandler):
     def __init__(self, bot):
@@ -36,279 +36,266 @@ class StartedStateHandler(BaseStateHandler):
     def to_string(self):
         return "started"
 
-    async def handle_message(self, update: Update, context: CallbackContext):
+    # Commands outside of the update dialogues, the typed values within them
+    substates = ((None,)
+                 + tuple(s for s in SubStateUpdateSet if s != SubStateUpdateSet.NONE)
+                 + tuple(s for s in SubStateUpdateExercise if s != SubStateUpdateExercise.NONE))
+
+    def get_substate(self, state_machine):
         """
-        Handles the message based on the substates
-        and the provided command.
-        ."""
-        self.update = update
-        self.context = context
-        message = update.message
-        
-        substate_update_set = self.bot.state_machine[message.chat.id].get_substate_update_set()
-        substate_update_exercise = self.bot.state_machine[message.chat.id].get_substate_update_exercise()
+        Returns the step of the update dialogue in progress, None if there is none
+        """
+        if state_machine.substate_update_set != SubStateUpdateSet.NONE:
+            return state_machine.substate_update_set
+        if state_machine.substate_update_exercise != SubStateUpdateExercise.NONE:
+            return state_machine.substate_update_exercise
+        return None
 
-        if substate_update_set == SubStateUpdateSet.NONE and substate_update_exercise == SubStateUpdateExercise.NONE:
-            await self.callbacks.get(message.text.split()[0], super().default_handler)(message=message)
-        elif substate_update_set != SubStateUpdateSet.NONE:
-            await self.update_set(message)
-        elif substate_update_exercise != SubStateUpdateExercise.NONE:
-            await self.update_exercise(message)
+    def get_routes(self) -> dict:
+        routes = super().get_routes()
+        for substate, callback in list(self.update_set_callbacks.items()) + list(self.update_exercise_callbacks.items()):
+            if substate in self.substates:
+                routes[substate] = {None: callback}
+        return routes
 
-    async def prev_exercise(self, message):
+    async def prev_exercise(self, ctx):
         """
         Handles the /prev_exercise command.
         """
-        exercise_num = self.bot.get_exercise_num(chat_id=message.chat.id)
-        if exercise_num <= 1:
-            await self.bot.send_message(
-                chat_id=self.update.message.chat.id,
-                text="You are already at the first exercise."
-            )
+        if self.bot.get_exercise_num(session=ctx.session) <= 1:
+            await self.bot.notify(ctx, "You are already at the first exercise.")
             return
-        self.bot.decrement_exercise_index(chat_id=self.update.message.chat.id)
-        await self.bot.send_message(
-            chat_id=self.update.message.chat.id,
-            text=self.bot.get_next_exercise(chat_id=self.update.message.chat.id)
-        )
-        await self.bot.send_message(
-            chat_id=message.chat.id,
-            text=f"Set {self.bot.get_set_number(chat_id=message.chat.id)} of {self.bot.get_all_sets_num(chat_id=message.chat.id, exercise_num=exercise_num)}:\n\n{self.bot.get_exercise_set(chat_id=message.chat.id)}"
-        )
+        self.bot.decrement_exercise_index(session=ctx.session)
+        self.bot.reset_set_index(session=ctx.session)
+        await self.bot.show_workout(ctx)
 
-    async def next_exercise(self, message):
+    async def next_exercise(self, ctx):
         """
         Handles the /next_exercise command.
         """
-        program = self.bot.selected_program[self.update.message.chat.id]
-        day_id = self.bot.selected_day_id[self.update.message.chat.id]
-        total_exercises = len(program.days[day_id].exercises)
-        exercise_num = self.bot.get_exercise_num(chat_id=message.chat.id)
-
-        if exercise_num >= total_exercises:
-            keyboard = [["/stats", "/suggestions"], ["-", "/quit"]]
-            await self.bot.send_message(
-                chat_id=self.update.message.chat.id,
-                text="Workout finished! Congratulations!",
-                markup=self.bot.create_reply_markup(keyboard=keyboard)
-            )
-            self.bot.state_machine[self.update.message.chat.id].set_state(State.END)
+        if self.bot.get_exercise_num(session=ctx.session) >= self.bot.get_num_exercises(session=ctx.session):
+            await self.finish_workout(ctx)
             return
-        
-        self.bot.increment_exercise_index(chat_id=self.update.message.chat.id)
-        self.bot.reset_set_index(chat_id=self.update.message.chat.id)
-        
-        await self.bot.send_message(
-            chat_id=self.update.message.chat.id,
-            text=self.bot.get_next_exercise(chat_id=self.update.message.chat.id)
-        )
-        await self.bot.send_message(
-            chat_id=self.update.message.chat.id,
-            text=f"Set {self.bot.get_set_number(chat_id=self.update.message.chat.id)} of {self.bot.get_all_sets_num(chat_id=message.chat.id, exercise_num=exercise_num)}:\n\n{self.bot.get_exercise_set(chat_id=self.update.message.chat.id)}"
-        )
 
-    async def prev_set(self, message):
+        self.bot.flush_logged_sets(session=ctx.session)
+        self.bot.increment_exercise_index(session=ctx.session)
+        self.bot.reset_set_index(session=ctx.session)
+        await self.bot.show_workout(ctx)
+
+    async def prev_set(self, ctx):
         """
         Handles the /prev_set command.
         """
-        if self.bot.get_set_number(chat_id=self.update.message.chat.id) <= 1:
-            await self.bot.send_message(
-                chat_id=self.update.message.chat.id,
-                text="You are already at the first set."
-            )
+        if self.bot.get_set_index(session=ctx.session) <= 1:
+            await self.bot.notify(ctx, "You are already at the first set.")
             return
-        self.bot.decrement_set_index(chat_id=self.update.message.chat.id)
-        await self.bot.send_message(
-            chat_id=self.update.message.chat.id,
-            text=self.bot.ge
-        )
+        self.bot.decrement_set_index(session=ctx.session)
+        await self.bot.show_workout(ctx)
 
-    async def next_set(self, message):
+    async def next_set(self, ctx):
         """
-        Handls the /next_set command.
+        Handles the /next_set command.
+        The current set is logged as performed before moving on.
         """
-        if self.bot.get_set_number(chat_id=message.chat.id) >= self.bot.get_set_number(chat_id=message.chat.id):
-            await self.bot.send_message(
-                chat_id=message.chat.id,
-                text="Exercise finished!"
-            )
-            self.bot.increment_exercise_index(chat_id=message.chat.id)
-            self.bot.reset_set_index(chat_id=message.chat.id)
-            if self.bot.get_exercise_num(chat_id=message.chat.id) >= self.bot.get_exercise_num(chat_id=message.chat.id):
-                await self.bot.send_message(
-                    chat_id=message.chat.id,
-                    text="Workout finished! Congratulations!"
-                )
-                self.bot.state_machine[message.chat.id].set_state(State.END)
-                return
-            await self.bot.send_message(
-                chat_id=message.chat.id,
-                text=self.bot.get_next_exercise(chat_id=message.chat.id)
-            )
-            await self.bot.send_message(
-                chat_id=message.chat.id,
-                text=f"Set {self.bot.get_set_number(chat_id=message.chat.id)} of {self.bot.get_exercise_num(chat_id=message.chat.id)}:\n\n{self.bot.get_exercise_set(chat_id=message.chat.id)}"
-            )
+        self.bot.log_current_set(session=ctx.session)
+
+        if self.bot.get_set_index(session=ctx.session) < self.bot.get_set_number(session=ctx.session):
+            self.bot.increment_set_index(session=ctx.session)
+            await self.bot.show_workout(ctx)
             return
-        self.bot.increment_set_index(chat_id=message.chat.id)
-        await self.bot.send_message(
-            chat_id=message.chat.id,
-            text=f"Set {self.bot.get_set_number(chat_id=message.chat.id)} of {self.bot.get_exercise_num(chat_id=message.chat.id)}:\n\n{self.bot.get_exercise_set(chat_id=message.chat.id)}"
-        )
+
+        if self.bot.get_exercise_num(session=ctx.session) >= self.bot.get_num_exercises(session=ctx.session):
+            await self.finish_workout(ctx)
+            return
+        self.bot.flush_logged_sets(session=ctx.session)
+        self.bot.increment_exercise_index(session=ctx.session)
+        self.bot.reset_set_index(session=ctx.session)
+        await self.bot.notify(ctx, "Exercise finished!")
+        await self.bot.show_workout(ctx)
+
+    async def finish_workout(self, ctx):
+        """
+        Closes the workout and turns its message into the final one.
+        """
+        self.bot.end_workout(session=ctx.session)
+        ctx.session.state_machine.set_state(State.END)
+        await self.bot.show_workout_finished(ctx)
     
-    async def update_set(self, message):
+    async def update_set(self, ctx):
         """
         Handles the /update_set command.
         """
-        substate_update_set = self.bot.state_machine[message.chat.id].get_substate_update_set()
-        await self.update_set_callbacks.get(substate_update_set, super().default_handler)(message=message)
+        substate_update_set = ctx.session.state_machine.get_substate_update_set()
+        await self.update_set_callbacks.get(substate_update_set, super().default_handler)(ctx)
 
-    async def update_exercise(self, message):
+    async def update_exercise(self, ctx):
         """
         Handles the /update_exercise command.
         """
-        substate_update_exercise = self.bot.state_machine[message.chat.id].get_substate_update_exercise()
-        await self.update_exercise_callbacks.get(substate_update_exercise, super().default_handler)(message=message)
+        substate_update_exercise = ctx.session.state_machine.get_substate_update_exercise()
+        await self.update_exercise_callbacks.get(substate_update_exercise, super().default_handler)(ctx)
 
-    async def none_exercise(self, message):
+    async def none_exercise(self, ctx):
         """
         Handles the none exercise substate.
         """
         await self.bot.send_message(
-            chat_id=self.update.message.chat.id,
-            text="Type the expression of the exercise you want to update."
+            chat_id=ctx.chat_id,
+            text=f"Type the expression of the exercise you want to update, or 0 to cancel.\n\n{SYNTAX_HELP}"
         )
-        self.bot.state_machine[self.update.message.chat.id].set_substate_update_exercise(SubStateUpdateExercise.TYPE_EXPRESSION)
+        ctx.session.state_machine.set_substate_update_exercise(SubStateUpdateExercise.TYPE_EXPRESSION)
 
-    async def type_expression(self, message): 
+    async def type_expression(self, ctx): 
         """
         Handles the type_expression exercise substate.
         """
-        # TODO
-        if self.bot.update_by_expression(chat_id=message.chat.id, expression=message.text.strip()):
+        if ctx.text.strip() == "0":
+            await self.bot.send_message(
+                chat_id=ctx.chat_id,
+                text="Update cancelled."
+            )
+            ctx.session.state_machine.set_substate_update_exercise(SubStateUpdateExercise.NONE)
+            return
+        try:
+            updated = await self.bot.update_by_expression(session=ctx.session, expression=ctx.text.strip())
+        except ValueError as e:
+            # Still typing the expression
+            await self.bot.send_message(
+                chat_id=ctx.chat_id,
+                text=f"{e}\n\n{SYNTAX_HELP}"
+            )
+            return
+        if updated:
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Exercise updated successfully."
             )
+            await self.bot.show_workout(ctx)
         else:
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Error updating exercise. Please try again later."
             )
-        self.bot.state_machine[message.chat.id].set_substate_update_exercise(SubStateUpdateExercise.NONE)
+        ctx.session.state_machine.set_substate_update_exercise(SubStateUpdateExercise.NONE)
     
-    async def none_state(self, message):
+    async def none_state(self, ctx):
         """
         Handles the none state for update set.
         """
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=ctx.chat_id,
             text="Type the number of the set you want to update."
         )
-        self.bot.updating[message.chat.id] = ExerciseUpdate()
-        exercise_num = self.bot.get_exercise_num(chat_id=message.chat.id)
-        self.bot.add_to_updating(chat_id=message.chat.id, exercise_num=exercise_num)
-        self.bot.state_machine[message.chat.id].set_substate_update_set(SubStateUpdateSet.TYPE_SET)
+        ctx.session.updating = ExerciseUpdate()
+        exercise_num = self.bot.get_exercise_num(session=ctx.session)
+        self.bot.add_to_updating(session=ctx.session, exercise_num=exercise_num)
+        ctx.session.state_machine.set_substate_update_set(SubStateUpdateSet.TYPE_SET)
 
-    async def type_set(self, message):
+    async def type_set(self, ctx):
         """
         Handles the type_set set substate.
         """
         try:
-            set_number = int(message.text)
+            set_number = int(ctx.text)
         except ValueError:
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Please enter a valid set number."
             )
             return
-        if set_number < 1 or set_number > self.bot.get_set_number(chat_id=message.chat.id):
+        if set_number < 1 or set_number > self.bot.get_set_number(session=ctx.session):
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Set number out of range. Please enter a valid set number."
             )
             return
         
-        exercise_num = self.bot.get_exercise_num(chat_id=message.chat.id)
-        self.bot.add_to_updating(chat_id=message.chat.id, exercise_num=exercise_num, set_num=set_number)
-        self.bot.state_machine[message.chat.id].set_substate_update_set(SubStateUpdateSet.TYPE_WHAT)
+        exercise_num = self.bot.get_exercise_num(session=ctx.session)
+        self.bot.add_to_updating(session=ctx.session, exercise_num=exercise_num, set_num=set_number)
+        ctx.session.state_machine.set_substate_update_set(SubStateUpdateSet.TYPE_WHAT)
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=ctx.chat_id,
             text=f"Set {set_number} selected. What would you like to update?"
         )
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=ctx.chat_id,
             text="1 - Reps\n2 - Rest\n3 - Weight\n0 - Cancel",
             markup=self.bot.create_reply_markup(keyboard=[["0", "1"], ["2", "3"]])
         )
 
-    async def type_what(self, message):
+    async def type_what(self, ctx):
         """
         Handles the type_what set substate.
         """
         try:
-            what_to_update = int(message.text)
+            what_to_update = int(ctx.text)
         except ValueError:
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Please enter a valid number for what to update."
             )
             return
         if what_to_update < 0 or what_to_update > 3: # supporting only weight, rest, reps (will support more in the future)
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Invalid option. Please enter a valid number (0-3)."
             )
             return
         if what_to_update == 0:
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Update cancelled."
             )
-            self.bot.state_machine[message.chat.id].set_substate_update_set(SubStateUpdateSet.NONE)
+            ctx.session.state_machine.set_substate_update_set(SubStateUpdateSet.NONE)
             return
-        self.bot.add_to_updating(chat_id=message.chat.id, what_to_update=what_to_update)
-        self.bot.state_machine[message.chat.id].set_substate_update_set(SubStateUpdateSet.TYPE_NEW_VALUE)
+        self.bot.add_to_updating(session=ctx.session, what_to_update=what_to_update)
+        ctx.session.state_machine.set_substate_update_set(SubStateUpdateSet.TYPE_NEW_VALUE)
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=ctx.chat_id,
             text="Please enter the new value."
         )
 
-    async def type_new_value(self, message):
+    async def type_new_value(self, ctx):
         """
         Handles the type_new_value set substate.
         """
+        # Weights can have decimals, reps and rest are whole numbers
+        is_weight = self.bot.get_string_what_to_update(ctx.session.updating.what_to_update) == "weight"
         try:
-            new_value = int(message.text)
+            new_value = round(float(ctx.text), WEIGHT_DIGITS) if is_weight else int(ctx.text)
+            if not math.isfinite(new_value):
+                raise ValueError(ctx.text)
         except ValueError:
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Please enter a valid number for the new value."
             )
             return
         if new_value < 0:
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Negative values are not allowed. Please enter a valid number."
             )
             return
-        self.bot.add_to_updating(chat_id=message.chat.id, value_to_update=new_value)
-        self.bot.state_machine[message.chat.id].set_substate_update_exercise(SubStateUpdateExercise.NONE)
-        if self.bot.update_exercise(chat_id=message.chat.id):
+        max_value = MAX_WEIGHT if is_weight else MAX_SHORT
+        if new_value > max_value:
             await self.bot.send_message(
-                chat_id=message.chat.id,
-                text="Exercise updated successfully.",
-                markup=self.bot.create_reply_markup(keyboard=[["/prev_exercise", "/next_exercise"], ["/prev_set", "/next_set"]])
+                chat_id=ctx.chat_id,
+                text=f"Values above {max_value} are not allowed. Please enter a valid number."
             )
-            self.bot.check_and_set_program(chat_id=message.chat.id, program_id=self.bot.selected_program[message.chat.id].id)
-            self.bot.state_machine[message.chat.id].set_substate_update_set(SubStateUpdateSet.NONE)
-            exercise_num = self.bot.get_exercise_num(chat_id=message.chat.id)
+            return
+        self.bot.add_to_updating(session=ctx.session, value_to_update=new_value)
+        ctx.session.state_machine.set_substate_update_exercise(SubStateUpdateExercise.NONE)
+        if await self.bot.update_exercise(session=ctx.session):
             await self.bot.send_message(
-                chat_id=message.chat.id,
-                text=f"Set {self.bot.get_set_number(chat_id=self.update.message.chat.id)} of {self.bot.get_all_sets_num(chat_id=message.chat.id, exercise_num=exercise_num)}:\n\n{self.bot.get_exercise_set(chat_id=self.update.message.chat.id)}"
+                chat_id=ctx.chat_id,
+                text="Exercise updated successfully."
             )
+            ctx.session.state_machine.set_substate_update_set(SubStateUpdateSet.NONE)
+            # The new value shows up in the workout message
+            await self.bot.show_workout(ctx)
         else:
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Error updating exercise. Please try again later."
             )
\ No newline at end of file
@@ -1,33 +1,43 @@
 from utils import resolve_class
-class StateGraph:
-    def __init__(self):
 
-        self.state_class_registry = {
-            "authenticated": "telegram_bot.state_handlers.authenticated_state.AuthenticatedStateHandler",
-            "dead": "telegram_bot.state_handlers.dead_state.DeadStateHandler",
-            "end": "telegram_bot.state_handlers.end_state.EndStateHandler",
-            "login": "telegram_bot.state_handlers.login_state.LoginStateHandler",
-            "ready": "telegram_bot.state_handlers.ready_state.ReadyStateHandler",
-            "started": "telegram_bot.state_handlers.started_state.StartedStateHandler",
-            "type_day": "telegram_bot.state_handlers.type_day_state.TypeDayStateHandler",
-            "type_program": "telegram_bot.state_handlers.type_program_state.TypeProgramStateHandler"
-        }
+STATE_CLASS_REGISTRY = {
+    "authenticated": "telegram_bot.state_handlers.authenticated_state.AuthenticatedStateHandler",
+    "dead": "telegram_bot.state_handlers.dead_state.DeadStateHandler",
+    "end": "telegram_bot.state_handlers.end_state.EndStateHandler",
+    "login": "telegram_bot.state_handlers.login_state.LoginStateHandler",
+    "ready": "telegram_bot.state_handlers.ready_state.ReadyStateHandler",
+    "started": "telegram_bot.state_handlers.started_state.StartedStateHandler",
+    "type_day": "telegram_bot.state_handlers.type_day_state.TypeDayStateHandler",
+    "type_program": "telegram_bot.state_handlers.type_program_state.TypeProgramStateHandler"
+}
+
+STATE_SUCCESSIONS = {
+    "dead": "login",
+    "login": "authenticated",
+    "authenticated": "type_program",
+    "type_program": "type_day",
+    "type_day": "ready",
+    "ready": "started",
+    "started": "end",
+    "end": "authenticated"
+}
 
-        self.state_successions = {
-            "dead": "login",
-            "login": "authenticated",
-            "authenticated": "type_program",
-            "type_program": "type_day",
-            "type_day": "ready",
-            "ready": "started",
-            "started": "end",
-            "end": "authenticated"
-        }
+class StateGraph:
+    """
+    Succession of the states, with the handler class of the state following each one.
+    The classes are resolved once per process, on the first StateGraph created.
+    """
+    next_states = None  # state : handler class of the next state
+
+    def __init__(self):
+        if StateGraph.next_states is None:
+            StateGraph.next_states = {
+                state: resolve_class(STATE_CLASS_REGISTRY[next_state])
+                for state, next_state in STATE_SUCCESSIONS.items()
+            }
 
     def get_next_state(self, current_state: str):
         """
         Returns the next state based on the current state.
         """
-        next_state_key = self.state_successions.get(current_state)
-        class_path = self.state_class_registry[next_state_key]
-        return resolve_class(class_path)
\ No newline at end of file
+        return self.next_states[current_state]
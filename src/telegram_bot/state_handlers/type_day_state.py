@@ -1,7 +1,6 @@
 from telegram_bot.state_handlers.base_handler import BaseStateHandler
 
-from telegram import Update
-from telegram.ext import CallbackContext
+from telegram_bot.state_handlers.handler_context import HandlerContext
 
 from state_machine import State
 
@@ -15,27 +14,25 @@ class TypeDayStateHandler(BaseStateHandler):
     def to_string(self):
         return "type_day"
 
-    async def handle_message(self, update: Update, context: CallbackContext):
-        
-        self.update = update
-        self.context = context
-
-        message = self.update.message
+    def get_routes(self) -> dict:
+        # The text is the day to select
+        return {None: {None: self.select_day}}
 
+    async def select_day(self, ctx: HandlerContext):
         keyboard = ["/start_workout", "/cancel"]
-        if self.bot.check_day(chat_id=message.chat.id,
-                            day_id=message.text):
-            self.bot.set_selected_day_id(day_id=int(message.text.strip()), chat_id=message.chat.id)
+        if self.bot.check_day(session=ctx.session,
+                            day_id=ctx.text):
+            self.bot.set_selected_day_id(session=ctx.session, day_id=int(ctx.text.strip()))
             await self.bot.send_message(
-                chat_id=message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Day correctly set. Workout ready to be started",
                 markup=self.bot.create_reply_markup(keyboard=[keyboard])
             )
-            self.bot.state_machine[message.chat.id].set_state(State.READY)
+            ctx.session.state_machine.set_state(State.READY)
 
         else:
-            self.bot.clear_program()
+            self.bot.clear_program(session=ctx.session)
             await self.bot.send_message(
-                chat_id=self.update.message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Wrong day specified. Operation aborted."
             )
\ No newline at end of file
@@ -2,8 +2,7 @@ from state_machine import State
 
 from telegram_bot.state_handlers.base_handler import BaseStateHandler
 
-from telegram import Update
-from telegram.ext import CallbackContext
+from telegram_bot.state_handlers.handler_context import HandlerContext
 
 class TypeProgramStateHandler(BaseStateHandler):
     def __init__(self, bot):
@@ -13,23 +12,21 @@ class TypeProgramStateHandler(BaseStateHandler):
     def to_string(self):
         return "type_program"
 
-    async def handle_message(self, update: Update, context: CallbackContext):
+    def get_routes(self) -> dict:
+        # The text is the program to select
+        return {None: {None: self.select_program}}
 
-        self.update = update
-        self.context = context
-
-        message = update.message
-
-        if self.bot.check_and_set_program(chat_id=self.update.message.chat.id,
-                                program_id=message.text):
+    async def select_program(self, ctx: HandlerContext):
+        if await self.bot.check_and_set_program(session=ctx.session,
+                                program_id=ctx.text):
             await self.bot.send_message(
-                chat_id=self.update.message.chat.id,
-                text="Selected program: " + self.bot.get_selected_program(self.update.message.chat.id)
+                chat_id=ctx.chat_id,
+                text="Selected program: " + self.bot.get_selected_program(ctx.session)
             )
-            self.bot.state_machine[self.update.message.chat.id].set_state(State.TYPE_DAY)
+            ctx.session.state_machine.set_state(State.TYPE_DAY)
         else:
             await self.bot.send_message(
-                chat_id=self.update.message.chat.id,
+                chat_id=ctx.chat_id,
                 text="Program not valid. Operation aborted"
             )
-            self.bot.state_machine[self.update.message.chat.id].set_state(State.AUTHENTICATED)
\ No newline at end of file
+            ctx.session.state_machine.set_state(State.AUTHENTICATED)
\ No newline at end of file
@@ -1,12 +1,26 @@
+import asyncio
+import signal
+
 from telegram import ReplyKeyboardMarkup, Update
-from telegram.ext import Application, MessageHandler, filters, CallbackContext
+from telegram.ext import Application, MessageHandler, CallbackQueryHandler, filters, CallbackContext
 
 from database import Database
-from state_machine import StateMachine
 from state_machine import State
 from program_classes import ExerciseUpdate
+from session import Session, SessionStore
+from session_persistence import SessionWriter, SQLiteSessionPersistence, PostgresSessionPersistence
+from workout_logger import WorkoutLogger
+from set_expression import compile_expression
+from chart_renderer import ChartRenderer
+from suggestion_engine import SuggestionEngine
+
+from telegram_bot.chat_dispatcher import ChatDispatcher
+from telegram_bot.workout_view import WorkoutView
+from telegram_bot.outbound_scheduler import OutboundScheduler
+from telegram_bot.router import Router
 
 from telegram_bot.state_handlers.state_graph import StateGraph
+from telegram_bot.state_handlers.handler_context import HandlerContext
 
 # State handlers
 from telegram_bot.state_handlers.dead_state import DeadStateHandler
@@ -24,24 +38,101 @@ class TelegramBot:
     """
     def __init__(self,
                  bot_token,
-                 db_host, db_password, db_user, db_name, db_port) -> None:
+                 db_host, db_password, db_user, db_name, db_port,
+                 db_pool_min_size=1, db_pool_max_size=10, db_acquire_timeout=10.0,
+                 auto_migrate=False,
+                 hash_workers=2, hash_rounds=12,
+                 program_cache_max_entries=1024, program_cache_max_bytes=64 * 1024 * 1024,
+                 program_cache_ttl=3600.0,
+                 session_idle_ttl=3600.0, max_sessions=10000, max_session_bytes=256 * 1024 * 1024,
+                 session_persistence="sqlite", session_sqlite_path="sessions.sqlite3",
+                 session_flush_interval=2.0,
+                 workout_flush_interval=30.0,
+                 bot_api_url=None,
+                 concurrent_updates=32, chat_queue_depth=20, dispatch_drain_timeout=30.0,
+                 outbound_global_rate=30.0, outbound_chat_rate=1.0, outbound_chat_burst=3,
+                 chart_cache_dir="chart_cache", chart_workers=1,
+                 suggestion_rep_min=8, suggestion_rep_max=12, suggestion_weight_step=2.5) -> None:
         self.token = bot_token
-        self.app = Application.builder().token(self.token).build()
-        self.state_machine = {}
+        self.auto_migrate = auto_migrate
+
+        builder = (Application.builder()
+                   .token(self.token)
+                   .post_init(self.post_init)
+                   .post_stop(self.post_stop)
+                   .post_shutdown(self.post_shutdown))
+        if bot_api_url is not None:
+            # e.g. a local Bot API server, or telegram_bot/fake_bot_api.py
+            builder = builder.base_url(bot_api_url)
+        self.app = builder.build()
+
+        # Every call to the Bot API is paced to stay within the Telegram limits
+        self.outbound = OutboundScheduler(
+            self.app.bot,
+            global_rate=outbound_global_rate,
+            global_burst=outbound_global_rate,
+            chat_rate=outbound_chat_rate,
+            chat_burst=outbound_chat_burst
+        )
 
         self.database = Database(
             db_host=db_host,
             db_password=db_password,
             db_user=db_user,
             db_name=db_name,
-            db_port=db_port
+            db_port=db_port,
+            pool_min_size=db_pool_min_size,
+            pool_max_size=db_pool_max_size,
+            acquire_timeout=db_acquire_timeout,
+            hash_workers=hash_workers,
+            hash_rounds=hash_rounds,
+            cache_max_entries=program_cache_max_entries,
+            cache_max_bytes=program_cache_max_bytes,
+            cache_ttl=program_cache_ttl
+        )
+
+        # One Session per chat, with the state machine, user and workout progress
+        self.sessions = SessionStore(
+            idle_ttl=session_idle_ttl,
+            max_sessions=max_sessions,
+            max_bytes=max_session_bytes
         )
-        
-        self.user_db = {}   # Stores user data in memory
-        self.id_users = {}  # Maps the id of the user in DB with the chat_id (chat_id : user_id)
-        self.updating = {}  # Maps the chat_id with ExericseUpdate objects
+
+        # Snapshots of the sessions survive restarts: "sqlite", "postgres" or "none"
+        self.session_writer = None
+        if session_persistence == "sqlite":
+            self.session_writer = SessionWriter(SQLiteSessionPersistence(session_sqlite_path),
+                                                flush_interval=session_flush_interval)
+        elif session_persistence == "postgres":
+            self.session_writer = SessionWriter(PostgresSessionPersistence(self.database),
+                                                flush_interval=session_flush_interval)
+        elif session_persistence != "none":
+            raise ValueError(f"Unknown session persistence: {session_persistence}")
+
+        self.workout_logger = WorkoutLogger(self.database, flush_interval=workout_flush_interval)
+
+        # The application hands the updates over one at a time, the dispatcher runs
+        # them concurrently across chats and in order within a chat
+        self.dispatcher = ChatDispatcher(max_concurrency=concurrent_updates, max_queue_depth=chat_queue_depth)
+        self.dispatch_drain_timeout = float(dispatch_drain_timeout)
 
         self.app.add_handler(MessageHandler(filters.ALL, self.handle_message))
+        self.app.add_handler(CallbackQueryHandler(self.handle_message))
+
+        # The workout in progress is shown in one message, edited by its inline buttons
+        self.workout_view = WorkoutView(self)
+
+        # Created on the first /stats, which is when pandas and numpy get imported
+        self.data_handler = None
+        # Charts of the stats, drawn in worker processes and cached on disk
+        self.chart_renderer = ChartRenderer(cache_dir=chart_cache_dir, workers=chart_workers)
+        # The suggestions are computed by a batch job, the bot only reads them
+        self.suggestion_engine = SuggestionEngine(
+            self.database,
+            rep_min=int(suggestion_rep_min),
+            rep_max=int(suggestion_rep_max),
+            weight_step=float(suggestion_weight_step)
+        )
 
         self.state_graph = StateGraph()
 
@@ -56,115 +147,177 @@ class TelegramBot:
             State.END            :  EndStateHandler(self)
         }
 
-        self.selected_program = {}
-        self.selected_day_id = {}
-        self.resting_users = {}  # Maps the chat_id with the resting state of the user
-        self.exercise_num_set = {}  # Maps the chat_id with a tuple (exercise_num, set_num)
+        # (state, substate, command) -> callback, checked here once for the whole bot
+        self.router = Router(self.state_handlers)
 
     async def send_message(self, chat_id, text, markup=None):
         """
-        Sends a message to the user
+        Sends a message to the user.
+        While a handler runs, its messages are held and sent together once it returns.
         """
-        await self.app.bot.send_message(chat_id=chat_id, text=text, reply_markup=markup)
+        await self.outbound.send_message(chat_id=chat_id, text=text, markup=markup)
 
-    def add_user(self, user_id: int, chat_id: int, username: str, first_name: str) -> None:
+    async def load_session(self, chat_id) -> Session:
+        """
+        Returns the session of the chat.
+        A session evicted from memory, or persisted before a restart, is rebuilt from
+        its snapshot the first time its chat writes, and its program loaded again.
+        """
+        session = self.sessions.get(chat_id)
+        if session is not None:
+            return session
+
+        snapshot = self.sessions.take_dormant(chat_id)
+        if snapshot is None and self.session_writer is not None:
+            snapshot = await self.session_writer.load(chat_id)
+
+        session, program_id = Session.restore(chat_id, snapshot) if snapshot is not None else (None, None)
+        if session is None:
+            session = Session(chat_id)
+        elif program_id is not None and session.user_id is not None:
+            session.selected_program = await self.database.get_selected_program(session.user_id, program_id)
+            if session.selected_program is None:
+                # The program is gone, go back to program selection
+                session.selected_day_id = None
+                session.state_machine.set_state(State.AUTHENTICATED)
+
+        self.sessions.add(session)
+        return session
+
+    def add_user(self, session: Session, username: str, first_name: str) -> None:
         """
         Adds a user to the database
         """
-        self.user_db[user_id] = {
-            "chat_id": chat_id,
-            "username": username,
-            "first_name": first_name
-        }
-        self.resting_users[user_id] = False        # Initialize resting state
-        self.exercise_num_set[user_id] = (0, 0)  # Initialize exercise and set numbers
+        session.registered = True
+        session.username = username
+        session.first_name = first_name
+        session.resting = False             # Initialize resting state
+        session.exercise_num_set = (0, 0)   # Initialize exercise and set numbers
 
-    def remove_user(self, user_id):
+    def remove_user(self, session: Session):
         """
         Removes a user from the database
         """
-        if user_id in self.user_db:
-            del self.user_db[user_id]
+        session.registered = False
 
-    def check_username(self, username: str) -> bool:
+    async def check_username(self, username: str) -> bool:
         """
         Checks if the username is already taken
         """
-        return self.database.check_username(username=username)
+        return await self.database.check_username(username=username)
 
-    def check_user(self, username: str, password: str) -> int|None:
+    async def check_user(self, username: str, password: str) -> int|None:
         """
         Checks if the user exists in the database
         """
-        return self.database.check_user(username=username, password=password)
+        return await self.database.check_user(username=username, password=password)
 
-    def is_user_registered(self, user_id):
-        return user_id in self.user_db
+    def is_user_registered(self, session: Session):
+        return session.registered
 
-    def get_string_programs(self, chat_id) -> str:
+    async def get_string_programs(self, session: Session) -> str:
         """Returns the available programs as a formatted string."""
-        returned_string = ""
-        return self.database.get_programs(self.id_users[chat_id])
+        return await self.database.get_programs(session.user_id)
 
-    def get_programs_details(self, chat_id) -> str:
+    async def get_programs_details(self, session: Session) -> str:
         """
         Returns a more detailed list of programs when requested by user.
         """
-        return self.database.get_programs_details(self.id_users[chat_id])
+        return await self.database.get_programs_details(session.user_id)
 
     async def handle_message(self, update: Update, context: CallbackContext) -> None:
         """
-        Handles text messages from users
+        Queues text messages and button presses from users behind the ones of the same chat
         """
-        user_id = update.message.chat.id
-
-        if user_id not in self.state_machine:
-            # Initialize the state machine for the user
-            self.state_machine[user_id] = StateMachine()
-
-        # Get the user's state from the state machine
-        user_state = self.state_machine[update.message.chat.id].get_state()
-
-        # Handle the message based on the user's state
-        handler = self.state_handlers.get(user_state)
-        if handler:
-            await handler.handle_message(update, context)
+        chat_id = update.effective_chat.id
+        if not self.dispatcher.submit(chat_id, self.process_message, update, context):
+            print(f"Dropped update {update.update_id} of chat {chat_id}: too many messages queued")
 
-    def set_selected_program(self, program, chat_id=None):
+    async def process_message(self, update: Update, context: CallbackContext) -> None:
+        """
+        Handles text messages and button presses from users
+        """
+        session = await self.load_session(update.effective_chat.id)
+        # Other chats evicting sessions while this one awaits must not take it away
+        self.sessions.pin(session)
+        try:
+            # Handle the message based on the user's state, substate and command.
+            # The handlers are shared by all the chats, what belongs to this update travels in the context
+            ctx = HandlerContext(update, context, session)
+            callback = self.router.resolve(session.state_machine, ctx.text)
+            outbox = self.outbound.collect()
+            try:
+                await callback(ctx)
+            finally:
+                await self.outbound.release(outbox)
+                if ctx.callback_query is not None:
+                    # Stops the loading animation of the button, with the notice if any
+                    try:
+                        await ctx.callback_query.answer(text=ctx.notice)
+                    except Exception as e:
+                        print(f"Error answering callback query of chat {ctx.chat_id}: {e}")
+
+            # The handler may have loaded or dropped a program
+            self.sessions.touch(session)
+            if self.session_writer is not None:
+                self.session_writer.mark_dirty(session)
+        finally:
+            self.sessions.unpin(session)
+
+    async def notify(self, ctx: HandlerContext, text: str) -> None:
+        """
+        Tells the user something without touching the workout view:
+        as a notice on the button pressed, or as a message
+        """
+        if ctx.callback_query is not None:
+            ctx.notice = text
+        else:
+            await self.send_message(chat_id=ctx.chat_id, text=text)
+
+    async def show_workout(self, ctx: HandlerContext) -> None:
+        """
+        Shows the current exercise and set, editing the workout message if there is one
+        """
+        await self.workout_view.show(ctx.session)
+        # Once this update is answered, the next exercise gets rendered while the user rests
+        asyncio.get_running_loop().call_soon(self.workout_view.prerender_next, ctx.session)
+
+    async def show_workout_finished(self, ctx: HandlerContext) -> None:
+        await self.workout_view.show_finished(ctx.session)
+
+    def set_selected_program(self, session: Session, program):
         """
         Sets the selected program ID
         """
-        self.selected_program[chat_id] = program
+        session.selected_program = program
 
-    def get_selected_program(self, chat_id=None) -> str:
+    def get_selected_program(self, session: Session) -> str:
         """
         Returns the selected program ID
         """
-        return self.selected_program[chat_id].to_string()
+        return session.selected_program.to_string()
 
-    def clear_program(self, chat_id=None):
+    def clear_program(self, session: Session):
         """
         Sets program to none.
         """
-        self.selected_program[chat_id] = None
-        self.selected_day_id[chat_id] = None
+        session.selected_program = None
+        session.selected_day_id = None
     
-    def set_selected_day_id(self, day_id: int, chat_id=None):
+    def set_selected_day_id(self, session: Session, day_id: int):
         """
         Sets the selected day ID
         """
-        if chat_id is None:
-            raise ValueError("chat_id must be not None")
         day_id = day_id - 1
-        self.selected_day_id[chat_id] = day_id
+        session.selected_day_id = day_id
 
-    def get_selected_day_id(self, chat_id=None) -> int:
+    def get_selected_day_id(self, session: Session) -> int:
         """
         Returns the selected day ID
         """
-        return self.selected_day_id[chat_id]
+        return session.selected_day_id
     
-    def check_and_set_program(self, chat_id, program_id):
+    async def check_and_set_program(self, session: Session, program_id):
         """
         Checks if the program is valid and sets it
         """
@@ -172,13 +325,14 @@ class TelegramBot:
             program_id = int(program_id)
         except ValueError:
             return False
-        if self.database.check_program(self.id_users[chat_id], int(program_id)):
-            self.selected_program[chat_id] = self.database.get_selected_program(self.id_users[chat_id], int(program_id))
-            print("Program valid")
-            return True
-        return False
+        program = await self.database.get_selected_program(session.user_id, program_id)
+        if program is None:
+            return False
+        session.selected_program = program
+        print("Program valid")
+        return True
             
-    def check_day(self, chat_id, day_id: str) -> bool:
+    def check_day(self, session: Session, day_id: str) -> bool:
         """
         Checks if the day specified is in the selected program.
         """
@@ -187,8 +341,9 @@ class TelegramBot:
         except ValueError:
             return False
         
-        if self.selected_program is not None:
-            return len(self.selected_program[chat_id].days) > day_id and day_id >= 0
+        program = session.selected_program
+        if program is not None:
+            return len(program.days) > day_id and day_id >= 0
         return False
 
     def run(self) -> None:
@@ -198,33 +353,260 @@ class TelegramBot:
         print("Bot is running...")
         self.app.run_polling()
 
+    def run_webhook(self, webhook_url: str, server) -> None:
+        """
+        Runs the bot receiving the updates through a webhook instead of polling
+        """
+        if not webhook_url:
+            raise ValueError("The webhook URL is required")
+        print("Bot is running with webhook...")
+        asyncio.run(self.serve_webhook(webhook_url=webhook_url, server=server))
+
+    async def serve_webhook(self, webhook_url: str, server) -> None:
+        """
+        Serves the webhook until SIGINT or SIGTERM, then drains the accepted updates
+        """
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stop.set)
+
+        # The post_* hooks are only called by run_polling, so here they are called explicitly
+        await self.app.initialize()
+        try:
+            await self.post_init(self.app)
+            await self.app.start()
+            await server.start()
+            await self.app.bot.set_webhook(
+                url=webhook_url,
+                secret_token=server.secret_token,
+                max_connections=server.max_connections,
+                allowed_updates=Update.ALL_TYPES
+            )
+
+            await stop.wait()
+            print("Stopping, draining pending updates...")
+            await server.stop()
+        finally:
+            # The queued handlers still reply through the bot: drained while it can send
+            await self.post_stop(self.app)
+            if self.app.running:
+                await self.app.stop()
+            await self.app.shutdown()
+            await self.post_shutdown(self.app)
+
+    def get_pending_updates(self) -> int:
+        """
+        Returns the number of received updates not handled yet
+        """
+        return self.app.update_queue.qsize() + self.dispatcher.get_pending()
+
+    def get_metrics(self) -> dict:
+        """
+        Returns the counters of the bot internals
+        """
+        return {
+            "dispatcher": self.dispatcher.get_stats(),
+            "router": self.router.get_stats(),
+            "workout_view": self.workout_view.get_stats(),
+            "outbound": self.outbound.get_stats(),
+            "program_cache": self.database.program_cache.get_stats(),
+            "sessions": self.sessions.get_stats(),
+            "session_writer": self.session_writer.get_stats() if self.session_writer is not None else None,
+            "workout_logger": self.workout_logger.get_stats(),
+            "data_handler": self.data_handler.get_stats() if self.data_handler is not None else None,
+            "chart_renderer": self.chart_renderer.get_stats()
+        }
+
+    def get_data_handler(self):
+        """
+        Returns the data handler, importing the analytics modules the first time
+        """
+        if self.data_handler is None:
+            from data_handling import DataHandler
+            self.data_handler = DataHandler(self.database)
+        return self.data_handler
+
+    async def send_stats(self, ctx: HandlerContext) -> None:
+        """
+        Sends the training statistics of the user: the text, then the progress chart
+        """
+        user_id = ctx.session.user_id
+        if user_id is None:
+            await self.send_message(chat_id=ctx.chat_id, text="Please log in to see your statistics.")
+            return
+
+        data_handler = self.get_data_handler()
+        stats = await data_handler.get_user_stats(user_id)
+        if stats is None:
+            await self.send_message(chat_id=ctx.chat_id,
+                                    text="Error while computing the stats. Please try again later.")
+            return
+        await self.send_message(chat_id=ctx.chat_id, text=data_handler.format_stats(stats))
+
+        series = data_handler.get_chart_series(stats)
+        if series is None:
+            return
+        chart = await self.chart_renderer.get_chart("progress", series)
+        if chart is None:
+            return
+        try:
+            message = await self.outbound.call(ctx.chat_id, self.app.bot.send_photo,
+                                               chat_id=ctx.chat_id, photo=chart.get_photo())
+        except Exception as e:
+            print(f"Error sending the stats chart to chat {ctx.chat_id}: {e}")
+            return
+        if chart.file_id is None and message.photo:
+            # The largest size is the uploaded PNG
+            self.chart_renderer.remember_file_id(chart, message.photo[-1].file_id)
+
+    async def send_suggestions(self, ctx: HandlerContext) -> None:
+        """
+        Sends the next session targets of the user, as last computed by the suggestion job
+        """
+        user_id = ctx.session.user_id
+        if user_id is None:
+            text = "Please log in to see your suggestions."
+        else:
+            rows = await self.database.get_suggestions(user_id)
+            if rows is None:
+                text = "Error while reading the suggestions. Please try again later."
+            else:
+                text = self.suggestion_engine.format_suggestions(rows)
+        await self.send_message(chat_id=ctx.chat_id, text=text)
+
+    def close(self) -> None:
+        """
+        Releases the resources of a bot that was created but never run
+        """
+        if self.session_writer is not None:
+            self.session_writer.persistence.close()
+        self.chart_renderer.close()
+        self.database.close()
+
+    async def post_init(self, application: Application) -> None:
+        """
+        Prepares the resources needed by the bot before it starts receiving updates
+        """
+        if self.auto_migrate:
+            await self.database.apply_migrations()
+        else:
+            # Logging sets writes to the rollups and the weights with decimals: an old schema
+            # would only fail at the first workout
+            pending = await self.database.get_pending_migrations()
+            if len(pending) > 0:
+                names = ", ".join(migration.to_string() for migration in pending)
+                raise RuntimeError(f"The database schema is behind, pending migrations: {names}. "
+                                   "Run python src/main.py --migrate, or set DB_AUTO_MIGRATE=true")
+        if self.session_writer is not None:
+            self.session_writer.start()
+        self.workout_logger.start()
+
+    async def post_stop(self, application: Application) -> None:
+        """
+        Drains the work in progress once no more updates come in, while the bot can still send:
+        the queued handlers first, then the sets they logged, then the sessions they changed
+        """
+        await self.dispatcher.stop(timeout=self.dispatch_drain_timeout)
+        await self.workout_logger.stop()
+        if self.session_writer is not None:
+            await self.session_writer.stop()
+
+    async def post_shutdown(self, application: Application) -> None:
+        """
+        Releases the resources held by the bot once the application has shut down
+        """
+        self.chart_renderer.close()
+        self.database.close()
+
     def create_reply_markup(self, keyboard):
         return ReplyKeyboardMarkup(
             keyboard,
             one_time_keyboard=True,
             resize_keyboard=True)
     
-    def set_user_workout_started(self, chat_id) -> bool:
+    async def set_user_workout_started(self, session: Session) -> bool:
         """
-        Sets the user workout started state.
+        Sets the user workout started state and creates the workout the sets are logged into.
         """
-        if chat_id not in self.resting_users or chat_id not in self.exercise_num_set:
+        if not session.registered:
+            return False
+
+        program_day_id = None
+        if session.selected_program is not None and session.selected_day_id is not None:
+            program_day_id = session.selected_program.days[session.selected_day_id].id
+        if not await self.workout_logger.start_workout(session, program_day_id=program_day_id):
             return False
         
-        self.resting_users[chat_id] = False
-        self.exercise_num_set[chat_id] = (1, 1)
+        session.resting = False
+        session.exercise_num_set = (1, 1)
+        self.workout_view.reset(session)
         return True
+
+    def log_current_set(self, session: Session) -> None:
+        """
+        Records the current set as performed, with the values of the program.
+        The set is only buffered: it is written with the next flush.
+        """
+        program = session.selected_program
+        if program is None or session.selected_day_id is None:
+            return
+
+        exercise_num, set_num = session.exercise_num_set
+        exercises = program.days[session.selected_day_id].exercises
+        if exercise_num < 1 or exercise_num > len(exercises):
+            return
+        exercise = exercises[exercise_num - 1]
+        if set_num < 1 or set_num > exercise.get_num_sets():
+            return
+
+        exercise_set = exercise.get_set(set_num)
+        self.workout_logger.record_set(
+            session=session,
+            exercise_num=exercise_num,
+            set_num=set_num,
+            exercise_id=exercise.id,
+            weight=exercise_set.weight,
+            reps=exercise_set.reps,
+            rest=exercise_set.rest
+        )
+
+    def flush_logged_sets(self, session: Session) -> None:
+        """
+        Writes the sets logged so far in background
+        """
+        self.workout_logger.flush_soon(session)
+
+    def end_workout(self, session: Session) -> None:
+        """
+        Writes the remaining sets and closes the workout in background
+        """
+        self.workout_logger.end_workout_soon(session)
+
+    def get_num_exercises(self, session: Session) -> int:
+        """
+        Returns the number of exercises of the selected day.
+        """
+        if session.selected_program is None or session.selected_day_id is None:
+            return 0
+        return len(session.selected_program.days[session.selected_day_id].exercises)
+
+    def get_set_index(self, session: Session) -> int:
+        """
+        Returns the number of the current set, starting from 1.
+        """
+        return session.exercise_num_set[1]
     
-    def get_next_exercise(self, chat_id) -> str:
+    def get_next_exercise(self, session: Session) -> str:
         """
         Returns the next exercise for the user.
         """
-        if chat_id not in self.selected_program.keys() or chat_id not in self.selected_day_id.keys():
+        if session.selected_program is None or session.selected_day_id is None:
             return "No program or day selected."
         
-        program = self.selected_program[chat_id]
-        day_id = self.selected_day_id[chat_id]
-        exercise_num, set_num = self.exercise_num_set[chat_id]
+        program = session.selected_program
+        day_id = session.selected_day_id
+        exercise_num, set_num = session.exercise_num_set
 
         return """
         Exercise {}/{}: {}
@@ -234,16 +616,16 @@ class TelegramBot:
             program.days[day_id].exercises[exercise_num-1].to_string()
         )
 
-    def get_exercise_set(self, chat_id) -> str:
+    def get_exercise_set(self, session: Session) -> str:
         """
         Returns the current exercise and set for the user.
         """
-        if chat_id not in self.selected_program.keys() or chat_id not in self.selected_day_id.keys():
+        if session.selected_program is None or session.selected_day_id is None:
             return "No program or day selected."
         
-        program = self.selected_program[chat_id]
-        day_id = self.selected_day_id[chat_id]
-        exercise_num, set_num = self.exercise_num_set[chat_id]
+        program = session.selected_program
+        day_id = session.selected_day_id
+        exercise_num, set_num = session.exercise_num_set
 
         if exercise_num <= len(program.days[day_id].exercises):
             exercise = program.days[day_id].exercises[exercise_num-1]
@@ -252,110 +634,105 @@ class TelegramBot:
         
         return "No sets available for this exercise."
     
-    def increment_exercise_index(self, chat_id):
+    def increment_exercise_index(self, session: Session):
         """
         Increments the exercise index for the user.
         """
-        self.exercise_num_set[chat_id] = (
-            self.exercise_num_set[chat_id][0] + 1,
-            self.exercise_num_set[chat_id][1]
+        session.exercise_num_set = (
+            session.exercise_num_set[0] + 1,
+            session.exercise_num_set[1]
         )
 
-    def decrement_exercise_index(self, chat_id):
+    def decrement_exercise_index(self, session: Session):
         """
         Decrements the exercise index for the user.
         """
-        if self.exercise_num_set[chat_id][0] > 0:
-            self.exercise_num_set[chat_id] = (
-                self.exercise_num_set[chat_id][0] - 1,
-                self.exercise_num_set[chat_id][1]
+        if session.exercise_num_set[0] > 0:
+            session.exercise_num_set = (
+                session.exercise_num_set[0] - 1,
+                session.exercise_num_set[1]
             )
 
-    def increment_set_index(self, chat_id):
+    def increment_set_index(self, session: Session):
         """
         Increments the set index for the user.
         """
-        self.exercise_num_set[chat_id] = (
-            self.exercise_num_set[chat_id][0],
-            self.exercise_num_set[chat_id][1] + 1
+        session.exercise_num_set = (
+            session.exercise_num_set[0],
+            session.exercise_num_set[1] + 1
         )
     
-    def decrement_set_index(self, chat_id):
+    def decrement_set_index(self, session: Session):
         """
         Decrements the set index for the user.
         """
-        if self.exercise_num_set[chat_id][1] > 0:
-            self.exercise_num_set[chat_id] = (
-                self.exercise_num_set[chat_id][0],
-                self.exercise_num_set[chat_id][1] - 1
+        if session.exercise_num_set[1] > 0:
+            session.exercise_num_set = (
+                session.exercise_num_set[0],
+                session.exercise_num_set[1] - 1
             )
 
-    def get_set_number(self, chat_id) -> int:
+    def get_set_number(self, session: Session) -> int:
         """
         Returns the number of sets for the current exercise.
         """
-        if chat_id not in self.selected_program.keys() or chat_id not in self.selected_day_id.keys():
+        if session.selected_program is None or session.selected_day_id is None:
             return 0
         
-        program = self.selected_program[chat_id]
-        day_id = self.selected_day_id[chat_id]
-        exercise_num, set_num = self.exercise_num_set[chat_id]
+        program = session.selected_program
+        day_id = session.selected_day_id
+        exercise_num, set_num = session.exercise_num_set
 
         if exercise_num <= len(program.days[day_id].exercises):
             return program.days[day_id].exercises[exercise_num-1].get_num_sets()
         
         return 0
     
-    def add_to_updating(self, chat_id, exercise_num = None, set_num = None, what_to_update = None, value_to_update = None, exercise_expression = None):
+    def add_to_updating(self, session: Session, exercise_num = None, set_num = None, what_to_update = None, value_to_update = None, exercise_expression = None):
         """
         Adds the user to the updating dictionary.
         ExerciseUpdate will update only those values that are not None.
         """
-        if chat_id not in self.updating:
-            self.updating[chat_id] = ExerciseUpdate()
+        if session.updating is None:
+            session.updating = ExerciseUpdate()
 
-        self.updating[chat_id] = self.updating[chat_id].set_values(chat_id, exercise_num, set_num, what_to_update, value_to_update, exercise_expression)
+        session.updating = session.updating.set_values(session.chat_id, exercise_num, set_num, what_to_update, value_to_update, exercise_expression)
 
-    def get_exercise_num(self, chat_id) -> int:
+    def get_exercise_num(self, session: Session) -> int:
         """
         Returns the current exercise number for the user.
         """
-        if chat_id not in self.exercise_num_set:
-            return -1
-        return self.exercise_num_set[chat_id][0]
+        return session.exercise_num_set[0]
     
-    def get_all_sets_num(self, chat_id, exercise_num: int) -> int:
+    def get_all_sets_num(self, session: Session, exercise_num: int) -> int:
         """
         Returns the number of sets for the given exercise number.
         """
-        if chat_id not in self.selected_program.keys() or chat_id not in self.selected_day_id.keys():
+        if session.selected_program is None or session.selected_day_id is None:
             return 0
         
-        program = self.selected_program[chat_id]
-        day_id = self.selected_day_id[chat_id]
+        program = session.selected_program
+        day_id = session.selected_day_id
 
         if exercise_num <= len(program.days[day_id].exercises):
             return program.days[day_id].exercises[exercise_num-1].get_num_sets()
         
         return 0
 
-    def update_exercise(self, chat_id) -> bool:
+    async def update_exercise(self, session: Session) -> bool:
         """
         Updates the exercise for the user.
         """
-        if chat_id not in self.updating:
-            return False
-        
-        update = self.updating[chat_id]
-        if update.chat_id is None:
+        update = session.updating
+        if update is None or update.chat_id is None:
             return False
         
         if update.exercise_expression is not None:
-            return self.update_by_expression(chat_id, update.expression)
+            return await self.update_by_expression(session, update.exercise_expression)
 
         if not self.is_set_updating_none(update):
             # Update the exercise in the database
-            return self.update_set(chat_id, update)
+            return await self.update_set(session, update)
         return False
 
     def is_set_updating_none(self, update: ExerciseUpdate) -> bool:
@@ -364,39 +741,83 @@ class TelegramBot:
         """
         return update.set_num is None or update.exercise_num is None or update.what_to_update is None or update.value_to_update is None
 
-    def update_by_expression(self, chat_id, expression: str) -> bool:
+    async def update_by_expression(self, session: Session, expression: str) -> bool:
         """
-        Updates the exercise by parsing an expression with some logic.
+        Updates the sets of the current exercise with an expression such as "w+2.5 s1-4".
+        The expression is compiled into a plan, evaluated on the sets in memory and
+        written with one statement. Raises ValueError if the expression is invalid.
         """
-        # TODO: Implement the logic to update the exercise by the expression
-        return False
+        if session.selected_program is None or session.selected_day_id is None:
+            return False
+        exercise_num = session.exercise_num_set[0]
+        exercise = session.selected_program.days[session.selected_day_id].exercises[exercise_num - 1]
+
+        changes = compile_expression(expression).evaluate(exercise)
+        if session.workout_id is not None:
+            return await self.update_logged_sets(session, exercise_num, changes)
+        return await self.database.update_exercise_sets(
+            user_id=session.user_id,
+            program=session.selected_program,
+            day_id=session.selected_day_id,
+            exercise_num=exercise_num,
+            changes=changes
+        )
     
-    def update_set(self, chat_id, update: ExerciseUpdate) -> bool:
+    async def update_set(self, session: Session, update: ExerciseUpdate) -> bool:
         """
         Updates the set for the user.
         """
-        user_id = self.id_users[chat_id]
-        program_id = self.selected_program[chat_id].id
-        day_id = self.selected_day_id[chat_id]
-        exercise_id = self.exercise_num_set[chat_id][0]
+        user_id = session.user_id
+        program_id = session.selected_program.id
+        day_id = session.selected_day_id
+        exercise_num = session.exercise_num_set[0]
         set_num = update.set_num
         what_to_update = self.get_string_what_to_update(update.what_to_update)
 
-        return self.database.update_set(
+        if session.workout_id is not None:
+            return await self.update_logged_sets(session, exercise_num, {set_num: {what_to_update: update.value_to_update}})
+        return await self.database.update_set(
             user_id=user_id,
             program_id=program_id,
             day_id=day_id,
-            exercise_id=exercise_id,
+            exercise_num=exercise_num,
             set_number=set_num,
             what_to_update=what_to_update,
-            new_value=update.value_to_update
+            new_value=update.value_to_update,
+            program=session.selected_program
         )
     
-    def reset_set_index(self, chat_id):
+    async def update_logged_sets(self, session: Session, exercise_num: int, changes: dict) -> bool:
+        """
+        Updates sets of the current exercise while a workout is open. The sets already
+        performed are changed in the current workout, the others only in memory: they
+        are logged with the new values. The previous workouts are left as they were.
+        """
+        try:
+            if not await self.workout_logger.update_sets(session, exercise_num, changes):
+                return False
+        except ValueError as e:
+            print(e)
+            return False
+
+        program = session.selected_program
+        exercise = program.days[session.selected_day_id].exercises[exercise_num - 1]
+        for set_num, values in changes.items():
+            exercise_set = exercise.get_set(set_num)
+            exercise_set.fill_set(
+                weight=values.get("weight", exercise_set.weight),
+                rest=values.get("rest", exercise_set.rest),
+                reps=values.get("reps", exercise_set.reps)
+            )
+        # The program in memory no longer matches the one in the database
+        self.database.program_cache.invalidate(session.user_id, program.id)
+        return True
+
+    def reset_set_index(self, session: Session):
         """
         Resets the set index for the user.
         """
-        self.exercise_num_set[chat_id] = (self.exercise_num_set[chat_id][0], 1)
+        session.exercise_num_set = (session.exercise_num_set[0], 1)
 
     def get_string_what_to_update(self, what_to_update: int) -> str:
         """
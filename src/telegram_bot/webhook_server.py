@@ -0,0 +1,125 @@
+import asyncio
+import hmac
+import time
+
+from aiohttp import web
+from telegram import Update
+
+
+class WebhookServer:
+    """
+    HTTP server receiving the updates pushed by Telegram, as an alternative to polling.
+
+    Updates are checked against the secret token and handed to the application's
+    update queue. GET <health_path> reports the bot metrics, or 503 while draining.
+    On stop the server refuses new updates (Telegram delivers them again later)
+    and waits for the accepted ones to be processed.
+    """
+    def __init__(self,
+                 bot,
+                 listen: str = "0.0.0.0",
+                 port: int = 8443,
+                 url_path: str = "webhook",
+                 secret_token: str|None = None,
+                 max_connections: int = 40,
+                 drain_timeout: float = 30.0,
+                 health_path: str = "healthz"):
+        self.bot = bot
+        self.listen = listen
+        self.port = int(port)
+        self.url_path = "/" + url_path.strip("/")
+        self.secret_token = secret_token
+        self.max_connections = int(max_connections)
+        self.drain_timeout = float(drain_timeout)
+        self.health_path = "/" + health_path.strip("/")
+
+        self.slots = asyncio.Semaphore(self.max_connections)
+        self.in_flight = 0
+        self.draining = False
+        self.started_at = None
+
+        self.received = 0
+        self.rejected = 0
+
+        self.web_app = web.Application()
+        self.web_app.router.add_post(self.url_path, self.handle_update)
+        self.web_app.router.add_get(self.health_path, self.handle_health)
+        self.runner = None
+
+    async def start(self) -> None:
+        self.runner = web.AppRunner(self.web_app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host=self.listen, port=self.port)
+        await site.start()
+        self.started_at = time.monotonic()
+        print(f"Webhook listening on {self.listen}:{self.port}{self.url_path}")
+
+    async def stop(self) -> None:
+        """
+        Refuses new updates, waits for the accepted ones and closes the server
+        """
+        self.draining = True
+        deadline = time.monotonic() + self.drain_timeout
+        while not self.is_drained() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if not self.is_drained():
+            print(f"Webhook drain timed out with {self.in_flight} request(s) in flight")
+
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def is_drained(self) -> bool:
+        return self.in_flight == 0 and self.bot.get_pending_updates() == 0
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.draining:
+            self.rejected += 1
+            return web.Response(status=503, text="draining")
+
+        if self.secret_token is not None:
+            received_token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not hmac.compare_digest(received_token, self.secret_token):
+                self.rejected += 1
+                return web.Response(status=403)
+
+        try:
+            data = await request.json()
+        except ValueError:
+            self.rejected += 1
+            return web.Response(status=400, text="invalid JSON")
+
+        try:
+            update = Update.de_json(data=data, bot=self.bot.app.bot)
+        except Exception as e:
+            # Any JSON can reach this point, and de_json fails in many ways on what isn't an Update
+            self.rejected += 1
+            print(f"Invalid update received by the webhook: {e}")
+            return web.Response(status=400, text="invalid update")
+
+        self.in_flight += 1
+        try:
+            async with self.slots:
+                await self.bot.app.update_queue.put(update)
+                self.received += 1
+        finally:
+            self.in_flight -= 1
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "status": "draining" if self.draining else "ok",
+                "uptime": time.monotonic() - self.started_at if self.started_at is not None else 0,
+                "webhook": self.get_stats(),
+                "bot": self.bot.get_metrics()
+            },
+            status=503 if self.draining else 200
+        )
+
+    def get_stats(self) -> dict:
+        return {
+            "received": self.received,
+            "rejected": self.rejected,
+            "in_flight": self.in_flight
+        }
@@ -0,0 +1,152 @@
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, TelegramError
+
+from session import Session
+
+
+WORKOUT_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("◀ Exercise", callback_data="/prev_exercise"),
+     InlineKeyboardButton("Exercise ▶", callback_data="/next_exercise")],
+    [InlineKeyboardButton("◀ Set", callback_data="/prev_set"),
+     InlineKeyboardButton("Set done ▶", callback_data="/next_set")],
+    [InlineKeyboardButton("Update exercise", callback_data="/update_exercise"),
+     InlineKeyboardButton("Update set", callback_data="/update_set")]
+])
+
+FINISHED_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Stats", callback_data="/stats"),
+     InlineKeyboardButton("Suggestions", callback_data="/suggestions")],
+    [InlineKeyboardButton("Quit", callback_data="/quit")]
+])
+
+KEYBOARDS = {
+    "workout": WORKOUT_KEYBOARD,
+    "finished": FINISHED_KEYBOARD
+}
+
+
+class WorkoutView:
+    """
+    Class showing the progress of a workout in a single message, edited in place.
+
+    The last text and keyboard sent to a chat are kept on its session: a render
+    identical to them makes no API call at all. If the message cannot be edited
+    anymore (deleted, or too old) a new one is sent and edited from then on.
+    Other errors are counted and reported: the view is shown again with the next update.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+
+        self.sent = 0
+        self.edited = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def reset(self, session: Session) -> None:
+        """
+        Forgets the message of the previous workout, the next show() sends a new one
+        """
+        session.view_message_id = None
+        session.view_text = None
+        session.view_keyboard = None
+
+    async def show(self, session: Session) -> None:
+        await self.__display(session, self.render(session), "workout")
+
+    async def show_finished(self, session: Session) -> None:
+        await self.__display(session, "Workout finished! Congratulations!", "finished")
+
+    def render(self, session: Session) -> str:
+        """
+        Returns the text of the view: the current exercise with its sets, the current one marked
+        """
+        program = session.selected_program
+        day_id = session.selected_day_id
+        if program is None or day_id is None:
+            return "No program or day selected."
+
+        day = program.days[day_id]
+        exercise_num, set_num = session.exercise_num_set
+        if exercise_num < 1 or exercise_num > len(day.exercises):
+            return "No exercise selected."
+        exercise = day.exercises[exercise_num - 1]
+
+        lines = [
+            f"Day {day.day_number}: {day.day_name}",
+            f"Exercise {exercise_num}/{len(day.exercises)}: {exercise.name}",
+            ""
+        ]
+        for i in range(1, exercise.get_num_sets() + 1):
+            marker = "▶" if i == set_num else " "
+            lines.append(f"{marker} Set {i}: {exercise.get_set(i).to_string()}")
+        if exercise.comment:
+            lines.append("")
+            lines.append(exercise.comment)
+        return "\n".join(lines)
+
+    def prerender_next(self, session: Session) -> None:
+        """
+        Renders the next exercise ahead of time, while the user is busy with the current one
+        """
+        program = session.selected_program
+        if program is None or session.selected_day_id is None:
+            return
+        exercises = program.days[session.selected_day_id].exercises
+        exercise_num = session.exercise_num_set[0]
+        if 0 <= exercise_num < len(exercises):
+            exercises[exercise_num].to_string()
+
+    def get_stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "edited": self.edited,
+            "skipped": self.skipped,
+            "failed": self.failed
+        }
+
+    async def __display(self, session: Session, text: str, keyboard: str) -> None:
+        if session.view_message_id is not None:
+            if text == session.view_text and keyboard == session.view_keyboard:
+                self.skipped += 1
+                return
+            try:
+                await self.bot.outbound.call(
+                    session.chat_id,
+                    self.bot.app.bot.edit_message_text,
+                    chat_id=session.chat_id,
+                    message_id=session.view_message_id,
+                    text=text,
+                    reply_markup=KEYBOARDS[keyboard]
+                )
+                self.edited += 1
+                session.view_text = text
+                session.view_keyboard = keyboard
+                return
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    self.skipped += 1
+                    session.view_text = text
+                    session.view_keyboard = keyboard
+                    return
+                print(f"Cannot edit the workout view of chat {session.chat_id}, sending a new one: {e}")
+            except TelegramError as e:
+                self.failed += 1
+                print(f"Error editing the workout view of chat {session.chat_id}: {e}")
+                return
+
+        try:
+            message = await self.bot.outbound.call(
+                session.chat_id,
+                self.bot.app.bot.send_message,
+                chat_id=session.chat_id,
+                text=text,
+                reply_markup=KEYBOARDS[keyboard]
+            )
+        except TelegramError as e:
+            self.failed += 1
+            print(f"Error sending the workout view to chat {session.chat_id}: {e}")
+            return
+        self.sent += 1
+        session.view_message_id = message.message_id
+        session.view_text = text
+        session.view_keyboard = keyboard
@@ -0,0 +1,208 @@
+import asyncio
+import contextlib
+import time
+
+from session import Session
+
+# Fields of a performed set that can be edited, at positions 3 to 5 of a pending set
+EDITABLE_FIELDS = ("weight", "reps", "rest")
+
+
+class _SessionLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class WorkoutLogger:
+    """
+    Class recording the sets performed during the workouts.
+
+    Sets are buffered in their session and written in one batch when the user
+    moves to the next exercise, when the workout ends, every flush_interval
+    seconds and when the bot stops, so that logging a set never waits for the
+    database. Buffered sets are not part of the session snapshots: a crash loses
+    those of the last flush_interval seconds at most.
+
+    The writes of a session are serialized, so a workout is only closed after the
+    sets of a flush still running are in, and an edit finds every performed set
+    either in the buffer or in the database.
+    """
+    def __init__(self, database, flush_interval: float = 30.0):
+        self.database = database
+        self.flush_interval = float(flush_interval)
+
+        self.dirty = {}     # chat_id : Session with pending sets
+        self.tasks = set()  # flushes running in background
+        self.locks = {}     # chat_id : _SessionLock, while the session is being written
+        self.task = None
+
+        self.flushed_sets = 0
+        self.errors = 0
+
+    async def start_workout(self, session: Session, program_day_id: int|None = None) -> bool:
+        """
+        Creates the workout row of the program day the sets will be logged into
+        """
+        workout_id = await self.database.start_workout(user_id=session.user_id, program_day_id=program_day_id)
+        if workout_id is None:
+            return False
+        session.workout_id = workout_id
+        session.workout_start = time.time()
+        session.next_sequence = 1
+        session.pending_sets = []
+        session.logged_sets = {}
+        return True
+
+    def record_set(self, session: Session, exercise_num: int, set_num: int,
+                   exercise_id: int, weight: float, reps: int, rest: int) -> None:
+        """
+        Buffers a performed set of the current workout, set set_num of exercise exercise_num of the day
+        """
+        if session.workout_id is None:
+            return
+        session.pending_sets.append((session.workout_id, exercise_id, session.next_sequence, weight, reps, rest))
+        session.logged_sets[(exercise_num, set_num)] = session.next_sequence
+        session.next_sequence += 1
+        self.dirty[session.chat_id] = session
+
+    async def update_sets(self, session: Session, exercise_num: int, changes: dict) -> bool:
+        """
+        Edits the sets of an exercise performed in the current workout, all of them or none.
+        changes is {set number: {"weight"/"reps"/"rest": value}}, as for Database.update_exercise_sets.
+        Buffered sets are changed in place and written ones in the database; sets not
+        performed yet are left to the caller. Raises ValueError on an unknown field.
+        """
+        async with self.__locked(session):
+            if session.workout_id is None:
+                return False
+
+            # No flush is running: every performed set is either buffered or written
+            buffered = {performed[2]: index for index, performed in enumerate(session.pending_sets)}
+            buffered_edits = []
+            written_edits = []
+            for set_num, values in changes.items():
+                sequence = session.logged_sets.get((exercise_num, set_num))
+                if sequence is None:
+                    continue
+                for field, value in values.items():
+                    if field not in EDITABLE_FIELDS:
+                        raise ValueError(f"Invalid field to update: {field}")
+                    if sequence in buffered:
+                        buffered_edits.append((buffered[sequence], field, value))
+                    else:
+                        written_edits.append((sequence, field, value))
+
+            if len(written_edits) > 0 and not await self.database.update_workout_sets(
+                    user_id=session.user_id, workout_id=session.workout_id, edits=written_edits):
+                return False
+            for index, field, value in buffered_edits:
+                performed = list(session.pending_sets[index])
+                performed[3 + EDITABLE_FIELDS.index(field)] = value
+                session.pending_sets[index] = tuple(performed)
+            return True
+
+    def flush_soon(self, session: Session) -> None:
+        """
+        Writes the pending sets of the session in background
+        """
+        self.__spawn(self.flush_session(session))
+
+    def end_workout_soon(self, session: Session) -> None:
+        """
+        Writes the pending sets and closes the workout in background
+        """
+        self.__spawn(self.end_workout(session))
+
+    async def end_workout(self, session: Session) -> None:
+        async with self.__locked(session):
+            workout_id = session.workout_id
+            if workout_id is None:
+                return
+            duration = int((time.time() - session.workout_start) // 60) if session.workout_start is not None else 0
+
+            await self.__flush(session)
+            session.workout_id = None
+            session.workout_start = None
+            session.logged_sets = {}
+            await self.database.finish_workout(
+                user_id=session.user_id,
+                workout_id=workout_id,
+                duration=duration,
+                program_id=session.get_program_id()
+            )
+
+    async def flush_session(self, session: Session) -> None:
+        async with self.__locked(session):
+            await self.__flush(session)
+
+    async def __flush(self, session: Session) -> None:
+        self.dirty.pop(session.chat_id, None)
+        if len(session.pending_sets) == 0:
+            return
+
+        pending, session.pending_sets = session.pending_sets, []
+        if await self.database.insert_workout_sets(pending):
+            self.flushed_sets += len(pending)
+            return
+
+        # Retry with the next flush, keeping the original order
+        self.errors += 1
+        session.pending_sets = pending + session.pending_sets
+        self.dirty[session.chat_id] = session
+
+    async def flush_all(self) -> None:
+        for session in list(self.dirty.values()):
+            await self.flush_session(session)
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.__run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if len(self.tasks) > 0:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.flush_all()
+        if len(self.dirty) > 0:
+            lost = sum(len(session.pending_sets) for session in self.dirty.values())
+            print(f"Could not write {lost} set(s) of {len(self.dirty)} workout(s) before stopping")
+
+    def get_stats(self) -> dict:
+        return {
+            "sessions_pending": len(self.dirty),
+            "sets_pending": sum(len(session.pending_sets) for session in self.dirty.values()),
+            "flushed_sets": self.flushed_sets,
+            "errors": self.errors
+        }
+
+    @contextlib.asynccontextmanager
+    async def __locked(self, session: Session):
+        entry = self.locks.get(session.chat_id)
+        if entry is None:
+            entry = self.locks[session.chat_id] = _SessionLock()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                del self.locks[session.chat_id]
+
+    def __spawn(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def __run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush_all()
@@ -0,0 +1,16 @@
+import asyncio
+
+from chart_renderer import ChartRenderer, chart_key
+
+SERIES = {"weeks": ["2026-10-12"], "tonnage": [1000.0], "progression": {}}
+
+
+def test_cached_charts_need_no_workers(tmp_path):
+    renderer = ChartRenderer(cache_dir=str(tmp_path))
+    renderer.available = True  # as if matplotlib was installed
+    (tmp_path / f"{chart_key('progress', SERIES)}.png").write_bytes(b"png")
+
+    chart = asyncio.run(renderer.get_chart("progress", SERIES))
+    assert chart.get_photo() == b"png"
+    assert renderer.executor is None and renderer.get_stats()["disk_hits"] == 1
+    renderer.close()
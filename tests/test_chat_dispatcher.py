@@ -0,0 +1,99 @@
+import asyncio
+
+from telegram_bot.chat_dispatcher import ChatDispatcher
+
+
+def test_updates_of_a_chat_run_in_order():
+    handled = []
+
+    async def handle(chat_id, number):
+        # Later updates are quicker: only the queue keeps them in order
+        await asyncio.sleep(0.001 * (5 - number))
+        handled.append((chat_id, number))
+
+    async def main():
+        dispatcher = ChatDispatcher()
+        for number in range(5):
+            for chat_id in (1, 2):
+                assert dispatcher.submit(chat_id, handle, chat_id, number)
+        await dispatcher.stop()
+
+    asyncio.run(main())
+    for chat_id in (1, 2):
+        assert [number for chat, number in handled if chat == chat_id] == list(range(5))
+
+
+def test_chats_run_concurrently_within_the_limit():
+    running = []
+    peak = []
+
+    async def handle(release):
+        running.append(1)
+        peak.append(len(running))
+        await release.wait()
+        running.pop()
+
+    async def main():
+        release = asyncio.Event()
+        dispatcher = ChatDispatcher(max_concurrency=2)
+        for chat_id in range(4):
+            dispatcher.submit(chat_id, handle, release)
+        await asyncio.sleep(0.01)
+        assert dispatcher.get_stats()["in_flight"] == 2
+        assert dispatcher.get_pending() == 4
+        release.set()
+        await dispatcher.stop()
+
+    asyncio.run(main())
+    assert max(peak) == 2
+
+
+def test_full_queues_reject_updates():
+    async def handle():
+        await asyncio.sleep(0)
+
+    async def main():
+        dispatcher = ChatDispatcher(max_queue_depth=2)
+        results = [dispatcher.submit(1, handle) for _ in range(3)]
+        assert dispatcher.submit(2, handle)
+        await dispatcher.stop()
+        return results, dispatcher.get_stats()
+
+    results, stats = asyncio.run(main())
+    assert results == [True, True, False]
+    assert stats["rejected"] == 1 and stats["dispatched"] == 3
+
+
+def test_errors_dont_stop_the_chat():
+    handled = []
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def handle():
+        handled.append(True)
+
+    async def main():
+        dispatcher = ChatDispatcher()
+        dispatcher.submit(1, fail)
+        dispatcher.submit(1, handle)
+        await dispatcher.stop()
+        return dispatcher.get_stats()
+
+    stats = asyncio.run(main())
+    assert handled == [True] and stats["errors"] == 1
+
+
+def test_stop_cancels_what_is_left_after_the_timeout():
+    async def hang():
+        await asyncio.sleep(3600)
+
+    async def main():
+        dispatcher = ChatDispatcher()
+        dispatcher.submit(1, hang)
+        dispatcher.submit(1, hang)
+        await dispatcher.stop(timeout=0.01)
+        return dispatcher.get_stats()
+
+    stats = asyncio.run(main())
+    assert stats["active_chats"] == 0 and stats["queued"] == 0 and stats["in_flight"] == 0
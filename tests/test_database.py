@@ -0,0 +1,87 @@
+import asyncio
+
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("bcrypt")
+
+from database import Database
+from program_classes import DayProgram, Exercise, Program
+
+
+class FakePool:
+    """
+    Answers every transaction with the rows of workout_set given, as returned by UPDATE_SETS
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    async def run(self, operation, *args):
+        self.calls.append(args)
+        if self.rows is None:
+            raise RuntimeError("connection lost")
+        return self.rows
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def database(monkeypatch):
+    monkeypatch.setattr(Database, "connect_to_db", lambda self: None)
+    database = Database(db_host="localhost", db_password="x", db_user="gym", db_name="gym", db_port=5432)
+    yield database
+    database.close()
+
+
+def make_program():
+    exercise = Exercise()
+    exercise.append_set(weight=60, rest=90, reps=8, set_id=5)
+    exercise.append_set(weight=60, rest=90, reps=8, set_id=6)
+    day = DayProgram()
+    day.add_exercise(exercise)
+    program = Program()
+    program.set_id(3)
+    program.add_day(day)
+    return program
+
+
+def update_weight(database, program):
+    return asyncio.run(database.update_set(user_id=1, program_id=3, day_id=0, exercise_num=1, set_number=2,
+                                           what_to_update="weight", new_value=62.5, program=program))
+
+
+def test_updated_set_is_patched_in_the_cached_program(database):
+    program = make_program()
+    database.program_cache.put(1, 3, program)
+    database.pool = FakePool([(6, Decimal("62.50"), 8, 90, 4, None)])
+
+    assert update_weight(database, program)
+    assert database.pool.calls == [(1, [(6, 62.5, None, None)])]
+    assert program.days[0].exercises[0].get_set(2).weight == 62.5
+    assert program.days[0].exercises[0].get_set(1).weight == 60
+    # Nothing to reload: the cached program is the one patched
+    assert database.program_cache.peek(1, 3) is program
+
+
+def test_another_cached_copy_is_invalidated(database):
+    program = make_program()
+    database.program_cache.put(1, 3, make_program())
+    database.pool = FakePool([(6, Decimal("62.50"), 8, 90, 4, None)])
+
+    assert update_weight(database, program)
+    assert program.days[0].exercises[0].get_set(2).weight == 62.5
+    assert database.program_cache.peek(1, 3) is None
+
+
+def test_failed_update_changes_nothing(database):
+    program = make_program()
+    database.program_cache.put(1, 3, program)
+    database.pool = FakePool(None)
+
+    assert not update_weight(database, program)
+    assert program.days[0].exercises[0].get_set(2).weight == 60
+    assert database.program_cache.peek(1, 3) is program
@@ -0,0 +1,51 @@
+import pytest
+
+from migrations import MigrationRunner
+
+
+class FakeCursor:
+    def __init__(self, applied):
+        self.applied = applied  # None when schema_migrations doesn't exist
+        self.result = None
+        self.statements = []
+
+    def execute(self, query, params=None):
+        self.statements.append(query)
+        if "to_regclass" in query:
+            self.result = [(self.applied is not None,)]
+        elif query.startswith("SELECT version FROM schema_migrations"):
+            self.result = [(version,) for version in self.applied]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+
+@pytest.fixture
+def runner(tmp_path):
+    for name in ("0002_second.sql", "0001_first.sql", "0010_tenth.sql", "README.md"):
+        (tmp_path / name).write_text("SELECT 1;")
+    return MigrationRunner(migrations_dir=str(tmp_path))
+
+
+def test_discover_sorts_by_version(runner):
+    assert [migration.to_string() for migration in runner.discover()] == ["0001_first", "0002_second", "0010_tenth"]
+
+
+def test_duplicate_versions_are_rejected(runner, tmp_path):
+    (tmp_path / "0002_again.sql").write_text("SELECT 1;")
+    with pytest.raises(ValueError):
+        runner.discover()
+
+
+def test_pending_migrations(runner):
+    assert [migration.version for migration in runner.pending(FakeCursor(applied=[1, 2]))] == [10]
+    assert runner.pending(FakeCursor(applied=[1, 2, 10])) == []
+
+
+def test_pending_on_a_new_database_changes_nothing(runner):
+    cursor = FakeCursor(applied=None)
+    assert [migration.version for migration in runner.pending(cursor)] == [1, 2, 10]
+    assert not any("CREATE" in statement for statement in cursor.statements)
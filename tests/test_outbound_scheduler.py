@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from telegram_bot import outbound_scheduler
+from telegram_bot.outbound_scheduler import MAX_MESSAGE_LENGTH, OutboundScheduler, TokenBucket
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.sent.append((chat_id, text, reply_markup))
+        return len(self.sent)
+
+
+def make_scheduler():
+    bot = FakeBot()
+    # Fast enough for pacing never to wait in these tests
+    return bot, OutboundScheduler(bot, global_rate=1000, global_burst=1000, chat_rate=1000, chat_burst=1000)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(outbound_scheduler.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_token_bucket_reserves_ahead(clock):
+    bucket = TokenBucket(rate=2, capacity=2)
+    assert [bucket.take() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    assert not bucket.is_full()
+
+    clock[0] += 1.5  # the two reservations are used, one token is back
+    assert bucket.take() == 0.0
+    clock[0] += 1.0
+    assert bucket.is_full()
+    assert bucket.tokens == 2
+
+
+def test_texts_to_a_chat_are_merged():
+    bot, scheduler = make_scheduler()
+    keyboard = ReplyKeyboardMarkup([["/next_set"]])
+
+    async def main():
+        outbox = scheduler.collect()
+        await scheduler.send_message(1, "first")
+        await scheduler.send_message(2, "other chat")
+        await scheduler.send_message(2, "again", markup=keyboard)
+        assert bot.sent == []
+        await scheduler.release(outbox)
+
+    asyncio.run(main())
+    assert bot.sent == [(1, "first", None), (2, "other chat\n\nagain", keyboard)]
+    assert scheduler.get_stats()["merged"] == 1
+
+
+def test_inline_keyboards_and_long_texts_are_not_merged():
+    bot, scheduler = make_scheduler()
+    inline = InlineKeyboardMarkup([[InlineKeyboardButton("Next", callback_data="/next_set")]])
+    long_text = "x" * (MAX_MESSAGE_LENGTH // 2)
+
+    async def main():
+        outbox = scheduler.collect()
+        await scheduler.send_message(1, "workout", markup=inline)
+        await scheduler.send_message(1, long_text)
+        await scheduler.send_message(1, long_text)
+        await scheduler.release(outbox)
+
+    asyncio.run(main())
+    assert [text for _, text, _ in bot.sent] == ["workout", long_text, long_text]
+
+
+def test_calls_send_the_held_texts_first():
+    bot, scheduler = make_scheduler()
+    edits = []
+
+    async def edit_message_text(chat_id, text):
+        edits.append(len(bot.sent))
+
+    async def main():
+        outbox = scheduler.collect()
+        await scheduler.send_message(1, "held")
+        await scheduler.send_message(2, "held elsewhere")
+        await scheduler.call(1, edit_message_text, chat_id=1, text="edited")
+        await scheduler.release(outbox)
+
+    asyncio.run(main())
+    assert edits == [1]
+    assert [chat_id for chat_id, _, _ in bot.sent] == [1, 2]
+
+
+def test_flood_waits_and_network_errors_are_retried(monkeypatch):
+    _, scheduler = make_scheduler()
+    errors = [RetryAfter(0), NetworkError("reset"), NetworkError("reset")]
+
+    async def method():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    async def no_sleep(delay):
+        pass
+
+    monkeypatch.setattr(outbound_scheduler.asyncio, "sleep", no_sleep)
+    assert asyncio.run(scheduler.call(1, method)) == "ok"
+    assert scheduler.get_stats()["flood_waits"] == 1 and scheduler.get_stats()["retries"] == 2
+
+
+def test_bad_requests_reach_the_caller():
+    _, scheduler = make_scheduler()
+
+    async def method():
+        raise BadRequest("Message is not modified")
+
+    with pytest.raises(BadRequest):
+        asyncio.run(scheduler.call(1, method))
+
+
+def test_flood_waits_are_capped(monkeypatch):
+    bot = FakeBot()
+    scheduler = OutboundScheduler(bot, global_rate=1000, global_burst=1000, chat_rate=1000, chat_burst=1000,
+                                  max_flood_wait=10)
+    waits = []
+
+    async def method():
+        raise RetryAfter(4)
+
+    async def sleep(delay):
+        waits.append(delay)
+
+    monkeypatch.setattr(outbound_scheduler.asyncio, "sleep", sleep)
+    with pytest.raises(RetryAfter):
+        asyncio.run(scheduler.call(1, method))
+    assert waits == [4, 4]
@@ -0,0 +1,23 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("bcrypt")
+
+from password_hasher import PasswordHasher
+
+
+def test_workers_start_on_first_use():
+    hasher = PasswordHasher(workers=1, rounds=4)
+    assert hasher.executor is None
+    hasher.close()  # nothing to stop
+
+    hasher = PasswordHasher(workers=1, rounds=4)
+    try:
+        password_hash = asyncio.run(hasher.hash("secret"))
+        assert hasher.executor is not None
+        assert asyncio.run(hasher.check("secret", password_hash))
+        assert not asyncio.run(hasher.check("wrong", password_hash))
+    finally:
+        hasher.close()
+    assert hasher.executor is None
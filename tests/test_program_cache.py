@@ -0,0 +1,110 @@
+import pytest
+
+import program_cache
+
+from program_cache import ProgramCache, estimate_program_size
+from program_classes import DayProgram, Exercise, Program
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(program_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_program(program_id, sets=1):
+    exercise = Exercise()
+    exercise.set_name(f"Exercise {program_id}")
+    for _ in range(sets):
+        exercise.append_set(weight=60, rest=90, reps=8)
+    day = DayProgram()
+    day.add_exercise(exercise)
+    program = Program()
+    program.set_id(program_id)
+    program.add_day(day)
+    return program
+
+
+def test_least_recently_used_programs_are_evicted():
+    cache = ProgramCache(max_entries=2)
+    programs = [make_program(i) for i in range(3)]
+    cache.put(1, 0, programs[0])
+    cache.put(1, 1, programs[1])
+    assert cache.get(1, 0) is programs[0]  # 1 is now the least recently used
+    cache.put(1, 2, programs[2])
+
+    assert cache.get(1, 1) is None
+    assert cache.get(1, 0) is programs[0] and cache.get(1, 2) is programs[2]
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_memory_bound():
+    small, large = make_program(1), make_program(2, sets=500)
+    cache = ProgramCache(max_bytes=estimate_program_size(large))
+    cache.put(1, 1, small)
+    cache.put(1, 2, large)
+
+    assert cache.peek(1, 1) is None and cache.peek(1, 2) is large
+    assert cache.get_stats()["bytes"] == estimate_program_size(large)
+    assert not ProgramCache(max_bytes=10).put(1, 1, small)
+
+
+def test_entries_expire(clock):
+    cache = ProgramCache(ttl=60)
+    program = make_program(1)
+    cache.put(1, 1, program)
+
+    clock[0] += 59
+    assert cache.get(1, 1) is program
+    clock[0] += 2
+    assert cache.get(1, 1) is None
+    assert cache.get_stats()["expirations"] == 1 and cache.get_stats()["bytes"] == 0
+
+
+def test_peek_keeps_recency_and_counters():
+    cache = ProgramCache(max_entries=2)
+    first, second = make_program(1), make_program(2)
+    cache.put(1, 1, first)
+    cache.put(1, 2, second)
+    assert cache.peek(1, 1) is first
+    cache.put(1, 3, make_program(3))
+
+    assert cache.peek(1, 1) is None
+    assert cache.get_stats()["hits"] == 0 and cache.get_stats()["misses"] == 0
+
+
+def test_stale_loads_are_not_stored():
+    cache = ProgramCache()
+    stale = cache.begin_load(1, 1)
+    cache.invalidate(1, 1)  # written while the program was loading
+    fresh = cache.begin_load(1, 1)
+
+    assert not cache.put(1, 1, make_program(1), version=stale)
+    cache.end_load(1, 1)
+    assert cache.peek(1, 1) is None
+    assert cache.put(1, 1, make_program(1), version=fresh)
+    cache.end_load(1, 1)
+
+
+def test_versions_are_dropped_with_the_last_load():
+    cache = ProgramCache()
+    for program_id in range(100):
+        cache.invalidate(1, program_id)
+    assert cache.loads == {}
+
+    cache.begin_load(1, 1)
+    cache.invalidate(1, 1)
+    assert cache.version(1, 1) == 1
+    cache.end_load(1, 1)
+    assert cache.loads == {} and cache.version(1, 1) == 0
+
+
+def test_invalidate_drops_the_entry():
+    cache = ProgramCache()
+    cache.put(1, 1, make_program(1))
+    cache.put(1, 2, make_program(2))
+    cache.invalidate(1, 1)
+
+    assert cache.peek(1, 1) is None and cache.peek(1, 2) is not None
+    assert cache.get_stats()["invalidations"] == 1
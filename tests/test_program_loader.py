@@ -0,0 +1,118 @@
+import asyncio
+import os
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+pytest.importorskip("bcrypt")
+
+from database import Database
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "db_schema", "schema_db.sql")
+
+# A disposable database: its public schema is dropped and created again by the tests
+TEST_DATABASE = {
+    "db_host": os.getenv("TEST_DB_HOST"),
+    "db_name": os.getenv("TEST_DB_NAME"),
+    "db_user": os.getenv("TEST_DB_USER"),
+    "db_password": os.getenv("TEST_DB_PASSWORD"),
+    "db_port": os.getenv("TEST_DB_PORT")
+}
+
+pytestmark = pytest.mark.skipif(TEST_DATABASE["db_name"] is None, reason="TEST_DB_NAME is not set")
+
+
+@pytest.fixture
+def database():
+    conn = psycopg2.connect(host=TEST_DATABASE["db_host"], port=TEST_DATABASE["db_port"],
+                            user=TEST_DATABASE["db_user"], password=TEST_DATABASE["db_password"],
+                            dbname=TEST_DATABASE["db_name"])
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+            with open(SCHEMA_FILE, encoding="utf-8") as f:
+                cursor.execute(f.read())
+        conn.commit()
+    finally:
+        conn.close()
+
+    database = Database(**TEST_DATABASE, pool_max_size=2, hash_workers=1)
+    asyncio.run(database.apply_migrations())
+    yield database
+    database.close()
+
+
+def fetchone(database, query, params=None):
+    return asyncio.run(database.pool.fetchone(query, params))
+
+
+def log_workout(database, user_id, program_day_id, day, sets):
+    """
+    Logs a workout of the given day of October 2026, sets being (exercise_id, weight, reps)
+    """
+    async def log():
+        workout_id = await database.start_workout(user_id=user_id, program_day_id=program_day_id)
+        await database.pool.execute("UPDATE workout SET workout_time = %s WHERE id = %s;",
+                                    (f"2026-10-{day:02d} 18:00", workout_id))
+        assert await database.insert_workout_sets([
+            (workout_id, exercise_id, sequence, weight, reps, 90)
+            for sequence, (exercise_id, weight, reps) in enumerate(sets, start=1)
+        ])
+    asyncio.run(log())
+
+
+def test_partial_workout_keeps_the_rest_of_the_day(database):
+    user_id = fetchone(database, "INSERT INTO gym_user (username, password) VALUES ('ana', 'x') RETURNING id;")[0]
+    squat, bench, row = (fetchone(database, "INSERT INTO exercise (name) VALUES (%s) RETURNING id;", (name,))[0]
+                         for name in ("Squat", "Bench", "Row"))
+    program_id = fetchone(database, "INSERT INTO program (owner_id, name) VALUES (%s, 'Split') RETURNING id;",
+                          (user_id,))[0]
+    legs, push = (fetchone(database, """
+                           INSERT INTO program_day (program_id, day_number, name) VALUES (%s, %s, %s) RETURNING id;
+                           """, (program_id, number, name))[0]
+                  for number, name in ((1, "Legs"), (2, "Push")))
+    for day_id, exercise_id in ((legs, squat), (legs, row), (push, bench), (push, row)):
+        fetchone(database, "INSERT INTO program_day_exercise (program_day_id, exercise_id) VALUES (%s, %s) RETURNING id;",
+                 (day_id, exercise_id))
+
+    log_workout(database, user_id, legs, 1, [(squat, 100, 5), (squat, 100, 5), (squat, 100, 5),
+                                             (row, 60, 10), (row, 60, 10)])
+    # Another day sharing an exercise
+    log_workout(database, user_id, push, 2, [(bench, 80, 8), (row, 50, 12)])
+    # Left after the first set of squats
+    log_workout(database, user_id, legs, 3, [(squat, 102.5, 5)])
+
+    program = asyncio.run(database.get_selected_program(user_id, program_id))
+
+    legs_day, push_day = program.days
+    assert [exercise.id for exercise in legs_day.exercises] == [squat, row]
+    squats, rows = legs_day.exercises
+    assert [exercise_set.weight for exercise_set in squats.sets] == [102.5, 100, 100]
+    assert [exercise_set.weight for exercise_set in rows.sets] == [60, 60]
+    assert [exercise.id for exercise in push_day.exercises] == [bench, row]
+    assert [exercise_set.weight for exercise_set in push_day.exercises[1].sets] == [50]
+
+
+def test_edits_during_a_workout_leave_the_previous_one(database):
+    user_id = fetchone(database, "INSERT INTO gym_user (username, password) VALUES ('ana', 'x') RETURNING id;")[0]
+    squat = fetchone(database, "INSERT INTO exercise (name) VALUES ('Squat') RETURNING id;")[0]
+    log_workout(database, user_id, None, 1, [(squat, 100, 5), (squat, 100, 5)])
+
+    async def edit():
+        workout_id = await database.start_workout(user_id=user_id, program_day_id=None)
+        assert await database.insert_workout_sets([(workout_id, squat, 1, 100, 5, 90), (workout_id, squat, 2, 100, 5, 90)])
+        assert await database.update_workout_sets(user_id=user_id, workout_id=workout_id,
+                                                  edits=[(2, "weight", 97.5), (2, "reps", 6)])
+        # A set not written yet: nothing is changed
+        assert not await database.update_workout_sets(user_id=user_id, workout_id=workout_id, edits=[(3, "reps", 1)])
+        return await database.pool.fetchall("""
+                                            SELECT w.id = %s, ws.sequence_number, ws.weight, ws.reps
+                                            FROM workout_set ws JOIN workout w ON w.id = ws.workout_id
+                                            ORDER BY w.id, ws.sequence_number;
+                                            """, (workout_id,))
+
+    rows = asyncio.run(edit())
+    assert [(current, sequence, float(weight), reps) for current, sequence, weight, reps in rows] == [
+        (False, 1, 100, 5), (False, 2, 100, 5), (True, 1, 100, 5), (True, 2, 97.5, 6)
+    ]
+    assert fetchone(database, "SELECT max_weight FROM exercise_rollup WHERE period = 'week';")[0] == 100
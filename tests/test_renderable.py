@@ -0,0 +1,70 @@
+from program_classes import DayProgram, Exercise, Program
+
+
+def make_program():
+    exercise = Exercise()
+    exercise.set_name("Bench press")
+    exercise.append_set(weight=60, rest=90, reps=8)
+    day = DayProgram()
+    day.set_day_number(1)
+    day.set_day_name("Push")
+    day.add_exercise(exercise)
+    program = Program()
+    program.set_program_name("PPL")
+    program.add_day(day)
+    return program, day, exercise
+
+
+def test_text_is_cached_until_a_change():
+    program, _, _ = make_program()
+    text = program.to_string()
+    assert program.rendered is text
+    assert program.to_string() is text
+
+
+def test_changes_invalidate_the_parents():
+    program, day, exercise = make_program()
+    program.to_string()
+    assert exercise.rendered is not None and day.rendered is not None
+
+    exercise.get_set(1).update_weight(62.5)
+    assert exercise.rendered is None and day.rendered is None and program.rendered is None
+    assert "62.5" in program.to_string()
+
+
+def test_siblings_stay_rendered():
+    program, day, exercise = make_program()
+    other_day = DayProgram()
+    other_day.set_day_name("Pull")
+    program.add_day(other_day)
+    program.to_string()
+
+    exercise.append_set(weight=70, rest=120, reps=5)
+    assert other_day.rendered is not None
+    assert day.rendered is None and program.rendered is None
+
+
+def test_invalidation_stops_at_a_dirty_object():
+    program, day, exercise = make_program()
+    program.to_string()
+    day.set_day_name("Chest")
+    assert program.rendered is None
+
+    # The day is already dirty: the walk ends there, its parents are dirty too
+    program.rendered = "stale"
+    exercise.set_name("Incline press")
+    assert program.rendered == "stale"
+
+
+def test_adopted_and_replaced_children_invalidate_the_parent():
+    program, day, _ = make_program()
+    program.to_string()
+    day.add_exercise(Exercise())
+    assert program.rendered is None
+
+    program.to_string()
+    replacement = Exercise()
+    replacement.set_name("Dips")
+    day.set_exercises([replacement])
+    assert program.rendered is None and replacement.parent is day
+    assert "Dips" in program.to_string() and "Bench press" not in program.to_string()
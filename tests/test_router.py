@@ -0,0 +1,139 @@
+import pytest
+
+from state_machine import State, StateMachine, SubStateUpdateExercise, SubStateUpdateSet
+from telegram_bot.router import first_token
+
+
+@pytest.mark.parametrize("text, token", [
+    (None, ""),
+    ("", ""),
+    ("/start", "/start"),
+    ("/start@gym_bot", "/start"),
+    ("/start@gym_bot now", "/start"),
+    ("  /next_set\nplease", "/next_set"),
+    ("/next_set\tnow", "/next_set"),
+    ("w+2.5 s1", "w+2.5"),
+    ("user@example.com", "user@example.com"),  # only commands lose the @suffix
+    ("12", "12"),
+])
+def test_first_token(text, token):
+    assert first_token(text) == token
+
+
+@pytest.fixture
+def handlers():
+    # The handlers import python-telegram-bot for their context type
+    pytest.importorskip("telegram")
+    from types import SimpleNamespace
+    from telegram_bot.state_handlers.state_graph import StateGraph
+    from telegram_bot.state_handlers.dead_state import DeadStateHandler
+    from telegram_bot.state_handlers.login_state import LoginStateHandler
+    from telegram_bot.state_handlers.authenticated_state import AuthenticatedStateHandler
+    from telegram_bot.state_handlers.type_program_state import TypeProgramStateHandler
+    from telegram_bot.state_handlers.type_day_state import TypeDayStateHandler
+    from telegram_bot.state_handlers.ready_state import ReadyStateHandler
+    from telegram_bot.state_handlers.started_state import StartedStateHandler
+    from telegram_bot.state_handlers.end_state import EndStateHandler
+
+    bot = SimpleNamespace(state_graph=StateGraph())
+    return {
+        State.DEAD: DeadStateHandler(bot),
+        State.LOGIN: LoginStateHandler(bot),
+        State.AUTHENTICATED: AuthenticatedStateHandler(bot),
+        State.TYPE_PROGRAM: TypeProgramStateHandler(bot),
+        State.TYPE_DAY: TypeDayStateHandler(bot),
+        State.READY: ReadyStateHandler(bot),
+        State.STARTED: StartedStateHandler(bot),
+        State.END: EndStateHandler(bot)
+    }
+
+
+def test_commands_resolve_to_their_callback(handlers):
+    from telegram_bot.router import Router
+    router = Router(handlers)
+    state_machine = StateMachine()
+
+    assert router.resolve(state_machine, "/start@gym_bot") == handlers[State.DEAD].start
+    assert router.resolve(state_machine, "/unknown") == handlers[State.DEAD].default_handler
+    assert router.resolve(state_machine, None) == handlers[State.DEAD].default_handler
+
+
+def test_substates_take_every_message(handlers):
+    from telegram_bot.router import Router
+    router = Router(handlers)
+    started = handlers[State.STARTED]
+    state_machine = StateMachine()
+    state_machine.state = State.STARTED
+
+    assert router.resolve(state_machine, "/next_set") == started.next_set
+
+    state_machine.set_substate_update_set(SubStateUpdateSet.TYPE_SET)
+    assert router.resolve(state_machine, "/next_set") == started.update_set_callbacks[SubStateUpdateSet.TYPE_SET]
+
+    state_machine.set_substate_update_set(SubStateUpdateSet.NONE)
+    state_machine.set_substate_update_exercise(SubStateUpdateExercise.TYPE_EXPRESSION)
+    assert router.resolve(state_machine, "w+2.5") == started.update_exercise_callbacks[SubStateUpdateExercise.TYPE_EXPRESSION]
+
+
+def test_missing_handler_is_rejected(handlers):
+    from telegram_bot.router import Router
+    del handlers[State.READY]
+    with pytest.raises(ValueError, match="READY: no handler"):
+        Router(handlers)
+
+
+def test_callbacks_must_be_coroutines(handlers):
+    from telegram_bot.router import Router
+    handlers[State.DEAD].callbacks["/sync"] = lambda ctx: None
+    with pytest.raises(ValueError, match="/sync is not handled by a coroutine"):
+        Router(handlers)
+
+
+def test_commands_must_be_single_slash_tokens(handlers):
+    from telegram_bot.router import Router
+    dead = handlers[State.DEAD]
+    dead.callbacks["start over"] = dead.start
+    with pytest.raises(ValueError, match="invalid command 'start over'"):
+        Router(handlers)
+
+
+def test_substates_need_a_route(handlers):
+    from telegram_bot.router import Router
+    started = handlers[State.STARTED]
+    started.substates = started.substates + ("bogus",)
+    with pytest.raises(ValueError, match="no route for substate bogus"):
+        Router(handlers)
+
+
+def test_successions_must_reach_every_state(handlers, monkeypatch):
+    from telegram_bot.router import Router
+    from telegram_bot.state_handlers import state_graph
+    successions = dict(state_graph.STATE_SUCCESSIONS, type_day="started")
+    monkeypatch.setattr("telegram_bot.router.STATE_SUCCESSIONS", successions)
+    with pytest.raises(ValueError, match="ready: unreachable state"):
+        Router(handlers)
+
+
+def test_failed_workout_start_keeps_the_state():
+    pytest.importorskip("telegram")
+    import asyncio
+    from types import SimpleNamespace
+    from session import Session
+    from telegram_bot.state_handlers.state_graph import StateGraph
+    from telegram_bot.state_handlers.ready_state import ReadyStateHandler
+
+    async def set_user_workout_started(session):
+        return False
+
+    async def send_message(chat_id, text):
+        sent.append(text)
+
+    sent = []
+    bot = SimpleNamespace(state_graph=StateGraph(), set_user_workout_started=set_user_workout_started,
+                          send_message=send_message)
+    session = Session(1)
+    session.state_machine.state = State.READY
+    asyncio.run(ReadyStateHandler(bot).start_workout(SimpleNamespace(session=session, chat_id=1)))
+
+    assert session.state_machine.get_state() == State.READY
+    assert sent == ["Error starting workout. Please try again later."]
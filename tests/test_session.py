@@ -0,0 +1,101 @@
+from program_classes import ExerciseUpdate, Program
+from session import Session, SessionStore, SNAPSHOT_VERSION
+from state_machine import State, SubStateLogin, SubStateUpdateExercise, SubStateUpdateSet
+
+
+def make_session(chat_id=42):
+    session = Session(chat_id)
+    session.state_machine.state = State.STARTED
+    session.state_machine.substate_login = SubStateLogin.PASSWORD
+    session.state_machine.substate_update_set = SubStateUpdateSet.TYPE_NEW_VALUE
+    session.state_machine.substate_update_exercise = SubStateUpdateExercise.TYPE_EXPRESSION
+    session.registered = True
+    session.resting = True
+    session.username = "ada"
+    session.first_name = "Ada 🏋️"
+    session.user_id = 7
+    session.login_username = ""
+    session.login_retries = 2
+    session.selected_day_id = 1
+    session.exercise_num_set = (3, 2)
+    session.updating = ExerciseUpdate().set_values(chat_id, 3, 2, 1, 12)
+    session.workout_id = 99
+    session.workout_start = 1700000000.5
+    session.next_sequence = 5
+    session.logged_sets = {(1, 1): 1, (1, 2): 2, (3, 1): 4}
+
+    program = Program()
+    program.set_id(11)
+    session.selected_program = program
+    return session
+
+
+def test_snapshot_round_trip():
+    session = make_session()
+    restored, program_id = Session.restore(42, session.snapshot())
+
+    assert program_id == 11
+    assert restored.selected_program is None  # loaded again by the bot
+    for name in ("registered", "resting", "username", "first_name", "user_id", "login_username",
+                 "login_retries", "selected_day_id", "exercise_num_set", "workout_id",
+                 "workout_start", "next_sequence", "logged_sets"):
+        assert getattr(restored, name) == getattr(session, name), name
+    for name in ("state", "substate_login", "substate_update_set", "substate_update_exercise"):
+        assert getattr(restored.state_machine, name) == getattr(session.state_machine, name), name
+    for name in ("exercise_num", "set_num", "what_to_update", "value_to_update"):
+        assert getattr(restored.updating, name) == getattr(session.updating, name), name
+
+
+def test_snapshot_of_a_new_session():
+    restored, program_id = Session.restore(1, Session(1).snapshot())
+
+    assert program_id is None
+    assert restored.state_machine.state == State.DEAD
+    assert restored.username is None and restored.user_id is None and restored.workout_start is None
+    assert restored.updating is None
+
+
+def test_incompatible_snapshots_are_dropped():
+    data = make_session().snapshot()
+    assert Session.restore(42, bytes([SNAPSHOT_VERSION + 1]) + data[1:]) == (None, None)
+    assert Session.restore(42, data[:10]) == (None, None)
+
+
+def test_long_strings_are_truncated():
+    session = Session(1)
+    session.username = "x" * 70000
+    restored, _ = Session.restore(1, session.snapshot())
+    assert restored.username == "x" * 0xFFFE
+
+
+def test_evicted_sessions_are_kept_dormant():
+    store = SessionStore(max_sessions=2)
+    sessions = [Session(chat_id) for chat_id in range(3)]
+    for session in sessions:
+        session.username = f"user {session.chat_id}"
+        store.add(session)
+
+    assert list(store.sessions) == [1, 2]
+    snapshot = store.take_dormant(0)
+    assert Session.restore(0, snapshot)[0].username == "user 0"
+    assert store.take_dormant(0) is None
+
+
+def test_pinned_sessions_are_not_evicted():
+    store = SessionStore(max_sessions=1)
+    first, second = Session(1), Session(2)
+    store.add(first)
+    store.pin(first)
+    store.add(second)
+    assert list(store.sessions) == [1]
+
+    store.unpin(first)
+    store.add(second)
+    assert list(store.sessions) == [2]
+
+
+def test_idle_sessions_expire():
+    store = SessionStore(idle_ttl=0.0)
+    store.add(Session(1))
+    assert store.get(1) is None
+    assert store.take_dormant(1) is not None
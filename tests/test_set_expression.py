@@ -0,0 +1,90 @@
+import pytest
+
+from program_classes import Exercise, MAX_SHORT, MAX_WEIGHT
+from set_expression import compile_expression
+
+
+def make_exercise(*sets):
+    exercise = Exercise()
+    exercise.set_name("Squat")
+    for weight, reps, rest in sets:
+        exercise.append_set(weight=weight, rest=rest, reps=reps)
+    return exercise
+
+
+@pytest.mark.parametrize("expression, field, op, value, sets", [
+    ("w+2.5", "weight", "+", 2.5, None),
+    ("weight-5 all", "weight", "-", 5.0, None),
+    ("r=8 s2", "reps", "=", 8.0, (2,)),
+    ("reps*2 s1-3", "reps", "*", 2.0, (1, 2, 3)),
+    ("rest*0.9 s3,1", "rest", "*", 0.9, (1, 3)),
+    ("rest=.5 s1-2,2-3", "rest", "=", 0.5, (1, 2, 3)),
+])
+def test_accepted_clauses(expression, field, op, value, sets):
+    assignment, = compile_expression(expression).assignments
+    assert (assignment.field, assignment.op, assignment.value, assignment.sets) == (field, op, value, sets)
+
+
+def test_case_and_spaces_are_ignored():
+    assignment, = compile_expression("  W + 2.5   S1 - 2 , 4 ").assignments
+    assert (assignment.field, assignment.op, assignment.value, assignment.sets) == ("weight", "+", 2.5, (1, 2, 4))
+
+
+def test_several_clauses_in_order():
+    plan = compile_expression("w+5; ; reps=8 s1")
+    assert [(a.field, a.op) for a in plan.assignments] == [("weight", "+"), ("reps", "=")]
+
+
+@pytest.mark.parametrize("expression", [
+    "", " ; ", "w", "w+", "+2", "x+2", "weights+2", "w/2", "w+-2", "w+2 s", "w+2 s0",
+    "w+2 s3-1", "w+2 s1-", "w+2 s1-1001", "w+2 sets", "w+2 all s1",
+])
+def test_rejected_expressions(expression):
+    with pytest.raises(ValueError):
+        compile_expression(expression)
+
+
+def test_plans_are_cached():
+    assert compile_expression("w+2.5 s1") is compile_expression("w+2.5 s1")
+
+
+def test_evaluate_leaves_the_exercise_unchanged():
+    exercise = make_exercise((60, 8, 90), (62.5, 6, 120))
+    changes = compile_expression("w+2.5; rest*0.5 s2").evaluate(exercise)
+    assert changes == {1: {"weight": 62.5}, 2: {"weight": 65.0, "rest": 60}}
+    assert exercise.get_set(1).weight == 60
+
+
+def test_later_clauses_see_earlier_results():
+    exercise = make_exercise((100, 5, 60))
+    assert compile_expression("w+10; w*0.5").evaluate(exercise) == {1: {"weight": 55.0}}
+
+
+def test_weights_are_rounded_to_the_column_decimals():
+    exercise = make_exercise((62.5, 8, 90))
+    assert compile_expression("w*1.03").evaluate(exercise) == {1: {"weight": 64.38}}
+
+
+def test_reps_and_rest_are_whole_numbers():
+    exercise = make_exercise((60, 7, 90))
+    assert compile_expression("r*1.5; rest*1.01").evaluate(exercise) == {1: {"reps": 10, "rest": 91}}
+
+
+@pytest.mark.parametrize("expression", [
+    "w-100",                      # negative
+    "r-9",
+    f"w+{MAX_WEIGHT}",            # beyond workout_set.weight
+    f"rest={MAX_SHORT + 1}",      # beyond the uint16 arrays
+    "r=1 s3",                     # the exercise has two sets
+])
+def test_out_of_range_results(expression):
+    exercise = make_exercise((60, 8, 90), (60, 8, 90))
+    with pytest.raises(ValueError):
+        compile_expression(expression).evaluate(exercise)
+
+
+def test_missing_values_can_only_be_assigned():
+    exercise = make_exercise((None, None, None))
+    assert compile_expression("w=40").evaluate(exercise) == {1: {"weight": 40.0}}
+    with pytest.raises(ValueError):
+        compile_expression("w+5").evaluate(exercise)
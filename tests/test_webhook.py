@@ -0,0 +1,90 @@
+import asyncio
+import socket
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("telegram")
+
+import aiohttp
+
+from aiohttp import web
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+
+from telegram_bot.fake_bot_api import FakeBotApi
+from telegram_bot.webhook_server import WebhookServer
+
+SECRET_TOKEN = "s3cret"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def echo(update, context):
+    await update.message.reply_text("echo: " + update.message.text)
+
+
+async def wait_for_calls(client, api_url, method, count, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        async with client.get(f"{api_url}/fake/calls") as response:
+            calls = [call for call in await response.json() if call["method"] == method]
+        if len(calls) >= count or asyncio.get_running_loop().time() > deadline:
+            return calls
+        await asyncio.sleep(0.05)
+
+
+def test_webhook_round_trip():
+    async def main():
+        api_port, webhook_port = free_port(), free_port()
+        api_url = f"http://127.0.0.1:{api_port}"
+        webhook_url = f"http://127.0.0.1:{webhook_port}/webhook"
+
+        api_runner = web.AppRunner(FakeBotApi().web_app)
+        await api_runner.setup()
+        await web.TCPSite(api_runner, host="127.0.0.1", port=api_port).start()
+
+        # The bot side: a real application, handling the updates the server puts in its queue
+        app = ApplicationBuilder().token("123:test").base_url(f"{api_url}/bot").updater(None).build()
+        app.add_handler(MessageHandler(filters.TEXT, echo))
+        bot = SimpleNamespace(app=app, get_pending_updates=app.update_queue.qsize, get_metrics=dict)
+        server = WebhookServer(bot=bot, listen="127.0.0.1", port=webhook_port, secret_token=SECRET_TOKEN)
+
+        await app.initialize()
+        await app.start()
+        await server.start()
+        try:
+            await app.bot.set_webhook(url=webhook_url, secret_token=SECRET_TOKEN)
+            async with aiohttp.ClientSession() as client:
+                async with client.post(f"{api_url}/fake/message", json={"chat_id": 5, "text": "/start"}) as response:
+                    assert (await response.json())["webhook_status"] == 200
+
+                sent = await wait_for_calls(client, api_url, "sendMessage", 1)
+                assert len(sent) == 1
+                assert int(sent[0]["params"]["chat_id"]) == 5
+                assert sent[0]["params"]["text"] == "echo: /start"
+
+                # Updates without the secret token are refused
+                async with client.post(webhook_url, json={"update_id": 99}) as response:
+                    assert response.status == 403
+                # JSON that isn't an Update is refused too
+                headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET_TOKEN}
+                for payload in ({"update_id": 100, "message": {"text": "no date"}}, [1, 2]):
+                    async with client.post(webhook_url, json=payload, headers=headers) as response:
+                        assert response.status == 400
+                async with client.get(f"http://127.0.0.1:{webhook_port}/healthz") as response:
+                    health = await response.json()
+                    assert health["status"] == "ok"
+                    assert health["webhook"]["received"] == 1 and health["webhook"]["rejected"] == 3
+        finally:
+            await server.stop()
+            await app.stop()
+            await app.shutdown()
+            await api_runner.cleanup()
+
+    asyncio.run(main())
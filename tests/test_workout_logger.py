@@ -0,0 +1,104 @@
+import asyncio
+
+from session import Session
+from workout_logger import WorkoutLogger
+
+
+class FakeDatabase:
+    def __init__(self, insert_delay=0.0, failures=0):
+        self.insert_delay = insert_delay
+        self.failures = failures
+        self.events = []
+
+    async def start_workout(self, user_id, program_day_id):
+        return 10
+
+    async def insert_workout_sets(self, sets):
+        await asyncio.sleep(self.insert_delay)
+        if self.failures > 0:
+            self.failures -= 1
+            return False
+        self.events.append(("insert", [sequence for _, _, sequence, _, _, _ in sets]))
+        return True
+
+    async def update_workout_sets(self, user_id, workout_id, edits):
+        self.events.append(("update", workout_id, edits))
+        return True
+
+    async def finish_workout(self, user_id, workout_id, duration, program_id):
+        self.events.append(("finish", workout_id))
+
+
+def test_end_waits_for_the_running_flush():
+    database = FakeDatabase(insert_delay=0.02)
+    logger = WorkoutLogger(database)
+
+    async def main():
+        session = Session(1)
+        await logger.start_workout(session)
+        logger.record_set(session, 1, 1, exercise_id=3, weight=60, reps=8, rest=90)
+        logger.flush_soon(session)
+        await asyncio.sleep(0)  # the flush took the set and waits for the database
+        logger.end_workout_soon(session)
+        await logger.stop()
+        return session
+
+    session = asyncio.run(main())
+    assert database.events == [("insert", [1]), ("finish", 10)]
+    assert session.workout_id is None and logger.locks == {}
+
+
+def test_failed_flushes_are_retried_in_order():
+    database = FakeDatabase(failures=1)
+    logger = WorkoutLogger(database)
+
+    async def main():
+        session = Session(1)
+        await logger.start_workout(session)
+        logger.record_set(session, 1, 1, exercise_id=3, weight=60, reps=8, rest=90)
+        await logger.flush_session(session)
+        logger.record_set(session, 1, 2, exercise_id=3, weight=60, reps=7, rest=90)
+        await logger.end_workout(session)
+
+    asyncio.run(main())
+    assert database.events == [("insert", [1, 2]), ("finish", 10)]
+    assert logger.get_stats()["errors"] == 1
+
+
+def test_stop_writes_what_is_pending():
+    database = FakeDatabase()
+    logger = WorkoutLogger(database, flush_interval=3600)
+
+    async def main():
+        logger.start()
+        session = Session(1)
+        await logger.start_workout(session)
+        logger.record_set(session, 1, 1, exercise_id=3, weight=60, reps=8, rest=90)
+        await logger.stop()
+
+    asyncio.run(main())
+    assert database.events == [("insert", [1])]
+
+
+def test_edits_change_the_sets_of_the_current_workout():
+    database = FakeDatabase()
+    logger = WorkoutLogger(database)
+
+    async def main():
+        session = Session(1)
+        await logger.start_workout(session)
+        logger.record_set(session, 1, 1, exercise_id=3, weight=60, reps=8, rest=90)
+        await logger.flush_session(session)
+        logger.record_set(session, 1, 2, exercise_id=3, weight=60, reps=8, rest=90)
+        assert await logger.update_sets(session, 1, {1: {"weight": 62.5}, 2: {"reps": 6}, 3: {"reps": 5}})
+        return session
+
+    session = asyncio.run(main())
+    # Set 1 is written, set 2 buffered and set 3 not performed yet
+    assert database.events == [("insert", [1]), ("update", 10, [(1, "weight", 62.5)])]
+    assert session.pending_sets == [(10, 3, 2, 60, 6, 90)]
+
+
+def test_edits_without_a_workout_are_refused():
+    logger = WorkoutLogger(FakeDatabase())
+    assert not asyncio.run(logger.update_sets(Session(1), 1, {1: {"reps": 6}}))
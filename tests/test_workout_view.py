@@ -0,0 +1,47 @@
+import asyncio
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from telegram.error import Forbidden, NetworkError
+
+from session import Session
+from telegram_bot.workout_view import WorkoutView
+
+
+class FakeOutbound:
+    def __init__(self, error):
+        self.error = error
+
+    async def call(self, chat_id, method, /, **kwargs):
+        raise self.error
+
+
+def make_view(error):
+    api = SimpleNamespace(send_message=None, edit_message_text=None)
+    return WorkoutView(SimpleNamespace(outbound=FakeOutbound(error), app=SimpleNamespace(bot=api)))
+
+
+def test_failed_sends_are_counted():
+    view = make_view(Forbidden("bot was blocked by the user"))
+    session = Session(1)
+
+    asyncio.run(view.show_finished(session))
+    assert view.get_stats()["failed"] == 1
+    assert session.view_message_id is None and session.view_text is None
+
+
+def test_failed_edits_keep_the_message():
+    view = make_view(NetworkError("timed out"))
+    session = Session(1)
+    session.view_message_id = 5
+    session.view_text = "before"
+    session.view_keyboard = "workout"
+
+    asyncio.run(view.show_finished(session))
+    assert view.get_stats()["failed"] == 1 and view.get_stats()["sent"] == 0
+    # Shown again with the next update
+    assert session.view_message_id == 5 and session.view_text == "before"